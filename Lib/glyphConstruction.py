@@ -2,13 +2,34 @@ from __future__ import division
 import weakref
 import re
 import os
-from math import cos, sin, radians
+from math import cos, sin, radians, nan
 import operator
+import functools
+import threading
+import pickle
+from array import array
+from time import perf_counter
+from types import MappingProxyType
+try:
+    from collections.abc import Set
+except ImportError:
+    from collections import Set
+try:
+    from contextvars import ContextVar, copy_context
+except ImportError:
+    # < py3.7
+    ContextVar = None
+    copy_context = None
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # < py3.8
+    shared_memory = None
 
 from fontTools.misc.transform import Transform
 from fontTools.pens.boundsPen import BoundsPen
 from fontTools.pens.transformPen import TransformPen
-from fontTools.pens.recordingPen import RecordingPen
+from fontTools.pens.recordingPen import RecordingPen, DecomposingRecordingPen
 
 try:
     # >= RF3.2
@@ -140,6 +161,483 @@ class GlyphBuilderError(Exception):
     pass
 
 
+# instrumentation
+
+
+class _ThreadLocalVar(threading.local):
+
+    """
+    A minimal ContextVar replacement for Python versions without contextvars.
+    """
+
+    def __init__(self, name, default=None):
+        self.value = default
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        token = self.value
+        self.value = value
+        return token
+
+    def reset(self, token):
+        self.value = token
+
+
+if ContextVar is None:
+    ContextVar = _ThreadLocalVar
+
+_currentInstrumentation = ContextVar("glyphConstructionInstrumentation", default=None)
+_currentRule = ContextVar("glyphConstructionRule", default=None)
+
+
+class StageStatistics(object):
+
+    """
+    The call count and the total wall time in seconds of a stage.
+    """
+
+    __slots__ = ("count", "time")
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __repr__(self):
+        return "<StageStatistics count=%s time=%.6f>" % (self.count, self.time)
+
+    def asDict(self):
+        return dict(count=self.count, time=self.time)
+
+
+class ConstructionInstrumentation(object):
+
+    """
+    Record wall time and call counts of the stages of building glyph constructions.
+
+    Use the instrumentation as a context manager, all constructions parsed and built inside the context
+    are recorded. Contexts are per thread, a thread started inside the context is not recorded
+    unless it runs in a copy of the context. Without an active instrumentation
+    every instrumented call only costs a single context variable lookup.
+
+    * `stages`: a dictionary of stage names and `StageStatistics`
+    * `rules`: a dictionary of constructions and a dictionary of stage names and `StageStatistics`
+
+    Stages are `parse`, `variables`, `build`, `rule`, `flags`, `note`, `attributes`, `metrics`,
+    `positions`, `position`, `kerning` and `draw`. A `build` is a single `BuildGlyphConstructions` call,
+    a `rule` a single construction. Times are inclusive: the time of a stage includes the time of
+    the stages called inside, a `positions` stage includes its `position` stages.
+
+    An optional `callback` is called with the stage name, the construction or `None` and the wall time
+    of every recorded call.
+
+    >>> font = testDummyFont()
+    >>> kerned = "f_i = f &%s i ^ 10, 10" % applyKerningSplit
+    >>> with ConstructionInstrumentation() as instrumentation:
+    ...     glyphs = BuildGlyphConstructions(["agrave = a + grave@center,top", kerned], font)
+    >>> sorted(instrumentation.stages)
+    ['attributes', 'build', 'draw', 'flags', 'kerning', 'metrics', 'note', 'position', 'positions', 'rule']
+    >>> [instrumentation.stages[stage].count for stage in ("build", "rule", "positions", "kerning")]
+    [1, 2, 4, 1]
+    >>> sorted(instrumentation.rules[kerned])
+    ['attributes', 'draw', 'flags', 'kerning', 'metrics', 'note', 'positions', 'rule']
+    >>> len(instrumentation.slowestRules()), len(instrumentation.slowestRules(1))
+    (2, 1)
+
+    Nothing is recorded outside the context.
+
+    >>> glyphs = BuildGlyphConstructions(["agrave = a + grave@center,top"], font)
+    >>> instrumentation.stages["rule"].count
+    2
+    """
+
+    def __init__(self, callback=None):
+        self.stages = dict()
+        self.rules = dict()
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_currentInstrumentation.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _currentInstrumentation.reset(self._tokens.pop())
+
+    def record(self, stage, elapsed, rule=None):
+        """
+        Add a single call of a stage, optionally for a construction.
+        """
+        with self._lock:
+            statistics = self.stages.get(stage)
+            if statistics is None:
+                statistics = self.stages[stage] = StageStatistics()
+            statistics.count += 1
+            statistics.time += elapsed
+            if rule is not None:
+                ruleStages = self.rules.get(rule)
+                if ruleStages is None:
+                    ruleStages = self.rules[rule] = dict()
+                statistics = ruleStages.get(stage)
+                if statistics is None:
+                    statistics = ruleStages[stage] = StageStatistics()
+                statistics.count += 1
+                statistics.time += elapsed
+        if self.callback is not None:
+            self.callback(stage, rule, elapsed)
+
+    def slowestRules(self, count=None, stage="rule"):
+        """
+        Return a list of `(construction, StageStatistics)` tuples for a stage, slowest first.
+        """
+        rules = [(rule, stages[stage]) for rule, stages in self.rules.items() if stage in stages]
+        rules.sort(key=lambda item: item[1].time, reverse=True)
+        if count is not None:
+            rules = rules[:count]
+        return rules
+
+    def asDict(self):
+        return dict(
+            stages=dict((stage, statistics.asDict()) for stage, statistics in self.stages.items()),
+            rules=dict((str(rule), dict((stage, statistics.asDict()) for stage, statistics in stages.items())) for rule, stages in self.rules.items())
+        )
+
+
+def formatConstructionInstrumentation(instrumentation, rules=10):
+    """
+    Format the stage statistics and the slowest constructions as readable text.
+
+    >>> instrumentation = ConstructionInstrumentation()
+    >>> instrumentation.record("rule", .25, "agrave = a + grave")
+    >>> instrumentation.record("positions", .125, "agrave = a + grave")
+    >>> print(formatConstructionInstrumentation(instrumentation))
+    stage      calls  time
+    rule           1  0.250000s
+    positions      1  0.125000s
+    <BLANKLINE>
+    slowest constructions:
+    0.250000s  agrave = a + grave
+    """
+    stages = sorted(instrumentation.stages.items(), key=lambda item: item[1].time, reverse=True)
+    width = max([len("stage")] + [len(stage) for stage, _ in stages])
+    lines = ["%s  calls  time" % "stage".ljust(width)]
+    for stage, statistics in stages:
+        lines.append("%s  %5d  %.6fs" % (stage.ljust(width), statistics.count, statistics.time))
+    slowest = instrumentation.slowestRules(rules)
+    if slowest:
+        lines.append("")
+        lines.append("slowest constructions:")
+        for rule, statistics in slowest:
+            lines.append("%.6fs  %s" % (statistics.time, rule))
+    return "\n".join(lines)
+
+
+def _instrumented(stage, isRule=False):
+    """
+    Record the calls of the decorated function as `stage` in the active instrumentation.
+    A rule function sets the construction, its first argument, as the current rule.
+    """
+    def decorator(function):
+        getInstrumentation = _currentInstrumentation.get
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            instrumentation = getInstrumentation()
+            if instrumentation is None:
+                return function(*args, **kwargs)
+            if isRule:
+                rule = str(args[0])
+                token = _currentRule.set(rule)
+            else:
+                rule = _currentRule.get()
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                instrumentation.record(stage, perf_counter() - start, rule)
+                if isRule:
+                    _currentRule.reset(token)
+        return wrapper
+    return decorator
+
+
+# trace
+
+_currentTrace = ContextVar("glyphConstructionTrace", default=None)
+_currentGlyphTrace = ContextVar("glyphConstructionGlyphTrace", default=None)
+
+
+def _traceValue(value):
+    if isinstance(value, (tuple, list)):
+        return [_traceValue(item) for item in value]
+    if isinstance(value, float):
+        value = round(value, 3)
+        if value == int(value):
+            return int(value)
+    return value
+
+
+class PositionTrace(object):
+
+    """
+    The resolution of a single position on a single axis.
+
+    * `glyphName`: the resolved glyph
+    * `role`: `mark` or `base`
+    * `direction`: `x` or `y`
+    * `positionName`: the position, a name, a number or a formula
+    * `resolutions`: a list of `(name, source, position)` tuples for every name in the position,
+      the source is one of `prefixedAnchor`, `anchor`, `prefixedGlyphGuide`, `glyphGuide`, `fontGuide`,
+      `glyphMetric`, `fontMetric`, `bounds` or `unresolved`
+    * `position`, `angle`, `fixed`: the result
+    """
+
+    def __init__(self, glyphName, role, direction, positionName):
+        self.glyphName = glyphName
+        self.role = role
+        self.direction = direction
+        self.positionName = positionName
+        self.resolutions = []
+        self.position = None
+        self.angle = None
+        self.fixed = False
+
+    def __repr__(self):
+        return "<PositionTrace %s %s %s %s>" % (self.role, self.glyphName, self.direction, self.positionName)
+
+    def asDict(self):
+        return dict(
+            glyphName=self.glyphName,
+            role=self.role,
+            direction=self.direction,
+            positionName=self.positionName,
+            resolutions=[dict(name=name, source=source, position=_traceValue(position)) for name, source, position in self.resolutions],
+            position=_traceValue(self.position),
+            angle=_traceValue(self.angle),
+            fixed=self.fixed
+        )
+
+
+class ComponentTrace(object):
+
+    """
+    The resolution of the transformation of a single component.
+
+    * `glyphName`: the component glyph name
+    * `component`: the component as written in the construction
+    * `baseGlyphX`, `baseGlyphY`: the base glyphs on each axis
+    * `positions`: a list of `PositionTrace` objects
+    * `markIntersection`, `baseIntersection`: the intersection of the positions on both axes or `None`
+    * `flipX`, `flipY`: the component is flipped
+    * `matrix`: the final transformation matrix
+    """
+
+    def __init__(self, component):
+        self.component = component
+        self.glyphName = None
+        self.baseGlyphX = None
+        self.baseGlyphY = None
+        self.positions = []
+        self.markIntersection = None
+        self.baseIntersection = None
+        self.flipX = False
+        self.flipY = False
+        self.matrix = None
+
+    def __repr__(self):
+        return "<ComponentTrace %s>" % self.component
+
+    def asDict(self):
+        return dict(
+            component=self.component,
+            glyphName=self.glyphName,
+            baseGlyphX=self.baseGlyphX,
+            baseGlyphY=self.baseGlyphY,
+            positions=[position.asDict() for position in self.positions],
+            markIntersection=_traceValue(self.markIntersection),
+            baseIntersection=_traceValue(self.baseIntersection),
+            flipX=self.flipX,
+            flipY=self.flipY,
+            matrix=_traceValue(self.matrix)
+        )
+
+
+class GlyphTrace(object):
+
+    """
+    The trace of a single construction: a list of `ComponentTrace` objects,
+    a list of `((left, right), value)` tuples for every kerning lookup
+    and the error message when the construction failed.
+    """
+
+    def __init__(self, construction):
+        self.construction = str(construction)
+        self.name = None
+        self.components = []
+        self.kerning = []
+        self.error = None
+
+    def __repr__(self):
+        return "<GlyphTrace %s>" % self.name
+
+    def addPosition(self, position):
+        if self.components:
+            self.components[-1].positions.append(position)
+
+    def asDict(self):
+        return dict(
+            name=self.name,
+            construction=self.construction,
+            components=[component.asDict() for component in self.components],
+            kerning=[dict(pair=list(pair), value=_traceValue(value)) for pair, value in self.kerning],
+            error=self.error
+        )
+
+
+class ConstructionTrace(object):
+
+    """
+    Record how the position of every component is resolved while building glyph constructions.
+
+    Use the trace as a context manager, like `ConstructionInstrumentation`. Without an active trace
+    the builder only looks up a context variable. Optionally provide glyph names, or a function
+    testing a glyph name, to trace only those glyphs.
+
+    * `glyphs`: a list of `GlyphTrace` objects
+
+    >>> font = testDummyFont()
+    >>> font["a"].appendAnchor(dict(name="top", x=130, y=220))
+    >>> with ConstructionTrace(["agrave"]) as trace:
+    ...     glyphs = BuildGlyphConstructions(["agrave = a + grave@center,top", "f_i = f & i"], font)
+    >>> [glyphTrace.name for glyphTrace in trace.glyphs]
+    ['agrave']
+    >>> component = trace.glyphs[0].components[1]
+    >>> [(position.role, position.direction, position.resolutions) for position in component.positions]
+    [('mark', 'x', [('center', 'bounds', (160.0, 160.0))]), ('mark', 'y', [('top', 'bounds', (0, 100))]), ('base', 'x', [('center', 'bounds', (150.0, 150.0))]), ('base', 'y', [('top', 'anchor', (130, 220))])]
+    >>> component.matrix
+    (1, 0, 0, 1, -10.0, 120.0)
+    >>> print(formatConstructionTrace(trace))
+    agrave = a + grave@center,top
+        a
+            matrix (1, 0, 0, 1, 0, 0)
+        grave@center,top
+            mark grave x 'center': center bounds (160, 160), angle 90
+            mark grave y 'top': top bounds (0, 100), angle 0
+            base a x 'center': center bounds (150, 150), angle 90
+            base a y 'top': top anchor (130, 220), angle 0
+            mark intersection (160, 100)
+            base intersection (150, 220)
+            matrix (1, 0, 0, 1, -10, 120)
+    """
+
+    def __init__(self, glyphNames=None, callback=None):
+        if glyphNames is not None and not callable(glyphNames):
+            glyphNames = set(glyphNames).__contains__
+        self._test = glyphNames
+        self.callback = callback
+        self.glyphs = []
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._tokens.append(_currentTrace.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _currentTrace.reset(self._tokens.pop())
+
+    def addGlyph(self, glyphTrace):
+        """
+        Add a finished glyph trace, when the glyph is traced.
+        """
+        if self._test is not None and not self._test(glyphTrace.name):
+            return
+        with self._lock:
+            self.glyphs.append(glyphTrace)
+            if self.callback is not None:
+                self.callback(glyphTrace)
+
+    def asDict(self):
+        return dict(glyphs=[glyphTrace.asDict() for glyphTrace in self.glyphs])
+
+
+def _formatTraceValue(value):
+    value = _traceValue(value)
+    if isinstance(value, list):
+        return "(%s)" % ", ".join(str(item) for item in value)
+    return str(value)
+
+
+def formatConstructionTrace(trace):
+    """
+    Format a construction trace as readable text.
+    """
+    return "\n".join(formatGlyphTrace(glyphTrace) for glyphTrace in trace.glyphs)
+
+
+def formatGlyphTrace(glyphTrace):
+    """
+    Format the trace of a single construction as readable text.
+    """
+    lines = [glyphTrace.construction]
+    for component in glyphTrace.components:
+        lines.append("    %s" % component.component)
+        for position in component.positions:
+            resolutions = ", ".join("%s %s %s" % (name, source, _formatTraceValue(value)) for name, source, value in position.resolutions)
+            if not resolutions:
+                resolutions = "number %s" % _formatTraceValue(position.position)
+            elif position.positionName not in [name for name, _, _ in position.resolutions]:
+                resolutions += " -> %s" % _formatTraceValue(position.position)
+            lines.append("        %s %s %s '%s': %s, angle %s%s" % (position.role, position.glyphName, position.direction, position.positionName, resolutions, _formatTraceValue(position.angle), ", fixed" if position.fixed else ""))
+        if component.markIntersection is not None:
+            lines.append("        mark intersection %s" % _formatTraceValue(component.markIntersection))
+        if component.baseIntersection is not None:
+            lines.append("        base intersection %s" % _formatTraceValue(component.baseIntersection))
+        if component.flipX or component.flipY:
+            lines.append("        flipped %s" % " ".join(axis for axis, flipped in (("x", component.flipX), ("y", component.flipY)) if flipped))
+        if component.matrix is not None:
+            lines.append("        matrix %s" % _formatTraceValue(component.matrix))
+    for (left, right), value in glyphTrace.kerning:
+        lines.append("    kerning %s %s %s" % (left, right, _formatTraceValue(value)))
+    if glyphTrace.error:
+        lines.append("    error: %s" % glyphTrace.error)
+    return "\n".join(lines)
+
+
+def _traced(function):
+    """
+    Trace the decorated glyph construction builder when a trace is active.
+    """
+    getTrace = _currentTrace.get
+
+    @functools.wraps(function)
+    def wrapper(construction, *args, **kwargs):
+        trace = getTrace()
+        if trace is None:
+            return function(construction, *args, **kwargs)
+        glyphTrace = GlyphTrace(construction)
+        token = _currentGlyphTrace.set(glyphTrace)
+        try:
+            glyph = function(construction, *args, **kwargs)
+            glyphTrace.name = glyph.name
+            return glyph
+        except GlyphBuilderError as err:
+            glyphTrace.error = str(err)
+            try:
+                name = parseGlyphName(removeSpacesAndTabs(parseNote(parseFlags(construction)[1])[1]))[0]
+            except Exception:
+                name = None
+            glyphTrace.name = name
+            raise
+        finally:
+            _currentGlyphTrace.reset(token)
+            if glyphTrace.name is not None:
+                trace.addGlyph(glyphTrace)
+    return wrapper
+
+
 # glyph object
 
 
@@ -158,6 +656,8 @@ class ConstructionGlyph(object):
         self.note = ""
         self.markColor = None
         self.source = RecordingPen()
+        self.anchors = []
+        self.constructionSource = None
         self._bounds = None
         self.shouldDecompose = False
 
@@ -246,6 +746,7 @@ class ConstructionGlyph(object):
             yMax += moveY
             self._bounds = (xMin, yMin, xMax, yMax)
 
+    @_instrumented("draw")
     def draw(self, pen):
         self.source.replay(pen)
         for glyphName, transformation in self.components:
@@ -264,6 +765,45 @@ class ConstructionGlyph(object):
         pen = SegmentToPointPen(pointPen)
         self.draw(pen)
 
+    def detach(self, decompose=False):
+        """
+        Return a picklable `DetachedConstructionGlyph`.
+        When `decompose` is set the detached glyph has the fully decomposed outline.
+        """
+        decomposed = decompose or self.shouldDecompose
+        if decompose:
+            try:
+                pen = DecomposingRecordingPen(self.glyphset, skipMissingComponents=True)
+            except TypeError:
+                # older fontTools skip missing components
+                pen = DecomposingRecordingPen(self.glyphset)
+            self.draw(pen)
+        elif self.shouldDecompose:
+            pen = RecordingPen()
+            self.draw(pen)
+        else:
+            pen = self.source
+        outline = None
+        if pen.value:
+            outline = packOutline(pen.value)
+        return DetachedConstructionGlyph(
+            self.name,
+            width=self.width,
+            unicodes=self.unicodes,
+            note=self.note,
+            markColor=self.markColor,
+            anchors=self.anchors,
+            components=self.components,
+            shouldDecompose=self.shouldDecompose,
+            outline=outline,
+            decomposed=decomposed,
+            constructionSource=self.constructionSource
+        )
+
+    def __reduce__(self):
+        # a construction glyph is pickled detached from its glyph set
+        return self.detach().__reduce__()
+
 
 class MathPoint(tuple):
 
@@ -293,14 +833,28 @@ class MathPoint(tuple):
     >>> point1 /= 2
     >>> point1
     (90.0, 90.0)
+
+    A point allowing only tuple math ignores numbers.
+
+    >>> point = MathPoint((100, 100), allowTupleMathOnly=True)
+    >>> point * 2, point + (10, 20), point.allowTupleMathOnly
+    ((100, 100), (110, 120), True)
+    >>> hasattr(point, "__dict__")
+    False
+    >>> import pickle
+    >>> pickle.loads(pickle.dumps(point)).allowTupleMathOnly
+    True
     """
 
+    __slots__ = ()
+
+    allowTupleMathOnly = False
+
     def __new__(cls, point, allowTupleMathOnly=False):
+        if allowTupleMathOnly and cls is MathPoint:
+            cls = _TupleMathPoint
         return super(MathPoint, cls).__new__(cls, point)
 
-    def __init__(self, point, allowTupleMathOnly=False):
-        self.allowTupleMathOnly = allowTupleMathOnly
-
     def _operation(self, other, operation):
         x, y = self
         ox = oy = 0
@@ -312,7 +866,7 @@ class MathPoint(tuple):
             x = operation(x, ox)
         if oy != 0:
             y = operation(y, oy)
-        return self.__class__((x, y), self.allowTupleMathOnly)
+        return self.__class__((x, y))
 
     def __add__(self, other):
         return self._operation(other, operator.add)
@@ -336,28 +890,607 @@ class MathPoint(tuple):
         return self._operation(other, operator.truediv)
 
 
+class _TupleMathPoint(MathPoint):
+
+    """
+    A math point only calculating with other tuples.
+    """
+
+    __slots__ = ()
+
+    allowTupleMathOnly = True
+
+
+# detached glyphs
+
+_outlineOperators = ("moveTo", "lineTo", "curveTo", "qCurveTo", "closePath", "endPath", "addComponent")
+_outlineOperatorCodes = dict((name, code) for code, name in enumerate(_outlineOperators))
+
+
+def packOutline(value):
+    """
+    Pack a `RecordingPen` value into a compact, picklable tuple of bytes:
+    the operators, the point counts, the coordinates as doubles and the component base glyph names.
+
+    >>> pen = RecordingPen()
+    >>> testDummyFont()["grave"].draw(pen)
+    >>> pen.addComponent("a", (1, 0, 0, 1, 10, 20))
+    >>> packed = packOutline(pen.value)
+    >>> unpackOutline(packed) == pen.value
+    True
+    """
+    operators = bytearray()
+    counts = array("I")
+    coordinates = array("d")
+    names = []
+    for name, args in value:
+        operators.append(_outlineOperatorCodes[name])
+        if name == "addComponent":
+            baseGlyph, transformation = args
+            names.append(baseGlyph)
+            coordinates.extend(transformation)
+            continue
+        counts.append(len(args))
+        for point in args:
+            if point is None:
+                # a quadratic contour without on curve points
+                coordinates.extend((nan, nan))
+            else:
+                coordinates.extend(point)
+    return bytes(operators), counts.tobytes(), coordinates.tobytes(), tuple(names)
+
+
+def unpackOutline(packed):
+    """
+    Return the `RecordingPen` value of a packed outline.
+    """
+    operators, counts, coordinates, names = packed
+    countValues = array("I")
+    countValues.frombytes(counts)
+    coordinateValues = array("d")
+    coordinateValues.frombytes(coordinates)
+    value = []
+    countIndex = coordinateIndex = nameIndex = 0
+    for code in operators:
+        name = _outlineOperators[code]
+        if name == "addComponent":
+            transformation = tuple(coordinateValues[coordinateIndex:coordinateIndex + 6])
+            coordinateIndex += 6
+            value.append((name, (names[nameIndex], transformation)))
+            nameIndex += 1
+            continue
+        points = []
+        for _ in range(countValues[countIndex]):
+            x, y = coordinateValues[coordinateIndex], coordinateValues[coordinateIndex + 1]
+            coordinateIndex += 2
+            if x != x:
+                points.append(None)
+            else:
+                points.append((_packedNumber(x), _packedNumber(y)))
+        countIndex += 1
+        value.append((name, tuple(points)))
+    return value
+
+
+def _packedNumber(value):
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+class DetachedConstructionGlyph(object):
+
+    """
+    A picklable copy of a constructed glyph, independent of the font it was built in.
+
+    * `name`, `width`, `unicodes`, `note`, `markColor`, `anchors`, `constructionSource`
+    * `components`: a tuple of `(baseGlyph, transformation)` tuples
+    * `shouldDecompose`: the constructed glyph is decomposed
+    * `outline`: a packed outline or `None`, the drawing of the glyph not drawn as components:
+      the source glyph drawing, and the decomposed components when the glyph is decomposed
+    * `decomposed`: the components are part of the outline
+
+    >>> import pickle
+    >>> font = testDummyFont()
+    >>> glyphs = BuildGlyphConstructions(["agrave = a + grave@center,top|00E0", "*agrave.alt = agrave"], font)
+    >>> detached = pickle.loads(pickle.dumps(glyphs[0]))
+    >>> detached
+    <DetachedConstructionGlyph agrave>
+    >>> detached.width, detached.unicodes, detached.components
+    (60, (224,), (('a', (1, 0, 0, 1, 0, 0)), ('grave', (1, 0, 0, 1, -10.0, 100.0))))
+    >>> detached.outline is None
+    True
+    >>> pen = RecordingPen()
+    >>> detached.draw(pen)
+    >>> pen.value
+    [('addComponent', ('a', (1, 0, 0, 1, 0, 0))), ('addComponent', ('grave', (1, 0, 0, 1, -10.0, 100.0)))]
+
+    Decomposed glyphs carry their outline.
+
+    >>> detached = pickle.loads(pickle.dumps(glyphs[1]))
+    >>> detached.decomposed, len(detached.components)
+    (True, 1)
+    >>> original = RecordingPen()
+    >>> glyphs[1].draw(original)
+    >>> pen = RecordingPen()
+    >>> detached.draw(pen)
+    >>> pen.value == original.value
+    True
+    """
+
+    __slots__ = ("name", "width", "unicodes", "note", "markColor", "anchors", "components", "shouldDecompose", "outline", "decomposed", "constructionSource")
+
+    def __init__(self, name, width=0, unicodes=(), note="", markColor=None, anchors=(), components=(), shouldDecompose=False, outline=None, decomposed=False, constructionSource=None):
+        self.name = name
+        self.width = width
+        self.unicodes = tuple(unicodes)
+        self.note = note
+        self.markColor = markColor
+        self.anchors = tuple(anchors)
+        self.components = tuple(components)
+        self.shouldDecompose = shouldDecompose
+        self.outline = outline
+        self.decomposed = decomposed
+        self.constructionSource = constructionSource
+
+    def __repr__(self):
+        return "<DetachedConstructionGlyph %s>" % self.name
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def _get_unicode(self):
+        if self.unicodes:
+            return self.unicodes[0]
+        return None
+
+    unicode = property(_get_unicode)
+
+    def draw(self, pen):
+        if self.outline is not None:
+            for name, args in unpackOutline(self.outline):
+                getattr(pen, name)(*args)
+        if not self.decomposed:
+            for glyphName, transformation in self.components:
+                pen.addComponent(glyphName, transformation)
+
+    def drawPoints(self, pointPen):
+        pen = SegmentToPointPen(pointPen)
+        self.draw(pen)
+
+
+def _detachedTuple(glyph):
+    return tuple(getattr(glyph, attr) for attr in DetachedConstructionGlyph.__slots__)
+
+
+def packConstructionGlyphs(glyphs, decompose=False):
+    """
+    Serialize constructed glyphs into compact bytes, see `ConstructionGlyph.detach`.
+
+    >>> font = testDummyFont()
+    >>> glyphs = BuildGlyphConstructions(["agrave = a + grave@center,top", "f_i = f & i"], font)
+    >>> [(glyph.name, glyph.width) for glyph in unpackConstructionGlyphs(packConstructionGlyphs(glyphs))]
+    [('agrave', 60), ('f_i', 170)]
+    """
+    detached = []
+    for glyph in glyphs:
+        if not isinstance(glyph, DetachedConstructionGlyph):
+            glyph = glyph.detach(decompose)
+        detached.append(_detachedTuple(glyph))
+    return pickle.dumps(detached, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpackConstructionGlyphs(data):
+    """
+    Return a list of `DetachedConstructionGlyph` objects from serialized constructed glyphs.
+    """
+    return [DetachedConstructionGlyph(*values) for values in pickle.loads(data)]
+
+
+class _SharedMemoryRegistration(threading.local):
+
+    untracked = False
+
+
+_sharedMemoryLock = threading.Lock()
+_sharedMemoryRegistration = _SharedMemoryRegistration()
+_sharedMemoryRegister = None
+
+
+def _installSharedMemoryRegister(resourceTracker):
+    # Process global: the register function of the resource tracker is replaced once,
+    # the replacement only skips the registration of blocks opened untracked on the current thread,
+    # all other blocks, also those opened by other threads at the same time, are registered as before.
+    global _sharedMemoryRegister
+    with _sharedMemoryLock:
+        if _sharedMemoryRegister is not None:
+            return
+        _sharedMemoryRegister = register = resourceTracker.register
+
+        def untrackedRegister(name, rtype):
+            if not _sharedMemoryRegistration.untracked:
+                register(name, rtype)
+
+        resourceTracker.register = untrackedRegister
+
+
+def openSharedMemory(name=None, size=0, track=True):
+    """
+    Create a new shared memory block of `size` bytes or attach to the existing block `name`.
+    Shared memory needs Python 3.8 or newer, a `RuntimeError` is raised on older versions.
+
+    Disable `track` for blocks owned by another process:
+    the resource tracker removes all tracked blocks when the process exits.
+    """
+    if shared_memory is None:
+        raise RuntimeError("Shared memory needs Python 3.8 or newer")
+    create = name is None
+    if track:
+        return shared_memory.SharedMemory(name=name, create=create, size=size)
+    try:
+        # >= py3.13
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        pass
+    # older versions always register the block,
+    # unregistering it afterwards races with the registration of the owner
+    resourceTracker = getattr(shared_memory, "resource_tracker", None)
+    if resourceTracker is None:
+        return shared_memory.SharedMemory(name=name, create=create, size=size)
+    _installSharedMemoryRegister(resourceTracker)
+    _sharedMemoryRegistration.untracked = True
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size)
+    finally:
+        _sharedMemoryRegistration.untracked = False
+
+
+def writeSharedConstructionGlyphs(glyphs, decompose=False):
+    """
+    Serialize constructed glyphs into a new shared memory block and return a `(name, size)` tuple.
+    The block is owned by the reader, `readSharedConstructionGlyphs` removes it.
+    Use it to return large batches from worker processes without copying them through a pipe,
+    this needs Python 3.8 or newer.
+
+    >>> from concurrent.futures import ProcessPoolExecutor
+    >>> with ProcessPoolExecutor(1) as executor:
+    ...     name, size = executor.submit(testBuildSharedConstructionGlyphs, ["agrave = a + grave@center,top"]).result()
+    >>> readSharedConstructionGlyphs(name, size)
+    [<DetachedConstructionGlyph agrave>]
+    """
+    data = packConstructionGlyphs(glyphs, decompose)
+    size = len(data)
+    # the block outlives this process, the reader unlinks it
+    memory = openSharedMemory(size=max(size, 1), track=False)
+    memory.buf[:size] = data
+    memory.close()
+    return memory.name, size
+
+
+def readSharedConstructionGlyphs(name, size, unlink=True):
+    """
+    Return the `DetachedConstructionGlyph` objects in a shared memory block written with
+    `writeSharedConstructionGlyphs`, and remove the block unless `unlink` is disabled.
+    """
+    memory = openSharedMemory(name)
+    try:
+        data = bytes(memory.buf[:size])
+    finally:
+        memory.close()
+        if unlink:
+            memory.unlink()
+    return unpackConstructionGlyphs(data)
+
+
+# font proxies
+
+
+class RecordingGlyph(object):
+
+    """
+    A glyph proxy recording every attribute read from the wrapped glyph.
+    """
+
+    def __init__(self, glyph, name, record):
+        self._glyph = glyph
+        self._name = name
+        self._record = record
+
+    def __getattr__(self, attr):
+        self._record.add((self._name, attr))
+        return getattr(self._glyph, attr)
+
+
+class RecordingFont(object):
+
+    """
+    A font proxy recording which glyphs, and which of their attributes,
+    are read while building glyph constructions.
+
+    Each record is a tuple `(glyphName, attribute)`, attribute is `None`
+    for a membership test or a glyph lookup.
+
+    >>> font = RecordingFont(testDummyFont())
+    >>> result = GlyphConstructionBuilder("agrave = a + grave@center,top", font)
+    >>> sorted(name for name, attr in font.record if attr == "bounds")
+    ['a', 'grave']
+    >>> ("doesNotExist", None) in font.record
+    False
+    >>> "doesNotExist" in font
+    False
+    >>> ("doesNotExist", None) in font.record
+    True
+    """
+
+    def __init__(self, font, record=None):
+        self.font = font
+        if record is None:
+            record = set()
+        self.record = record
+
+    def __getattr__(self, attr):
+        return getattr(self.font, attr)
+
+    def __contains__(self, glyphName):
+        self.record.add((glyphName, None))
+        return glyphName in self.font
+
+    def __getitem__(self, glyphName):
+        self.record.add((glyphName, None))
+        return RecordingGlyph(self.font[glyphName], glyphName, self.record)
+
+    def recordedGlyphNames(self):
+        """
+        Return all glyph names read from the font.
+        """
+        return set(glyphName for glyphName, _ in self.record)
+
+
+class _InstrumentedMapping(object):
+
+    """
+    A proxy of font groups or kerning counting every access.
+    """
+
+    def __init__(self, mapping, kind, font):
+        self._mapping = mapping
+        self._kind = kind
+        self._font = font
+
+    def __getattr__(self, attr):
+        value = getattr(self._mapping, attr)
+        if not callable(value):
+            return value
+        kind = "%s.%s" % (self._kind, attr)
+
+        def method(*args, **kwargs):
+            return self._font._call(kind, args[0] if args and attr == "get" else None, value, *args, **kwargs)
+        return method
+
+    def __contains__(self, key):
+        return self._font._call("%s.contains" % self._kind, key, self._mapping.__contains__, key)
+
+    def __getitem__(self, key):
+        return self._font._call("%s.getitem" % self._kind, key, self._mapping.__getitem__, key)
+
+    def __iter__(self):
+        return self._font._call("%s.iter" % self._kind, None, iter, self._mapping)
+
+    def __len__(self):
+        return self._font._call("%s.len" % self._kind, None, len, self._mapping)
+
+
+class InstrumentedGlyph(object):
+
+    """
+    A glyph proxy counting and timing every attribute read and every method call.
+    """
+
+    def __init__(self, glyph, name, font):
+        self._glyph = glyph
+        self._name = name
+        self._font = font
+
+    def __getattr__(self, attr):
+        start = perf_counter()
+        value = getattr(self._glyph, attr)
+        if callable(value):
+            # count the calls, not the lookup of the method
+            def method(*args, **kwargs):
+                return self._font._call("glyph.%s" % attr, self._name, value, *args, **kwargs)
+            return method
+        self._font._record("glyph.%s" % attr, self._name, perf_counter() - start)
+        return value
+
+
+class InstrumentedFont(object):
+
+    """
+    A font proxy counting and timing every access to the wrapped font by kind and glyph name:
+    membership tests, glyph lookups, glyph attributes and methods, font attributes, groups and kerning.
+
+    Kinds are `contains`, `getitem`, `glyph.<attribute>`, `font.<attribute>`,
+    `groups.<method>` and `kerning.<method>`. The same access more than once is a redundant access,
+    a candidate for caching. Use a new proxy, or `reset()`, for every build.
+
+    >>> font = InstrumentedFont(testDummyFont())
+    >>> constructions = ["agrave = a + grave@center,top", "aacute = a + grave@center,top", "f_i = f &%s i" % applyKerningSplit]
+    >>> glyphs = BuildGlyphConstructions(constructions, font)
+    >>> counts = font.accessCounts()
+    >>> counts["getitem"], counts["glyph.bounds"], counts["groups.items"]
+    (4, 8, 1)
+    >>> font.mostAccessedGlyphs(2)
+    [('a', 35), ('grave', 32)]
+    >>> font.redundantAccesses(2)
+    [(('font.guidelines', None), 15), (('glyph.guidelines', 'a'), 15)]
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.accesses = dict()
+        self._lock = threading.Lock()
+
+    def _record(self, kind, name, elapsed):
+        key = kind, name
+        with self._lock:
+            statistics = self.accesses.get(key)
+            if statistics is None:
+                statistics = self.accesses[key] = StageStatistics()
+            statistics.count += 1
+            statistics.time += elapsed
+
+    def _call(self, kind, name, function, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._record(kind, name, perf_counter() - start)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        value = self._call("font.%s" % attr, None, getattr, self.font, attr)
+        if attr in ("groups", "kerning"):
+            value = _InstrumentedMapping(value, attr, self)
+        return value
+
+    def __contains__(self, glyphName):
+        return self._call("contains", glyphName, self.font.__contains__, glyphName)
+
+    def __getitem__(self, glyphName):
+        glyph = self._call("getitem", glyphName, self.font.__getitem__, glyphName)
+        return InstrumentedGlyph(glyph, glyphName, self)
+
+    def __len__(self):
+        return self._call("len", None, len, self.font)
+
+    def keys(self):
+        return self._call("keys", None, self.font.keys)
+
+    def reset(self):
+        """
+        Drop all counted accesses.
+        """
+        with self._lock:
+            self.accesses.clear()
+
+    def accessCounts(self):
+        """
+        Return a dictionary of kinds and their total access counts.
+        """
+        counts = dict()
+        for (kind, _), statistics in list(self.accesses.items()):
+            counts[kind] = counts.get(kind, 0) + statistics.count
+        return counts
+
+    def accessTimes(self):
+        """
+        Return a dictionary of kinds and their total access times in seconds.
+        """
+        times = dict()
+        for (kind, _), statistics in list(self.accesses.items()):
+            times[kind] = times.get(kind, 0) + statistics.time
+        return times
+
+    def mostAccessedGlyphs(self, count=None):
+        """
+        Return a list of `(glyphName, accessCount)` tuples, most accessed first.
+        """
+        counts = dict()
+        for (kind, name), statistics in list(self.accesses.items()):
+            if isinstance(name, str) and (kind in ("contains", "getitem") or kind.startswith("glyph.")):
+                counts[name] = counts.get(name, 0) + statistics.count
+        result = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        if count is not None:
+            result = result[:count]
+        return result
+
+    def redundantAccesses(self, count=None):
+        """
+        Return a list of `((kind, name), redundantCount)` tuples, the accesses repeated most first.
+        """
+        result = [(key, statistics.count - 1) for key, statistics in list(self.accesses.items()) if statistics.count > 1]
+        result.sort(key=lambda item: (-item[1], str(item[0])))
+        if count is not None:
+            result = result[:count]
+        return result
+
+    def asDict(self, count=None):
+        return dict(
+            counts=self.accessCounts(),
+            times=self.accessTimes(),
+            mostAccessedGlyphs=[list(item) for item in self.mostAccessedGlyphs(count)],
+            redundantAccesses=[dict(kind=kind, name=name if name is None or isinstance(name, str) else " ".join(name), redundant=redundant) for (kind, name), redundant in self.redundantAccesses(count)]
+        )
+
+
+def formatFontAccessReport(font, count=10):
+    """
+    Format the access counts, most accessed glyphs and redundant accesses of an `InstrumentedFont` as readable text.
+
+    >>> font = InstrumentedFont(testDummyFont())
+    >>> "a" in font, "a" in font, font["a"].width
+    (True, True, 60)
+    >>> print(formatFontAccessReport(font)) # doctest: +ELLIPSIS
+    kind         accesses  time
+    contains            2  ...s
+    getitem             1  ...s
+    glyph.width         1  ...s
+    <BLANKLINE>
+    most accessed glyphs:
+          4  a
+    <BLANKLINE>
+    redundant accesses:
+          1  contains a
+    """
+    counts = font.accessCounts()
+    times = font.accessTimes()
+    kinds = sorted(counts, key=lambda kind: (-counts[kind], kind))
+    width = max([len("kind")] + [len(kind) for kind in kinds])
+    lines = ["%s  accesses  time" % "kind".ljust(width)]
+    for kind in kinds:
+        lines.append("%s  %8d  %.6fs" % (kind.ljust(width), counts[kind], times[kind]))
+    glyphs = font.mostAccessedGlyphs(count)
+    if glyphs:
+        lines.append("")
+        lines.append("most accessed glyphs:")
+        for glyphName, accessCount in glyphs:
+            lines.append("%7d  %s" % (accessCount, glyphName))
+    redundant = font.redundantAccesses(count)
+    if redundant:
+        lines.append("")
+        lines.append("redundant accesses:")
+        for (kind, name), redundantCount in redundant:
+            if name is None:
+                name = ""
+            elif not isinstance(name, str):
+                name = " ".join(name)
+            lines.append(("%7d  %s %s" % (redundantCount, kind, name)).rstrip())
+    return "\n".join(lines)
+
+
 def _parsePosition(name, position, angle, fixedPosition, glyph, font, direction, isBase, prefix, top, bottom, left, right, width, height):
     # glyph anchor + prefix
     found = _findAnchor(glyph, "%s%s" % (prefix, name))
     if found is not None:
-        return found, angle, fixedPosition
+        return found, angle, fixedPosition, "prefixedAnchor" if prefix else "anchor"
 
     # glyph anchor
     found = _findAnchor(glyph, name)
     if found is not None:
-        return found, angle, fixedPosition
+        return found, angle, fixedPosition, "anchor"
 
     # glyph guide + prefix
     found = _findGuide(glyph, "%s%s" % (prefix, name))
     if found is not None:
         position, angle = found
-        return position, angle, fixedPosition
+        return position, angle, fixedPosition, "prefixedGlyphGuide" if prefix else "glyphGuide"
 
     # glyph guide
     found = _findGuide(glyph, name)
     if found is not None:
         position, angle = found
-        return position, angle, fixedPosition
+        return position, angle, fixedPosition, "glyphGuide"
 
     # font guide
     found = _findGuide(font, name)
@@ -369,7 +1502,7 @@ def _parsePosition(name, position, angle, fixedPosition, glyph, font, direction,
                 name = "top"
         else:
             position, angle = found
-            return position, angle, fixedPosition
+            return position, angle, fixedPosition, "fontGuide"
 
     # glyph metrics
     if direction == "x" and name in legalGlyphMetricHorizontalPositions:
@@ -378,7 +1511,7 @@ def _parsePosition(name, position, angle, fixedPosition, glyph, font, direction,
         elif name == "width":
             position = (glyph.width, 0)
         fixedPosition = True
-        return position, angle, fixedPosition
+        return position, angle, fixedPosition, "glyphMetric"
 
     if direction == "y" and name in legalGlyphMetricVerticalPositions:
         if name == "origin":
@@ -386,7 +1519,7 @@ def _parsePosition(name, position, angle, fixedPosition, glyph, font, direction,
         elif name == "height":
             position = (0, getattr(glyph, "height", height))
         fixedPosition = True
-        return position, angle, fixedPosition
+        return position, angle, fixedPosition, "glyphMetric"
 
     # font metrics
     if name in legalFontInfoAttributes:
@@ -399,7 +1532,7 @@ def _parsePosition(name, position, angle, fixedPosition, glyph, font, direction,
             # else:
             #     position = _diffPoint(found, (0, bottom))
             fixedPosition = True
-            return position, angle, fixedPosition
+            return position, angle, fixedPosition, "fontMetric"
 
     # calculate
     centerValue = .5
@@ -448,10 +1581,36 @@ def _parsePosition(name, position, angle, fixedPosition, glyph, font, direction,
                     position = (left, 0)
             elif direction == "x" and name == "innerRight":
                 position = (right, 0)
-    return position, angle, fixedPosition
+        return position, angle, fixedPosition, "bounds"
+    return position, angle, fixedPosition, "unresolved"
 
 
+@_instrumented("position")
 def parsePosition(markGlyph, font, positionName, direction, prefix="", isBase=False):
+    """
+    Return a tuple of the position, the angle and whether the position is fixed,
+    for a position name in a glyph in the given direction.
+    Simple math with numbers only is resolved to a fixed position, like a number.
+
+    >>> font = testDummyFont()
+    >>> parsePosition("grave", font, "30", "x")
+    ((-70.0, 0), 90, True)
+    >>> parsePosition("grave", font, "60/2", "x")
+    ((-70.0, 0), 90, True)
+    >>> GlyphConstructionBuilder("agrave = a + grave@`10+20`,top", font).components
+    [('a', (1, 0, 0, 1, 0, 0)), ('grave', (1, 0, 0, 1, -70.0, 100.0))]
+    """
+    glyphTrace = _currentGlyphTrace.get()
+    if glyphTrace is not None:
+        positionTrace = PositionTrace(markGlyph, "base" if isBase else "mark", direction, positionName)
+        glyphTrace.addPosition(positionTrace)
+        result = _parsePositionUntraced(markGlyph, font, positionName, direction, prefix, isBase, positionTrace)
+        positionTrace.position, positionTrace.angle, positionTrace.fixed = result
+        return result
+    return _parsePositionUntraced(markGlyph, font, positionName, direction, prefix, isBase)
+
+
+def _parsePositionUntraced(markGlyph, font, positionName, direction, prefix="", isBase=False, positionTrace=None):
     position = (0, 0)
     fixedPosition = False
 
@@ -485,7 +1644,9 @@ def parsePosition(markGlyph, font, positionName, direction, prefix="", isBase=Fa
     if not names and not percentage:
         # resolve simple math operations
         try:
-            exec("positionName=%s" % positionName)
+            simpleMathNameSpace = dict()
+            exec("positionName=%s" % positionName, simpleMathNameSpace)
+            positionName = simpleMathNameSpace["positionName"]
         except Exception:
             pass
     try:
@@ -514,8 +1675,10 @@ def parsePosition(markGlyph, font, positionName, direction, prefix="", isBase=Fa
     )
 
     for name in names + percentage:
-        position, angle, fixedPosition = _parsePosition(name, position, angle, fixedPosition, **data)
+        position, angle, fixedPosition, source = _parsePosition(name, position, angle, fixedPosition, **data)
         nameSpace[name] = MathPoint(position, not isBase and not fixedPosition)
+        if positionTrace is not None:
+            positionTrace.resolutions.append((name, source, position))
 
     try:
         exec("position=%s" % positionName, nameSpace)
@@ -558,9 +1721,16 @@ def _findFontInfoValue(font, name):
     return (0, value)
 
 
+@_instrumented("positions")
 def parsePositions(baseGlyph, markGlyph, font, markTransformMap, advanceWidth, advanceHeight):
     xx, xy, yx, yy, x, y = 1, 0, 0, 1, advanceWidth, advanceHeight
 
+    componentTrace = None
+    glyphTrace = _currentGlyphTrace.get()
+    if glyphTrace is not None:
+        componentTrace = ComponentTrace(reEscapeMathOperations(markGlyph))
+        glyphTrace.components.append(componentTrace)
+
     baseGlyphX = baseGlyphY = baseGlyph
     markFixedX = markFixedY = False
 
@@ -623,6 +1793,8 @@ def parsePositions(baseGlyph, markGlyph, font, markTransformMap, advanceWidth, a
                 markX, markY = intersection
             elif (markPoint1, markAngle1) == (markPoint2, markAngle2):
                 markX, markY = markPoint1
+            if componentTrace is not None:
+                componentTrace.markIntersection = intersection
 
             if baseGlyphX is not None and baseGlyphY is not None and baseGlyphX in font and baseGlyphY in font:
                 basePoint1, baseAngle1, _ = parsePosition(baseGlyphX, font, positionX, direction="x", isBase=True)
@@ -632,6 +1804,8 @@ def parsePositions(baseGlyph, markGlyph, font, markTransformMap, advanceWidth, a
                     baseX, baseY = intersection
                 elif (basePoint1, baseAngle1) == (basePoint2, baseAngle2):
                     baseX, baseY = basePoint1
+                if componentTrace is not None:
+                    componentTrace.baseIntersection = intersection
 
             # calculate the offset
             if not markFixedX:
@@ -689,6 +1863,13 @@ def parsePositions(baseGlyph, markGlyph, font, markTransformMap, advanceWidth, a
             transformMatrix = t[:]
 
     markTransformMap[markGlyph] = unflippedMatrix
+    if componentTrace is not None:
+        componentTrace.glyphName = markGlyph
+        componentTrace.baseGlyphX = baseGlyphX
+        componentTrace.baseGlyphY = baseGlyphY
+        componentTrace.flipX = flipX
+        componentTrace.flipY = flipY
+        componentTrace.matrix = tuple(transformMatrix)
     return markGlyph, transformMatrix
 
 
@@ -698,6 +1879,7 @@ glyphAttributeAlternateMap = dict(
 )
 
 
+@_instrumented("metrics")
 def _parseGlyphMetric(construction, font, attr):
     value = None
     construction = reEscapeMathOperations(construction)
@@ -831,6 +2013,82 @@ def parseBaseGlyphs(construction):
     return construction.split(baseGlyphSplit)
 
 
+def _constructionTokens(construction):
+    # the tokens of a construction without whitespace, or `None` for a line without construction
+    tokens = [(tokenType, text) for _, tokenType, text in TokenizeGlyphConstructionLine(removeSpacesAndTabs(construction)) if tokenType != tokenWhitespace]
+    if (tokenOperator, glyphNameSplit) not in tokens or tokens[0][0] in (tokenComment, tokenVariableDeclaration):
+        return None
+    return tokens
+
+
+def parseConstructedGlyphName(construction):
+    """
+    Parse the name of the constructed glyph from a construction with flags and a note,
+    return `None` for a construction without name.
+
+    >>> parseConstructedGlyphName("?*agrave = a + grave # a note")
+    'agrave'
+    >>> parseConstructedGlyphName("# a = b") is None
+    True
+    >>> parseConstructedGlyphName("a-cy{suffix} = a + grave")
+    'a-cy{suffix}'
+    """
+    tokens = _constructionTokens(construction)
+    if tokens is None:
+        return None
+    return _tokensGlyphName(tokens)
+
+
+def _tokensGlyphName(tokens):
+    glyphName = []
+    for tokenType, text in tokens:
+        if (tokenType, text) == (tokenOperator, glyphNameSplit):
+            break
+        if tokenType != tokenFlag:
+            glyphName.append(text)
+    return "".join(glyphName) or None
+
+
+_componentSplits = set((glyphNameSplit, baseGlyphSplit, markGlyphSplit, applyKerningSplit))
+
+
+def parseReferencedGlyphNames(construction):
+    """
+    Return all names a construction could read as a glyph, including the glyph it constructs.
+    The construction is split with the tokenizer, which splits glyph names like the builder,
+    so glyph names with other characters, like `a-cy`, are kept whole.
+    Every glyph name like word in a position or an attribute counts as well,
+    the result can contain more names than the construction reads.
+
+    >>> sorted(parseReferencedGlyphNames('agrave.alt = agrave & grave.cap@"i.alt":center,top ^ f'))
+    ['agrave', 'agrave.alt', 'center', 'f', 'grave', 'grave.cap', 'i.alt', 'top']
+    >>> sorted(parseReferencedGlyphNames("x-cy = a-cy + breve-cy@a-cy:center,top & \\i ^ x-cy.alt', 10"))
+    ['a', 'a-cy', 'breve-cy', 'center', 'cy', 'cy.alt', 'i', 'top', 'x', 'x-cy', 'x-cy.alt']
+    """
+    names = set()
+    tokens = _constructionTokens(construction)
+    if tokens is None:
+        return names
+    previous = None
+    for tokenType, text in tokens:
+        if tokenType == tokenConstructionName:
+            names.add(text)
+        elif tokenType == tokenGlyphName:
+            glyphName = text.strip(explicitGlyphNameStart + explicitGlyphNameEnd)
+            names.add(glyphName)
+            if previous in _componentSplits:
+                # a missing mark glyph with a suffix is positioned with the glyph without the suffix
+                names.add(glyphName.split(glyphSuffixSplit)[0])
+            else:
+                names.update(match.group() for match in glyphNameRe.finditer(glyphName))
+        elif tokenType in (tokenPosition, tokenAnchorName):
+            names.add(text)
+        previous = text if tokenType == tokenOperator else None
+    names.discard("")
+    return names
+
+
+@_instrumented("attributes")
 def parseGlyphattributes(construction, font):
     """
     Parse glyph attributes from construction.
@@ -934,6 +2192,7 @@ def parseGlyphattributes(construction, font):
     return values, newConstruction
 
 
+@_instrumented("note")
 def parseNote(construction):
     """
     Parse note from construction.
@@ -951,6 +2210,7 @@ def parseNote(construction):
     return note, construction
 
 
+@_instrumented("kerning")
 def kernValueForGlyphPair(font, pair):
     """
     Return the kerning value of pair of glyph names.
@@ -1048,6 +2308,7 @@ class ConstructionFlags(set):
         return shouldAddSourceGlyphIfExists in self
 
 
+@_instrumented("flags")
 def parseFlags(construction):
     """
     Parse construction and return all optional flags.
@@ -1170,12 +2431,15 @@ def removeSpacesAndTabs(data):
     return data.replace(" ", "").replace("\t", "")
 
 
+@_instrumented("rule", isRule=True)
+@_traced
 def GlyphConstructionBuilder(construction, font, characterMap=None):
     # create a construction glyph
     destination = ConstructionGlyph(font)
     # test if the input is a proper string
     if not isinstance(construction, str):
         return destination
+    destination.constructionSource = getattr(construction, "constructionSource", None)
     # parse flags
     flags, construction = parseFlags(construction)
     # parse the note
@@ -1224,6 +2488,10 @@ def GlyphConstructionBuilder(construction, font, characterMap=None):
                         t = Transform(*transformMatrix).translate(kern, 0)
                         transformMatrix = t[:]
                         advanceWidth += kern
+                    glyphTrace = _currentGlyphTrace.get()
+                    if glyphTrace is not None:
+                        glyphTrace.kerning.append(((previousBaseGlyph, baseGlyph), kern))
+                        glyphTrace.components[-1].matrix = tuple(transformMatrix)
 
                 baseTransformMatrix = transformMatrix
             destination.addComponent(component, transformMatrix)
@@ -1248,6 +2516,391 @@ def GlyphConstructionBuilder(construction, font, characterMap=None):
     return destination
 
 
+class _OverlayGlyphNames(Set):
+
+    """
+    A lazy, set like view on the glyph names of an overlay font.
+    """
+
+    def __init__(self, overlay):
+        self._overlay = overlay
+
+    def __contains__(self, glyphName):
+        return glyphName in self._overlay
+
+    def __len__(self):
+        return len(self._overlay)
+
+    def __iter__(self):
+        overlay = self._overlay
+        glyphsDone = overlay.glyphsDone
+        for glyphName in overlay.font.keys():
+            if glyphName not in glyphsDone:
+                yield glyphName
+        for glyphName in glyphsDone:
+            yield glyphName
+
+
+class ConstructionOverlayFont(object):
+
+    """
+    A font like object where constructed glyphs shadow the glyphs of the given font.
+
+    The overlay has two layers: the constructed glyphs in `glyphsDone` and the base font.
+    Add constructed glyphs with item assignment or replace `glyphsDone` as a whole.
+    Lookups, `in` tests and `len` do not depend on the amount of glyphs in the font,
+    `keys()` is a lazy view and iterating does not collect all glyph names first.
+    Glyphs from the base font are cached, call `invalidate()` when glyphs are
+    added, removed or renamed in the base font.
+
+    >>> font = testDummyFont()
+    >>> overlay = ConstructionOverlayFont(font)
+    >>> len(overlay)
+    5
+    >>> glyph = ConstructionGlyph(overlay)
+    >>> overlay["agrave"] = glyph
+    >>> overlay["aacute"] = glyph
+    >>> overlay["agrave"] is glyph, "aacute" in overlay, "acircumflex" in overlay
+    (True, True, False)
+    >>> len(overlay), len(overlay.keys())
+    (6, 6)
+    >>> sorted(overlay.keys())
+    ['a', 'aacute', 'agrave', 'f', 'grave', 'i']
+    >>> sorted(glyph.name for glyph in overlay if glyph.name)
+    ['a', 'f', 'grave', 'i']
+    >>> del overlay["aacute"]
+    >>> len(overlay), "aacute" in overlay
+    (5, False)
+
+    >>> glyph = font.newGlyph("aacute")
+    >>> overlay.invalidate()
+    >>> len(overlay), "aacute" in overlay
+    (6, True)
+
+    >>> overlay.glyphsDone = {"b": glyph, "a": glyph}
+    >>> len(overlay)
+    7
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphCache = {}
+        self.glyphsDone = {}
+
+    def _get_glyphsDone(self):
+        return self._glyphsDone
+
+    def _set_glyphsDone(self, glyphsDone):
+        self._glyphsDone = dict(glyphsDone)
+        self._addedCount = None
+
+    glyphsDone = property(_get_glyphsDone, _set_glyphsDone, doc="A dictionary of constructed glyphs shadowing the base font.")
+
+    def invalidate(self):
+        """
+        Drop the cached base font glyphs and glyph count.
+        """
+        self._glyphCache.clear()
+        self._addedCount = None
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.font, attr)
+
+    def __getitem__(self, glyphName):
+        glyphsDone = self._glyphsDone
+        if glyphName in glyphsDone:
+            return glyphsDone[glyphName]
+        glyphCache = self._glyphCache
+        if glyphName not in glyphCache:
+            glyphCache[glyphName] = self.font[glyphName]
+        return glyphCache[glyphName]
+
+    def __contains__(self, glyphName):
+        if glyphName in self._glyphsDone or glyphName in self._glyphCache:
+            return True
+        return glyphName in self.font
+
+    def __setitem__(self, glyphName, glyph):
+        if self._addedCount is not None and glyphName not in self._glyphsDone and glyphName not in self.font:
+            self._addedCount += 1
+        self._glyphsDone[glyphName] = glyph
+
+    def __delitem__(self, glyphName):
+        glyph = self._glyphsDone.pop(glyphName)
+        if self._addedCount is not None and glyphName not in self.font:
+            self._addedCount -= 1
+        return glyph
+
+    def __len__(self):
+        if self._addedCount is None:
+            font = self.font
+            self._addedCount = sum(1 for glyphName in self._glyphsDone if glyphName not in font)
+        return len(self.font) + self._addedCount
+
+    def keys(self):
+        return _OverlayGlyphNames(self)
+
+    def __iter__(self):
+        for glyphName in self.keys():
+            yield self[glyphName]
+
+
+class _SnapshotObject(object):
+
+    """
+    A read only copy of an anchor, a guideline or font info.
+    """
+
+    def __init__(self, obj, attributes):
+        for attr in attributes:
+            object.__setattr__(self, attr, getattr(obj, attr, None))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("A snapshot is read only.")
+
+
+snapshotFontInfoAttributes = legalFontInfoAttributes | set(["italicAngle", "unitsPerEm"])
+
+
+class SnapshotGlyph(object):
+
+    """
+    A read only copy of all glyph data a glyph construction can use.
+    """
+
+    def __init__(self, glyph):
+        pen = RecordingPen()
+        glyph.draw(pen)
+        data = dict(
+            name=glyph.name,
+            width=glyph.width,
+            height=getattr(glyph, "height", 0),
+            unicodes=tuple(glyph.unicodes),
+            bounds=glyph.bounds,
+            leftMargin=glyph.leftMargin,
+            rightMargin=glyph.rightMargin,
+            anchors=tuple(_SnapshotObject(anchor, ("name", "x", "y")) for anchor in glyph.anchors),
+            guidelines=tuple(_SnapshotObject(guideline, ("name", "x", "y", "angle")) for guideline in getattr(glyph, "guidelines", ())),
+            _drawing=tuple(pen.value)
+        )
+        for attr, value in data.items():
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("A snapshot is read only.")
+
+    def draw(self, pen):
+        for methodName, operands in self._drawing:
+            getattr(pen, methodName)(*operands)
+
+    def drawPoints(self, pointPen):
+        self.draw(SegmentToPointPen(pointPen))
+
+
+class FontSnapshot(object):
+
+    """
+    An immutable copy of all font data glyph constructions can use:
+    glyphs, font info metrics, font guidelines, kerning and groups.
+    A snapshot can be read from any thread while the font keeps changing.
+
+    Provide a `previous` snapshot and the changed `glyphNames` to copy only those glyphs again,
+    all other glyphs are shared with the previous snapshot.
+
+    >>> font = testDummyFont()
+    >>> snapshot = FontSnapshot(font)
+    >>> len(snapshot), "agrave" in snapshot, snapshot["grave"].bounds
+    (5, True, (100, 100, 220, 220))
+    >>> GlyphConstructionBuilder("agrave = a + grave@center,top", snapshot).components == GlyphConstructionBuilder("agrave = a + grave@center,top", font).components
+    True
+    >>> font["grave"].move((10, 0))
+    >>> snapshot["grave"].bounds
+    (100, 100, 220, 220)
+    >>> snapshot["grave"].width = 100
+    Traceback (most recent call last):
+        ...
+    AttributeError: A snapshot is read only.
+
+    >>> glyph = font.newGlyph("b")
+    >>> updated = FontSnapshot(font, previous=snapshot, glyphNames=["grave", "b"])
+    >>> updated["grave"].bounds, "b" in updated, updated["a"] is snapshot["a"]
+    ((110, 100, 230, 220), True, True)
+    """
+
+    def __init__(self, font, previous=None, glyphNames=None):
+        if previous is None:
+            glyphs = dict((glyph.name, SnapshotGlyph(glyph)) for glyph in font)
+        else:
+            glyphs = dict(previous._glyphs)
+            for glyphName in glyphNames or ():
+                if glyphName in font:
+                    glyphs[glyphName] = SnapshotGlyph(font[glyphName])
+                else:
+                    glyphs.pop(glyphName, None)
+        data = dict(
+            _glyphs=glyphs,
+            info=_SnapshotObject(font.info, snapshotFontInfoAttributes),
+            guidelines=tuple(_SnapshotObject(guideline, ("name", "x", "y", "angle")) for guideline in getattr(font, "guidelines", ())),
+            kerning=MappingProxyType(dict(font.kerning.items())),
+            groups=MappingProxyType(dict((groupName, tuple(group)) for groupName, group in font.groups.items()))
+        )
+        for attr, value in data.items():
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("A snapshot is read only.")
+
+    def __getitem__(self, glyphName):
+        return self._glyphs[glyphName]
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphs
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def __iter__(self):
+        return iter(self._glyphs.values())
+
+    def keys(self):
+        return self._glyphs.keys()
+
+
+@_instrumented("build")
+def BuildGlyphConstructions(constructions, font, characterMap=None, errors=None):
+    """
+    Build a list of glyph constructions in the given font.
+    Constructed glyphs are available as component or reference for all following constructions.
+
+    Optionally provide an `errors` list to collect `(construction, message)` tuples
+    instead of raising a `GlyphBuilderError`.
+
+    >>> font = testDummyFont()
+    >>> result = BuildGlyphConstructions(["", "agrave = a + grave@center,top", "agrave.alt = agrave & i"], font)
+    >>> [(glyph.name, glyph.width) for glyph in result]
+    [('agrave', 60), ('agrave.alt', 150)]
+    >>> result = BuildGlyphConstructions(["agrave = a + grave", "*agrave.alt = agrave"], font)
+    >>> result[-1].bounds
+    (100, 100, 220, 220)
+
+    >>> errors = []
+    >>> result = BuildGlyphConstructions(["agrave = a + grave@1,2,3", "i.alt = i"], font, errors=errors)
+    >>> [glyph.name for glyph in result], errors
+    (['i.alt'], [('agrave = a + grave@1,2,3', 'Mark positions should have 6 or 2 options')])
+    """
+    return list(IterBuildGlyphConstructions(constructions, font, characterMap=characterMap, errors=errors))
+
+
+def IterBuildGlyphConstructions(constructions, font, characterMap=None, errors=None):
+    """
+    Build glyph constructions one by one and yield the constructed glyphs, see `BuildGlyphConstructions`.
+    The build can be stopped in between any two constructions.
+
+    >>> font = testDummyFont()
+    >>> builder = IterBuildGlyphConstructions(["agrave = a + grave", "agrave.alt = agrave"], font)
+    >>> next(builder).name
+    'agrave'
+    """
+    overlayFont = ConstructionOverlayFont(font)
+    for construction in constructions:
+        if not construction:
+            continue
+        try:
+            glyph = GlyphConstructionBuilder(construction, overlayFont, characterMap=characterMap)
+        except GlyphBuilderError as err:
+            if errors is None:
+                raise
+            errors.append((construction, str(err)))
+            continue
+        if glyph.name is None:
+            continue
+        # keep the overlay font alive as long as the constructed glyphs
+        glyph._glyphset = lambda: overlayFont
+        overlayFont[glyph.name] = glyph
+        yield glyph
+
+
+def _submitInContext(executor, function, *args):
+    # pool threads do not inherit the context of the caller,
+    # run every call in a copy to keep instrumentation and traces active
+    if copy_context is None:
+        return executor.submit(function, *args)
+    return executor.submit(copy_context().run, function, *args)
+
+
+def _buildRecordingReads(construction, font, characterMap):
+    font = RecordingFont(font)
+    try:
+        glyph = GlyphConstructionBuilder(construction, font, characterMap=characterMap)
+        error = None
+    except GlyphBuilderError as err:
+        glyph = None
+        error = err
+    return glyph, error, font.recordedGlyphNames()
+
+
+def _buildChunkRecordingReads(constructions, font, characterMap):
+    return [_buildRecordingReads(construction, font, characterMap) for construction in constructions]
+
+
+@_instrumented("build")
+def ThreadedBuildGlyphConstructions(constructions, font, characterMap=None, errors=None, workers=None):
+    """
+    Build a list of glyph constructions on a pool of `workers` threads,
+    with the same result as `BuildGlyphConstructions`.
+
+    All constructions are built at once against a read only `FontSnapshot` of the font,
+    recording the glyphs each construction reads. Constructions reading a glyph constructed
+    by an earlier construction are built again, in order, once all glyphs before them are done.
+    The builder keeps no state outside a single call, so this also scales on free threaded builds.
+
+    >>> font = testDummyFont()
+    >>> constructions = ["", "agrave = a + grave@center,top", "agrave.alt = agrave & i", "f.alt = f", "i.alt = i"]
+    >>> result = ThreadedBuildGlyphConstructions(constructions, font, workers=4)
+    >>> [(glyph.name, glyph.width, glyph.components, glyph.bounds) for glyph in result] == [(glyph.name, glyph.width, glyph.components, glyph.bounds) for glyph in BuildGlyphConstructions(constructions, font)]
+    True
+
+    >>> errors = []
+    >>> with ConstructionInstrumentation() as instrumentation:
+    ...     result = ThreadedBuildGlyphConstructions(["agrave = a + grave@1,2,3", "i.alt = i"], font, errors=errors)
+    >>> [glyph.name for glyph in result], errors, instrumentation.stages["rule"].count
+    (['i.alt'], [('agrave = a + grave@1,2,3', 'Mark positions should have 6 or 2 options')], 2)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    if not isinstance(font, FontSnapshot):
+        font = FontSnapshot(font)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    constructions = [construction for construction in constructions if construction]
+    with ThreadPoolExecutor(workers) as executor:
+        # a few chunks per thread, a task per construction costs more than most constructions
+        chunkSize = max(1, len(constructions) // (workers * 4))
+        futures = [
+            _submitInContext(executor, _buildChunkRecordingReads, constructions[index:index + chunkSize], font, characterMap)
+            for index in range(0, len(constructions), chunkSize)
+        ]
+        builds = [build for future in futures for build in future.result()]
+
+    overlayFont = ConstructionOverlayFont(font)
+    result = []
+    for construction, (glyph, error, readGlyphNames) in zip(constructions, builds):
+        if not overlayFont.glyphsDone.keys().isdisjoint(readGlyphNames):
+            glyph, error, _ = _buildRecordingReads(construction, overlayFont, characterMap)
+        if error is not None:
+            if errors is None:
+                raise error
+            errors.append((construction, str(error)))
+            continue
+        if glyph.name is None:
+            continue
+        glyph._glyphset = lambda: overlayFont
+        overlayFont[glyph.name] = glyph
+        result.append(glyph)
+    return result
+
+
 def ParseVariables(txt):
     """
     Parse all variables from all constructions and remove them.
@@ -1272,6 +2925,132 @@ def ParseVariables(txt):
     return txt, variables
 
 
+variableFieldRe = re.compile(r"\{\{|\}\}|\{([^{}]*)\}")
+
+
+class ConstructionSource(object):
+
+    """
+    The location of a parsed construction in the source text.
+
+    * `path`: the source file path or `None`
+    * `line`: the line index
+    * `offset`: the character offset of the line in the source text
+    * `start`, `end`: the column span of the construction in the line, before variable expansion
+    * `construction`: the construction after variable expansion
+
+    Columns in the construction map back to columns in the line with `lineColumn(column)`.
+
+    >>> source = ParseGlyphConstructionLine("  agrave = a + {mark}@{pos} ", dict(mark="grave", pos="center,top"), lineNumber=2, offset=20).constructionSource
+    >>> source.line, source.start, source.end, source.textStart, source.textEnd
+    (2, 2, 27, 22, 47)
+    >>> source.construction
+    'agrave = a + grave@center,top'
+    >>> source.lineColumn(13), source.lineColumn(15), source.lineColumn(18), source.lineColumn(19)
+    (15, 15, 21, 22)
+    """
+
+    def __init__(self, path, line, offset, construction, leading, segments):
+        self.path = path
+        self.line = line
+        self.offset = offset
+        self.construction = construction
+        # (expandedStart, expandedEnd, lineStart, lineEnd) for every expanded variable
+        self._leading = leading
+        self._segments = segments
+        self.start = self.lineColumn(0)
+        self.end = self.lineColumn(len(construction))
+
+    def __repr__(self):
+        return "<ConstructionSource %s:%s:%s-%s>" % (self.path, self.line, self.start, self.end)
+
+    def lineColumn(self, column):
+        """
+        Return the column in the line before variable expansion for a column in the construction.
+        A column inside an expanded variable maps to the start of the variable.
+        """
+        column += self._leading
+        shift = 0
+        for expandedStart, expandedEnd, lineStart, lineEnd in self._segments:
+            if column < expandedStart:
+                break
+            if column < expandedEnd:
+                return lineStart
+            shift = lineEnd - expandedEnd
+        return column + shift
+
+    def _get_textStart(self):
+        return self.offset + self.start
+
+    textStart = property(_get_textStart, doc="The character offset of the construction in the source text.")
+
+    def _get_textEnd(self):
+        return self.offset + self.end
+
+    textEnd = property(_get_textEnd, doc="The character offset of the end of the construction in the source text.")
+
+
+class ConstructionString(str):
+
+    """
+    A parsed glyph construction with a `constructionSource`.
+    """
+
+    constructionSource = None
+
+
+@_instrumented("variables")
+def _expandVariables(line, variables):
+    # expand variables and keep track of the expanded spans
+    expanded = []
+    segments = []
+    lineIndex = expandedIndex = 0
+    for match in variableFieldRe.finditer(line):
+        expanded.append(line[lineIndex:match.start()])
+        expandedIndex += match.start() - lineIndex
+        text = match.group()
+        if match.group(1) is not None:
+            text = text.format(**variables)
+        elif len(text) == 2:
+            text = text[0]
+        expanded.append(text)
+        segments.append((expandedIndex, expandedIndex + len(text), match.start(), match.end()))
+        expandedIndex += len(text)
+        lineIndex = match.end()
+    expanded.append(line[lineIndex:])
+    return "".join(expanded), segments
+
+
+def readGlyphConstructionSource(source):
+    """
+    Return the text and the path of a source, could be a file path, file object or a string.
+    The path is `None` for a string.
+
+    >>> readGlyphConstructionSource("agrave = a + grave")
+    ('agrave = a + grave', None)
+    """
+    if isinstance(source, str):
+        if os.path.exists(source):
+            with open(source) as f:
+                return f.read(), source
+        return source, None
+    elif hasattr(source, "read"):
+        return source.read(), getattr(source, "name", None)
+    raise GlyphBuilderError("Unreadable source: '%s'" % source)
+
+
+def _leadingTokens(line):
+    # the tokens up to the glyph name split without whitespace
+    tokens = []
+    for token in _iterLineTokens(line):
+        if token[1] != tokenWhitespace:
+            tokens.append(token)
+            if token[1:] == (tokenOperator, glyphNameSplit) or token[1] == tokenVariableDeclaration:
+                break
+    return tokens
+
+
+@_instrumented("parse")
 def ParseGlyphConstructionListFromString(source, font=None):
     """
     Parse glyph constructions from a big text, could be a file path, file object or a string.
@@ -1324,41 +3103,24 @@ def ParseGlyphConstructionListFromString(source, font=None):
     >>> result = ParseGlyphConstructionListFromString(txt, font)
     >>> result == ['aacute = a + acute']
     True
-    """
-    txt = None
-    if isinstance(source, str):
-        if os.path.exists(source):
-            with open(source) as f:
-                txt = f.read()
-        else:
-            txt = source
-    elif hasattr(source, "read"):
-        txt = source.read()
-    else:
-        raise GlyphBuilderError("Unreadable source: '%s'" % source)
 
+    # Every construction knows its source location
+    >>> result[0].constructionSource.line, txt[result[0].constructionSource.textStart:result[0].constructionSource.textEnd]
+    (3, 'aacute = a + acute')
+    """
+    txt, path = readGlyphConstructionSource(source)
     # parse all variable out of the text
-    txt, variables = ParseVariables(txt)
-    try:
-        # try to format the text with all the variables
-        txt = txt.format(**variables)
-    except KeyError as err:
-        raise GlyphBuilderError("Variable %s is missing" % err)
+    _, variables = ParseVariables(txt)
     # split all the lines, one line -> one construction
     lines = []
-    for line in txt.split("\n"):
-        # strip it
-        line = line.strip()
+    offset = 0
+    for lineNumber, line in enumerate(txt.split("\n")):
+        lineOffset = offset
+        offset += len(line) + 1
+        line = ParseGlyphConstructionLine(line, variables, font, lineNumber=lineNumber, offset=lineOffset, path=path)
         # do nothing if it is a comment
-        if line:
-            if line[0] == glyphCommentSuffixSplit:
-                continue
-            elif line[0] == shouldCheckGlyphExists:
-                if font:
-                    glyphName, _ = parseGlyphName(line[1:])
-                    if glyphName in font:
-                        continue
-                line = line[1:]
+        if line is None:
+            continue
         # do nothing with empty lines when there is no line added
         if not line and not lines:
             continue
@@ -1369,6 +3131,323 @@ def ParseGlyphConstructionListFromString(source, font=None):
     return lines
 
 
+def ParseGlyphConstructionLine(line, variables=None, font=None, lineNumber=0, offset=0, path=None):
+    """
+    Parse a single line of a glyph constructions text.
+    Variable declarations are removed and variables are formatted with the given variables.
+    Optionally a font can be provided to check and ignore existing glyph names.
+
+    This returns an optimized glyph construction, an empty string for an empty line
+    or `None` for a line without construction, like a comment.
+    A construction has a `constructionSource` with the `lineNumber`, the character `offset`
+    of the line and the source `path`.
+    Comments, declarations, flags and the glyph name are read from the tokens of the line,
+    see `TokenizeGlyphConstructionLine`, highlighting and parsing share the grammar.
+
+    >>> ParseGlyphConstructionLine("  agrave = a + {name}  ", dict(name="grave"))
+    'agrave = a + grave'
+    >>> ParseGlyphConstructionLine("$name = grave")
+    ''
+    >>> ParseGlyphConstructionLine("# a comment") is None
+    True
+    >>> ParseGlyphConstructionLine("?agrave = a + grave", font=testDummyFont()) is None
+    True
+    >>> try:
+    ...     ParseGlyphConstructionLine("agrave = a + {name}")
+    ... except GlyphBuilderError as err:
+    ...     print(err)
+    Variable 'name' is missing
+    """
+    if variables is None:
+        variables = {}
+    # the start of a line decides what the line is, the tokens are read up to the glyph name
+    tokens = _leadingTokens(line)
+    if tokens and tokens[0][1] == tokenVariableDeclaration:
+        # variables are collected with `ParseVariables`
+        line = line[:tokens[0][0]]
+        tokens = []
+    try:
+        # try to format the line with all the variables
+        formatted = line.format(**variables)
+    except KeyError as err:
+        raise GlyphBuilderError("Variable %s is missing" % err)
+    expanded, segments = _expandVariables(line, variables)
+    if expanded != formatted:
+        # a format specification, map the whole line
+        expanded, segments = formatted, [(0, len(formatted), 0, len(line))]
+    if expanded != line:
+        tokens = _leadingTokens(expanded)
+    tokens = [(tokenType, text) for _, tokenType, text in tokens]
+    # strip it
+    line = expanded.strip()
+    leading = len(expanded) - len(expanded.lstrip())
+    if tokens:
+        if tokens[0][0] == tokenComment:
+            return None
+        elif tokens[0] == (tokenFlag, shouldCheckGlyphExists):
+            if font and _tokensGlyphName(tokens[1:]) in font:
+                return None
+            line = line[1:]
+            leading += 1
+    construction = ConstructionString(line)
+    construction.constructionSource = ConstructionSource(path, lineNumber, offset, line, leading, segments)
+    return construction
+
+
+# tokenizer
+
+tokenWhitespace = "whitespace"
+tokenComment = "comment"
+tokenNote = "note"
+tokenFlag = "flag"
+tokenOperator = "operator"
+tokenConstructionName = "constructionName"
+tokenGlyphName = "glyphName"
+tokenSuffix = "suffix"
+tokenPosition = "position"
+tokenAnchorName = "anchorName"
+tokenNumber = "number"
+tokenUnicode = "unicode"
+tokenVariable = "variable"
+tokenVariableDeclaration = "variableDeclaration"
+tokenVariableName = "variableName"
+tokenVariableValue = "variableValue"
+tokenError = "error"
+
+tokenOperators = set((
+    glyphNameSplit, unicodeSplit, baseGlyphSplit, markGlyphSplit, positionSplit, positionXYSplit,
+    positionBaseSplit, metricsSuffixSplit, glyphMarkSuffixSplit, flipMarkGlyphSplit, applyKerningSplit,
+    glyphAtrributeAlternateSplit, explicitMathStart, explicitMathEnd, "-", "+", "/", "*", "(", ")"
+))
+tokenFlags = set((shouldCheckGlyphExists, shouldDecomposeResult, shouldAddSourceGlyphIfExists))
+tokenPositionNames = legalCalculatablePositions | legalFontInfoAttributes | legalGlyphMetricHorizontalPositions | legalGlyphMetricVerticalPositions
+
+_tokenWhitespaceRe = re.compile(r"\s+")
+_tokenVariableDeclarationRe = re.compile(r"(\%s)(\s*)([a-zA-Z_][a-zA-Z0-9_]*)(\s*)(\=)(\s*)(.*)" % variableDeclarationStart)
+_tokenVariableRe = re.compile(r"\{[a-zA-Z_][a-zA-Z0-9_]*\}")
+_tokenNumberRe = re.compile(r"(\d+\.?\d*|\.\d+)%?")
+_tokenHexRe = re.compile(r"[0-9a-fA-F]+")
+_tokenSuffixRe = re.compile(r"\%s[a-zA-Z0-9_]+" % glyphSuffixSplit)
+_tokenExplicitGlyphNameRe = re.compile(r"\%s[^%s]*\%s" % (explicitGlyphNameStart, explicitGlyphNameEnd, explicitGlyphNameEnd))
+# like the builder, a glyph name is everything up to the next splitter, `a-cy` is a single glyph name
+_tokenNameStops = "".join((
+    glyphNameSplit, unicodeSplit, baseGlyphSplit, markGlyphSplit, positionSplit, metricsSuffixSplit,
+    glyphCommentSuffixSplit, glyphMarkSuffixSplit, applyKerningSplit, explicitMathStart, explicitGlyphNameStart, "{}"
+))
+_tokenGlyphNameRe = re.compile(r"[^\s%s]+" % re.escape(_tokenNameStops))
+# the base glyph of a position, `a-cy:top`
+_tokenPositionBaseRe = re.compile(r"[^\s%s]+(?=\s*%s)" % (re.escape(_tokenNameStops + positionXYSplit + positionBaseSplit + flipMarkGlyphSplit + "()*/"), re.escape(positionBaseSplit)))
+# a metric taken from a single glyph, `^ a-cy, a-cy'`
+_tokenMetricGlyphNameRe = re.compile(r"[a-zA-Z_.][^\s%s]*(?=\s*([%s]|$))" % (
+    re.escape(_tokenNameStops + positionXYSplit + glyphAtrributeAlternateSplit + "()*/"),
+    re.escape(positionXYSplit + glyphAtrributeAlternateSplit + metricsSuffixSplit + glyphMarkSuffixSplit + unicodeSplit + glyphCommentSuffixSplit)
+))
+
+# the part of a construction the tokenizer is in
+_tokenPhaseFlags = "flags"
+_tokenPhaseName = "name"
+_tokenPhaseGlyphs = "glyphs"
+_tokenPhasePosition = "position"
+_tokenPhaseUnicode = "unicode"
+_tokenPhaseAttribute = "attribute"
+
+_tokenPhaseSplits = {
+    glyphNameSplit: _tokenPhaseGlyphs,
+    baseGlyphSplit: _tokenPhaseGlyphs,
+    markGlyphSplit: _tokenPhaseGlyphs,
+    positionSplit: _tokenPhasePosition,
+    unicodeSplit: _tokenPhaseUnicode,
+    metricsSuffixSplit: _tokenPhaseAttribute,
+    glyphMarkSuffixSplit: _tokenPhaseAttribute,
+}
+
+# attributes are split off before the components, only an other attribute ends an attribute
+_tokenAttributeSplits = set((unicodeSplit, metricsSuffixSplit, glyphMarkSuffixSplit))
+
+
+def TokenizeGlyphConstructionLine(line):
+    """
+    Tokenize a single line of a glyph constructions text with the grammar of the parser.
+    Return a list of `(column, tokenType, text)` tuples.
+    A construction never continues on the next line, every line is tokenized on its own.
+
+    >>> tokens = TokenizeGlyphConstructionLine("?agrave = a + grave@center,`top+10` | 00E0 # a note {name}")
+    >>> [(tokenType, text) for column, tokenType, text in tokens if tokenType != tokenWhitespace]
+    [('flag', '?'), ('constructionName', 'agrave'), ('operator', '='), ('glyphName', 'a'), ('operator', '+'), ('glyphName', 'grave'), ('operator', '@'), ('position', 'center'), ('operator', ','), ('operator', '`'), ('position', 'top'), ('operator', '+'), ('number', '10'), ('operator', '`'), ('operator', '|'), ('unicode', '00E0'), ('note', '# a note {name}')]
+    >>> tokens = TokenizeGlyphConstructionLine("$pos = center, top")
+    >>> [(tokenType, text) for column, tokenType, text in tokens if tokenType != tokenWhitespace]
+    [('variableDeclaration', '$'), ('variableName', 'pos'), ('operator', '='), ('variableValue', 'center, top')]
+    >>> tokens = TokenizeGlyphConstructionLine("f_i = f & i@{pos}:ogonek ^ 10, a")
+    >>> [(column, tokenType, text) for column, tokenType, text in tokens if tokenType not in (tokenWhitespace, tokenOperator)]
+    [(0, 'constructionName', 'f_i'), (6, 'glyphName', 'f'), (10, 'glyphName', 'i'), (12, 'variable', '{pos}'), (18, 'anchorName', 'ogonek'), (27, 'number', '10'), (31, 'glyphName', 'a')]
+    >>> "".join(text for _, _, text in TokenizeGlyphConstructionLine("  # comment"))
+    '  # comment'
+
+    Glyph names are split like the builder splits them.
+
+    >>> tokens = TokenizeGlyphConstructionLine("x-cy = a-cy + breve-cy@a-cy:center,`top-10` & \\\\i ^ a+10, x-cy'")
+    >>> [(tokenType, text) for column, tokenType, text in tokens if tokenType not in (tokenWhitespace, tokenOperator)]
+    [('constructionName', 'x-cy'), ('glyphName', 'a-cy'), ('glyphName', 'breve-cy'), ('glyphName', 'a-cy'), ('position', 'center'), ('position', 'top'), ('number', '10'), ('glyphName', 'i'), ('glyphName', 'a'), ('number', '10'), ('glyphName', 'x-cy')]
+    """
+    return list(_iterLineTokens(line))
+
+
+def _iterLineTokens(line):
+    position = 0
+    length = len(line)
+    phase = _tokenPhaseFlags
+    explicitMath = False
+    variableEnd = None
+    while position < length:
+        char = line[position]
+        match = _tokenWhitespaceRe.match(line, position)
+        if match:
+            yield position, tokenWhitespace, match.group()
+            position = match.end()
+            continue
+        if char == glyphCommentSuffixSplit:
+            tokenType = tokenComment if phase == _tokenPhaseFlags else tokenNote
+            yield position, tokenType, line[position:]
+            break
+        if phase == _tokenPhaseFlags:
+            match = _tokenVariableDeclarationRe.match(line, position)
+            if match:
+                groupTypes = (tokenVariableDeclaration, tokenWhitespace, tokenVariableName, tokenWhitespace, tokenOperator, tokenWhitespace, tokenVariableValue)
+                for index, tokenType in enumerate(groupTypes):
+                    if match.group(index + 1):
+                        yield match.start(index + 1), tokenType, match.group(index + 1)
+                break
+            if char in tokenFlags:
+                yield position, tokenFlag, char
+                position += 1
+                continue
+            phase = _tokenPhaseName
+        match = _tokenVariableRe.match(line, position)
+        if match:
+            yield position, tokenVariable, match.group()
+            position = variableEnd = match.end()
+            continue
+        if phase == _tokenPhaseUnicode:
+            match = _tokenHexRe.match(line, position)
+            if match:
+                yield position, tokenUnicode, match.group()
+                position = match.end()
+                continue
+        if position == variableEnd:
+            # a suffix of a variable, `{name}.cap`
+            match = _tokenSuffixRe.match(line, position)
+            if match:
+                yield position, tokenSuffix, match.group()
+                position = match.end()
+                continue
+        match = _tokenExplicitGlyphNameRe.match(line, position)
+        if match is None:
+            if phase in (_tokenPhaseName, _tokenPhaseGlyphs):
+                match = _tokenGlyphNameRe.match(line, position)
+            elif phase == _tokenPhasePosition:
+                match = _tokenPositionBaseRe.match(line, position)
+            elif phase == _tokenPhaseAttribute:
+                match = _tokenMetricGlyphNameRe.match(line, position)
+        if match:
+            tokenType = tokenConstructionName if phase == _tokenPhaseName else tokenGlyphName
+            yield position, tokenType, match.group()
+            position = match.end()
+            continue
+        match = glyphNameRe.match(line, position)
+        if match:
+            text = match.group()
+            if phase == _tokenPhasePosition:
+                tokenType = tokenPosition if text in tokenPositionNames else tokenAnchorName
+            else:
+                tokenType = tokenGlyphName
+            yield position, tokenType, text
+            position = match.end()
+            continue
+        match = _tokenNumberRe.match(line, position)
+        if match:
+            yield position, tokenNumber, match.group()
+            position = match.end()
+            continue
+        if char in tokenOperators:
+            yield position, tokenOperator, char
+            if char == explicitMathStart:
+                explicitMath = not explicitMath
+            elif not explicitMath and (phase not in (_tokenPhaseUnicode, _tokenPhaseAttribute) or char in _tokenAttributeSplits):
+                phase = _tokenPhaseSplits.get(char, phase)
+            position += 1
+            continue
+        yield position, tokenError, char
+        position += 1
+
+
+
+
+class GlyphConstructionTokenizer(object):
+
+    """
+    Keep the tokens of all lines of a glyph constructions text.
+    Only edited lines are tokenized again.
+
+    >>> tokenizer = GlyphConstructionTokenizer("agrave = a + grave" + chr(10) + "f_i = f & i")
+    >>> tokenizer.setText("agrave = a + grave" + chr(10) + "f_l = f & l")
+    [1]
+    >>> [text for _, tokenType, text in tokenizer.lineTokens(1) if tokenType == tokenGlyphName]
+    ['f', 'l']
+    >>> [(offset, tokenType) for offset, tokenType, text in tokenizer.tokens()][:3]
+    [(0, 'constructionName'), (6, 'whitespace'), (7, 'operator')]
+    """
+
+    def __init__(self, text=""):
+        self.lines = []
+        self._tokens = []
+        self.setText(text)
+
+    def setText(self, text):
+        """
+        Set a new text, return the indexes of the tokenized lines.
+        """
+        lines = text.split("\n")
+        oldLines = self.lines
+        start = 0
+        maxStart = min(len(lines), len(oldLines))
+        while start < maxStart and lines[start] == oldLines[start]:
+            start += 1
+        end = 0
+        maxEnd = maxStart - start
+        while end < maxEnd and lines[-end - 1] == oldLines[-end - 1]:
+            end += 1
+        if start == len(lines) == len(oldLines):
+            return []
+        return self.replaceLines(start, len(oldLines) - end, lines[start:len(lines) - end])
+
+    def replaceLines(self, start, end, lines):
+        """
+        Replace the lines from `start` up to `end`, return the indexes of the tokenized lines.
+        """
+        self.lines[start:end] = lines
+        self._tokens[start:end] = [TokenizeGlyphConstructionLine(line) for line in lines]
+        return list(range(start, start + len(lines)))
+
+    def lineTokens(self, index):
+        """
+        Return the `(column, tokenType, text)` tokens of a line.
+        """
+        return self._tokens[index]
+
+    def tokens(self):
+        """
+        Yield `(offset, tokenType, text)` tokens for the whole text, including the line endings as whitespace.
+        """
+        offset = 0
+        for index, line in enumerate(self.lines):
+            for column, tokenType, text in self._tokens[index]:
+                yield offset + column, tokenType, text
+            offset += len(line)
+            if index < len(self.lines) - 1:
+                yield offset, tokenWhitespace, "\n"
+                offset += 1
+
+
 # -----
 # Tests
 # -----
@@ -1392,6 +3471,10 @@ def testDummyFont():
     return font
 
 
+def testBuildSharedConstructionGlyphs(constructions):
+    return writeSharedConstructionGlyphs(BuildGlyphConstructions(constructions, testDummyFont()))
+
+
 def testDigestGlyph(glyph):
     from fontPens.digestPointPen import DigestPointPen
     pen = DigestPointPen()
@@ -1577,6 +3660,18 @@ def testGlyphConstructionBuilder_kerning():
     >>> result = GlyphConstructionBuilder(r"dest = a & \\foo", font)
     >>> testDigestGlyph(result)
     ('dest', 60, (), None, '', (('a', (1, 0, 0, 1, 0, 0), None), ('foo', (1, 0, 0, 1, 60, 0), None)))
+
+    >>> with ConstructionTrace() as trace:
+    ...     result = GlyphConstructionBuilder(r"dest = a & \\i", font)
+    >>> trace.glyphs[0].kerning
+    [(('a', 'i'), -100)]
+    >>> print(formatConstructionTrace(trace))
+    dest = a & \\i
+        a
+            matrix (1, 0, 0, 1, 0, 0)
+        i
+            matrix (1, 0, 0, 1, -40, 0)
+        kerning a i -100
     """
 
 
@@ -1605,6 +3700,9 @@ def testGlyphConstructionBuilder():
 if __name__ == "__main__":
     import sys
     import doctest
+    if shared_memory is None:
+        # shared memory needs py3.8
+        writeSharedConstructionGlyphs.__doc__ = None
     sys.exit(doctest.testmod().failed)
 
     import defcon
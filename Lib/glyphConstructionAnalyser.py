@@ -0,0 +1,269 @@
+"""
+Analyse constructed glyphs against the existing glyphs in a font.
+
+Every existing glyph is indexed once as a digest, see `glyphDigest`, constructed glyphs are compared with
+`diffGlyphDigests` like a diff, the analysis reports the component names, component transformations, width and unicodes.
+The analysis of a constructed glyph is kept until the constructed glyph or the existing glyph changes,
+so analysing a construction text after editing a single rule only analyses that rule again.
+
+The report is a plain object with an `asDict()` method, ready to be written as JSON.
+"""
+
+from collections import Counter
+
+from glyphConstructionDiff import glyphDigest, diffGlyphDigests
+
+
+class GlyphAnalysis(object):
+
+    """
+    The analysis of a single constructed glyph.
+
+    * `name`: the glyph name
+    * `exists`: the glyph exists in the font
+    * `missingComponents`: components in the construction but not in the existing glyph
+    * `unusedComponents`: components in the existing glyph but not in the construction
+    * `transformations`: a list of `(index, baseGlyph, existing, constructed)` differences,
+      only when both have the same components in the same order
+    * `width`: an `(existing, constructed)` tuple or `None`
+    * `unicodes`: an `(existing, constructed)` tuple or `None`
+    """
+
+    def __init__(self, glyph, existingDigest):
+        self.glyph = glyph
+        self.name = glyph.name
+        self.exists = existingDigest is not None
+        self.missingComponents = []
+        self.unusedComponents = []
+        self.transformations = []
+        self.width = None
+        self.unicodes = None
+        if existingDigest is None:
+            return
+        changes = diffGlyphDigests(existingDigest, glyphDigest(glyph))
+        if "components" in changes:
+            existingComponentNames, componentNames = changes["components"]
+            constructed = Counter(componentNames)
+            found = Counter(existingComponentNames)
+            self.missingComponents = sorted((constructed - found).elements())
+            self.unusedComponents = sorted((found - constructed).elements())
+        elif "transformations" in changes:
+            componentNames = existingDigest["components"]
+            for index, (existingTransformation, transformation) in enumerate(zip(*changes["transformations"])):
+                if transformation != existingTransformation:
+                    self.transformations.append((index, componentNames[index], existingTransformation, transformation))
+        self.width = changes.get("width")
+        self.unicodes = changes.get("unicodes")
+
+    def __repr__(self):
+        return "<GlyphAnalysis %s>" % self.name
+
+    def _get_isDifferent(self):
+        return bool(self.missingComponents or self.unusedComponents or self.transformations or self.width or self.unicodes)
+
+    isDifferent = property(_get_isDifferent)
+
+    def asDict(self):
+        return dict(
+            name=self.name,
+            exists=self.exists,
+            missingComponents=list(self.missingComponents),
+            unusedComponents=list(self.unusedComponents),
+            transformations=[dict(index=index, baseGlyph=baseGlyph, existing=list(existing), constructed=list(constructed)) for index, baseGlyph, existing, constructed in self.transformations],
+            width=None if self.width is None else list(self.width),
+            unicodes=None if self.unicodes is None else [list(unicodes) for unicodes in self.unicodes]
+        )
+
+
+class ConstructionAnalysisReport(object):
+
+    """
+    A structured construction analysis report.
+
+    * `missingGlyphs`: constructed glyph names not in the font
+    * `existingGlyphs`: constructed glyph names in the font
+    * `duplicateGlyphs`: glyph names constructed more than once
+    * `differentGlyphs`: a list of `GlyphAnalysis` objects of existing glyphs with differences
+    """
+
+    def __init__(self, analyses):
+        self.missingGlyphs = []
+        self.existingGlyphs = []
+        self.differentGlyphs = []
+        counts = Counter()
+        for analysis in analyses:
+            counts[analysis.name] += 1
+            if counts[analysis.name] > 1:
+                continue
+            if analysis.exists:
+                self.existingGlyphs.append(analysis.name)
+                if analysis.isDifferent:
+                    self.differentGlyphs.append(analysis)
+            else:
+                self.missingGlyphs.append(analysis.name)
+        self.duplicateGlyphs = [glyphName for glyphName, count in counts.items() if count > 1]
+
+    def asDict(self):
+        return dict(
+            missingGlyphs=list(self.missingGlyphs),
+            existingGlyphs=list(self.existingGlyphs),
+            duplicateGlyphs=list(self.duplicateGlyphs),
+            differentGlyphs=[analysis.asDict() for analysis in self.differentGlyphs]
+        )
+
+
+class ConstructionAnalyser(object):
+
+    """
+    Analyse constructed glyphs against a font.
+
+    Glyphs are given as `(key, glyph)` pairs, the key identifies a construction, like a line.
+    A key with the same glyph object as before is not analysed again.
+
+    >>> from glyphConstruction import testDummyFont, BuildGlyphConstructions
+    >>> font = testDummyFont()
+    >>> glyph = font.newGlyph("agrave")
+    >>> glyph.width = 60
+    >>> pen = glyph.getPointPen()
+    >>> pen.addComponent("a", (1, 0, 0, 1, 0, 0))
+    >>> pen.addComponent("grave", (1, 0, 0, 1, 0, 0))
+    >>> glyph = font.newGlyph("f_i")
+    >>> pen = glyph.getPointPen()
+    >>> pen.addComponent("f", (1, 0, 0, 1, 0, 0))
+    >>> glyphs = BuildGlyphConstructions(["agrave = a + grave@center,top", "f_i = f & i", "aacute = a + acute", "f_i = f & i"], font)
+    >>> analyser = ConstructionAnalyser(font)
+    >>> report = analyser.analyse(enumerate(glyphs))
+    >>> report.missingGlyphs, report.existingGlyphs, report.duplicateGlyphs
+    (['aacute'], ['agrave', 'f_i'], ['f_i'])
+    >>> [analysis.asDict() for analysis in report.differentGlyphs]
+    [{'name': 'agrave', 'exists': True, 'missingComponents': [], 'unusedComponents': [], 'transformations': [{'index': 1, 'baseGlyph': 'grave', 'existing': [1, 0, 0, 1, 0, 0], 'constructed': [1, 0, 0, 1, -10, 100]}], 'width': None, 'unicodes': None}, {'name': 'f_i', 'exists': True, 'missingComponents': ['i'], 'unusedComponents': [], 'transformations': [], 'width': [0, 170], 'unicodes': None}]
+    >>> print(formatConstructionAnalysis(report))  # doctest: +NORMALIZE_WHITESPACE
+    Duplicate Glyphs:
+    -----------------
+    	f_i
+    <BLANKLINE>
+    Missing Glyphs:
+    ---------------
+    	aacute
+    <BLANKLINE>
+    Existing Glyphs:
+    ----------------
+    	agrave
+    	f_i
+    <BLANKLINE>
+    Existing Glyphs with Missing Components:
+    ----------------------------------------
+    	Glyph f_i is missing i
+    <BLANKLINE>
+    Existing Glyphs with different Transformations:
+    -----------------------------------------------
+    	Glyph agrave component 1 grave: (1, 0, 0, 1, 0, 0) -> (1, 0, 0, 1, -10, 100)
+    <BLANKLINE>
+    Existing Glyphs with different Widths:
+    --------------------------------------
+    	Glyph f_i: 0 -> 170
+    <BLANKLINE>
+
+    Only changed glyphs are analysed again.
+
+    >>> font["f_i"].width = 170
+    >>> analyser.fontGlyphsChanged(["f_i"])
+    >>> glyphs[0] = BuildGlyphConstructions(["agrave = a + grave"], font)[0]
+    >>> report = analyser.analyse(enumerate(glyphs))
+    >>> analyser.analysedCount
+    7
+    >>> [analysis.name for analysis in report.differentGlyphs]
+    ['f_i']
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._index = dict()
+        self._analyses = dict()
+        self.analysedCount = 0
+
+    def _indexedGlyph(self, glyphName):
+        if glyphName not in self._index:
+            if glyphName in self.font:
+                self._index[glyphName] = glyphDigest(self.font[glyphName])
+            else:
+                self._index[glyphName] = None
+        return self._index[glyphName]
+
+    def analyseGlyph(self, key, glyph):
+        """
+        Return the analysis of a single constructed glyph.
+        """
+        analysis = self._analyses.get(key)
+        if analysis is None or analysis.glyph is not glyph:
+            analysis = self._analyses[key] = GlyphAnalysis(glyph, self._indexedGlyph(glyph.name))
+            self.analysedCount += 1
+        return analysis
+
+    def analyse(self, glyphs):
+        """
+        Analyse `(key, glyph)` pairs and return a `ConstructionAnalysisReport`.
+        Analyses of keys not given anymore are dropped.
+        """
+        analyses = dict()
+        for key, glyph in glyphs:
+            if glyph is None or glyph.name is None:
+                continue
+            analyses[key] = self.analyseGlyph(key, glyph)
+        self._analyses = analyses
+        return ConstructionAnalysisReport(analyses.values())
+
+    def fontGlyphsChanged(self, glyphNames):
+        """
+        Index the given changed, added or removed font glyphs again.
+        """
+        glyphNames = set(glyphNames)
+        for glyphName in glyphNames:
+            self._index.pop(glyphName, None)
+        for key, analysis in list(self._analyses.items()):
+            if analysis.name in glyphNames:
+                del self._analyses[key]
+
+    def fontChanged(self):
+        """
+        Index all font glyphs again.
+        """
+        self._index.clear()
+        self._analyses.clear()
+
+
+def _formatSection(title, lines):
+    return [title, "-" * len(title), "\n".join("\t%s" % line for line in lines), "\n"]
+
+
+def formatConstructionAnalysis(report):
+    """
+    Format a construction analysis report as readable text.
+    """
+    text = []
+    if report.duplicateGlyphs:
+        text += _formatSection("Duplicate Glyphs:", report.duplicateGlyphs)
+    if report.missingGlyphs:
+        text += _formatSection("Missing Glyphs:", report.missingGlyphs)
+    if report.existingGlyphs:
+        text += _formatSection("Existing Glyphs:", report.existingGlyphs)
+    sections = [
+        ("Existing Glyphs with Missing Components:", lambda analysis: ["Glyph %s is missing %s" % (analysis.name, ", ".join(analysis.missingComponents))] if analysis.missingComponents else []),
+        ("Existing Glyphs with different components:", lambda analysis: ["Glyph %s has no %s" % (analysis.name, ", ".join(analysis.unusedComponents))] if analysis.unusedComponents else []),
+        ("Existing Glyphs with different Transformations:", lambda analysis: ["Glyph %s component %s %s: %s -> %s" % ((analysis.name, ) + transformation) for transformation in analysis.transformations]),
+        ("Existing Glyphs with different Widths:", lambda analysis: ["Glyph %s: %s -> %s" % ((analysis.name, ) + analysis.width)] if analysis.width else []),
+        ("Existing Glyphs with different Unicodes:", lambda analysis: ["Glyph %s: %s -> %s" % (analysis.name, " ".join("%04X" % value for value in analysis.unicodes[0]), " ".join("%04X" % value for value in analysis.unicodes[1]))] if analysis.unicodes else []),
+    ]
+    for title, formatter in sections:
+        lines = []
+        for analysis in report.differentGlyphs:
+            lines.extend(formatter(analysis))
+        if lines:
+            text += _formatSection(title, lines)
+    return "\n".join(text)
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
@@ -0,0 +1,124 @@
+"""
+Build glyph constructions from asyncio code.
+
+Constructions are built on an executor, the default executor of the event loop unless given,
+against an immutable `FontSnapshot` taken on the calling thread.
+Glyphs are handed over as soon as they are constructed, the builder runs at most `bufferSize`
+glyphs ahead of the consumer. Closing the iterator or cancelling the awaiting task
+stops the build at the next construction.
+
+Pass a `FontSnapshot` to share one copy of the font between many builds.
+"""
+
+import asyncio
+import functools
+import threading
+
+from glyphConstruction import FontSnapshot, IterBuildGlyphConstructions, copy_context
+
+try:
+    _runningLoop = asyncio.get_running_loop
+except AttributeError:
+    # < py3.7, called from a coroutine this is the running loop
+    _runningLoop = asyncio.get_event_loop
+
+
+def _produceGlyphs(iterator, put, slots, cancelled):
+    try:
+        while True:
+            # wait for a free slot before building the next glyph
+            slots.acquire()
+            if cancelled.is_set():
+                return
+            try:
+                glyph = next(iterator)
+            except StopIteration:
+                return
+            put(("glyph", glyph))
+    except Exception as error:
+        put(("error", error))
+    finally:
+        put(("done", None))
+
+
+async def IterBuildGlyphConstructionsAsync(constructions, font, characterMap=None, errors=None, executor=None, bufferSize=16):
+    """
+    Build glyph constructions on an executor and yield the constructed glyphs one by one,
+    see `IterBuildGlyphConstructions`.
+
+    >>> import asyncio
+    >>> from glyphConstruction import ConstructionInstrumentation, testDummyFont
+    >>> font = testDummyFont()
+    >>> async def firstGlyphNames(count):
+    ...     with ConstructionInstrumentation() as instrumentation:
+    ...         glyphs = IterBuildGlyphConstructionsAsync(["f.alt%s = f" % index for index in range(100)], font, bufferSize=1)
+    ...         glyphNames = [(await glyphs.__anext__()).name for index in range(count)]
+    ...         await glyphs.aclose()
+    ...     return glyphNames, instrumentation.stages["rule"].count <= count + 1
+    >>> loop = asyncio.new_event_loop()
+    >>> loop.run_until_complete(firstGlyphNames(2))
+    (['f.alt0', 'f.alt1'], True)
+    >>> loop.close()
+    """
+    loop = _runningLoop()
+    if not isinstance(font, FontSnapshot):
+        font = FontSnapshot(font)
+    queue = asyncio.Queue()
+    slots = threading.Semaphore(bufferSize)
+    cancelled = threading.Event()
+    iterator = IterBuildGlyphConstructions(constructions, font, characterMap=characterMap, errors=errors)
+    put = functools.partial(loop.call_soon_threadsafe, queue.put_nowait)
+    if copy_context is None:
+        producer = loop.run_in_executor(executor, _produceGlyphs, iterator, put, slots, cancelled)
+    else:
+        # run the builder in the context of the caller to keep instrumentation and traces active
+        producer = loop.run_in_executor(executor, copy_context().run, _produceGlyphs, iterator, put, slots, cancelled)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "done":
+                break
+            if kind == "error":
+                raise value
+            slots.release()
+            yield value
+    finally:
+        cancelled.set()
+        # wake up a builder waiting for a free slot
+        slots.release()
+        await producer
+
+
+async def BuildGlyphConstructionsAsync(constructions, font, characterMap=None, errors=None, executor=None):
+    """
+    Build a list of glyph constructions on an executor, see `BuildGlyphConstructions`.
+
+    >>> import asyncio
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> loop = asyncio.new_event_loop()
+    >>> result = loop.run_until_complete(BuildGlyphConstructionsAsync(["agrave = a + grave@center,top", "agrave.alt = agrave & i"], font))
+    >>> [(glyph.name, glyph.width) for glyph in result]
+    [('agrave', 60), ('agrave.alt', 150)]
+
+    >>> async def cancelBuild():
+    ...     task = asyncio.ensure_future(BuildGlyphConstructionsAsync(["f.alt%s = f" % index for index in range(1000)], font))
+    ...     await asyncio.sleep(0)
+    ...     task.cancel()
+    ...     await asyncio.wait([task])
+    ...     return task.cancelled()
+    >>> loop.run_until_complete(cancelBuild())
+    True
+    >>> loop.close()
+    """
+    glyphs = IterBuildGlyphConstructionsAsync(constructions, font, characterMap=characterMap, errors=errors, executor=executor)
+    try:
+        return [glyph async for glyph in glyphs]
+    finally:
+        await glyphs.aclose()
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
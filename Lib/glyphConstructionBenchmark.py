@@ -0,0 +1,427 @@
+"""
+Benchmark glyph construction parsing and building.
+
+Every benchmark runs against a corpus: a synthetic font with a given number of glyphs
+and a construction text with all the `examples/*.glyphConstruction` files followed by
+synthetic constructions for every generated glyph. The synthetic glyphs have a contour,
+`top`, `bottom`, `_top` and `_bottom` anchors and are kerned with groups.
+
+* `parse`: parse the construction text
+* `positions`: resolve `center`, `top` and anchor positions for a sample of glyphs
+* `kerning`: kerning lookups with groups and exceptions for a sample of pairs
+* `margins`: build a sample of constructions setting margins
+* `decompose`: build and draw a sample of decomposed constructions
+* `build`: build all constructions
+* `threadedBuild`: build all constructions on a thread pool
+* `filteredBuild`: index the construction text and build the glyphs of a sample text
+
+Results are stored as JSON baselines and compared with a later run:
+
+    glyphconstruction-benchmark --sizes 1000,10000 --save baseline.json
+    glyphconstruction-benchmark --sizes 1000,10000 --compare baseline.json --fail
+
+A baseline stores the machine and Python version, only compare baselines from the same machine.
+"""
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from fontTools.pens.recordingPen import RecordingPen
+
+from glyphConstruction import GlyphConstructionTokenizer, BuildGlyphConstructions, ThreadedBuildGlyphConstructions, ParseGlyphConstructionListFromString, \
+    kernValueForGlyphPair, parsePosition, tokenGlyphName, tokenConstructionName, explicitGlyphNameStart
+
+
+benchmarkSizes = (1000, 10000, 65000)
+sampleSize = 1000
+kerningSampleSize = 200
+groupSize = 10
+
+examplesDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def exampleConstructionText(directory=examplesDirectory):
+    """
+    Return the text of all glyph construction files in the directory,
+    by default the examples directory of a source checkout.
+    A `ValueError` is raised when the directory has no glyph construction files.
+
+    >>> exampleConstructionText(os.path.join(examplesDirectory, "missing"))  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+        ...
+    ValueError: No glyph construction files found in '.../missing'
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.glyphConstruction")))
+    if not paths:
+        raise ValueError("No glyph construction files found in '%s'" % directory)
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    return "\n".join(texts)
+
+
+def referencedGlyphNames(text):
+    """
+    Return the sorted glyph names used but not constructed in a construction text.
+
+    >>> referencedGlyphNames("agrave = a + grave@center,top" + chr(10) + "agrave.alt = agrave")
+    ['a', 'grave']
+    """
+    tokenizer = GlyphConstructionTokenizer(text)
+    used = set()
+    constructed = set()
+    for _, tokenType, value in tokenizer.tokens():
+        if tokenType == tokenGlyphName:
+            if value.startswith(explicitGlyphNameStart):
+                value = value[1:-1]
+            used.add(value)
+        elif tokenType == tokenConstructionName:
+            constructed.add(value)
+    return sorted(used - constructed)
+
+
+def syntheticGlyphNames(glyphCount, glyphNames=()):
+    """
+    Return the given glyph names followed by generated names, `glyphCount` names in total.
+
+    >>> syntheticGlyphNames(4, ["a", "grave"])
+    ['a', 'grave', 'g00000', 'g00001']
+    """
+    glyphNames = list(glyphNames)
+    return glyphNames + ["g%05d" % index for index in range(glyphCount - len(glyphNames))]
+
+
+def syntheticFont(glyphCount, glyphNames=()):
+    """
+    Return a font with `glyphCount` glyphs, starting with the given glyph names.
+
+    >>> font = syntheticFont(40, ["a", "grave"])
+    >>> len(font), font["g00000"].bounds, [anchor.name for anchor in font["a"].anchors]
+    (40, (30, 0, 270, 520), ['top', 'bottom', '_top', '_bottom'])
+    >>> len(font.groups), len(font.kerning)
+    (8, 12)
+    """
+    from defcon import Font
+    font = Font()
+    font.info.unitsPerEm = 1000
+    font.info.ascender = 750
+    font.info.descender = -250
+    font.info.xHeight = 500
+    font.info.capHeight = 700
+    font.info.italicAngle = 0
+    glyphNames = syntheticGlyphNames(glyphCount, glyphNames)
+    for index, glyphName in enumerate(glyphNames):
+        glyph = font.newGlyph(glyphName)
+        width = 200 + index % 7 * 20
+        height = 500 + index % 5 * 10
+        pen = glyph.getPen()
+        pen.moveTo((30, 0))
+        pen.lineTo((30 + width, 0))
+        pen.lineTo((30 + width, height))
+        pen.lineTo((30, height))
+        pen.closePath()
+        glyph.width = width + 60
+        center = 30 + width / 2
+        glyph.appendAnchor(dict(name="top", x=center, y=height))
+        glyph.appendAnchor(dict(name="bottom", x=center, y=0))
+        glyph.appendAnchor(dict(name="_top", x=center, y=0))
+        glyph.appendAnchor(dict(name="_bottom", x=center, y=height))
+    # kerning groups, group kerning and exceptions
+    groups = dict()
+    kerning = dict()
+    for start in range(0, len(glyphNames), groupSize):
+        members = glyphNames[start:start + groupSize]
+        groupIndex = start // groupSize
+        groups["public.kern1.group%s" % groupIndex] = members
+        groups["public.kern2.group%s" % groupIndex] = members
+    groupCount = len(groups) // 2
+    for groupIndex in range(groupCount):
+        other = (groupIndex * 7 + 3) % groupCount
+        kerning["public.kern1.group%s" % groupIndex, "public.kern2.group%s" % other] = -10 - groupIndex % 40
+        member = groups["public.kern1.group%s" % groupIndex][0]
+        kerning[member, "public.kern2.group%s" % other] = -5
+        kerning[member, groups["public.kern2.group%s" % other][-1]] = 5
+    font.groups.update(groups)
+    font.kerning.update(kerning)
+    return font
+
+
+syntheticConstructionPatterns = [
+    "{name}.mark = {name} + grave@center,top",
+    "{name}.anchor = {name} + grave@top",
+    "{name}.below = {name} + grave@center,bottom",
+    "{name}.margins = {name} ^ 20, 20",
+    "*{name}.decompose = {name} + grave@center,top",
+    "{name}.kern = {name} &\\ {other}",
+]
+
+
+def syntheticConstructions(glyphNames):
+    """
+    Return a list of synthetic constructions for the given glyph names, cycling through all patterns.
+
+    >>> syntheticConstructions(["g00000", "g00001"])
+    ['g00000.mark = g00000 + grave@center,top', 'g00001.anchor = g00001 + grave@top']
+    """
+    constructions = []
+    for index, glyphName in enumerate(glyphNames):
+        pattern = syntheticConstructionPatterns[index % len(syntheticConstructionPatterns)]
+        other = glyphNames[(index * 11 + 1) % len(glyphNames)]
+        constructions.append(pattern.format(name=glyphName, other=other))
+    return constructions
+
+
+def _sample(items, count):
+    if len(items) <= count:
+        return list(items)
+    step = len(items) / count
+    return [items[int(index * step)] for index in range(count)]
+
+
+class BenchmarkCorpus(object):
+
+    """
+    A synthetic font with `glyphCount` glyphs and the example constructions plus synthetic constructions.
+
+    >>> corpus = BenchmarkCorpus(40, exampleText="agrave = a + grave@center,top")
+    >>> len(corpus.font), len(corpus.constructions), corpus.constructions[:2]
+    (40, 39, ['agrave = a + grave@center,top', 'g00000.mark = g00000 + grave@center,top'])
+    """
+
+    def __init__(self, glyphCount, exampleText=None):
+        if exampleText is None:
+            exampleText = exampleConstructionText()
+        self.glyphCount = glyphCount
+        baseGlyphNames = referencedGlyphNames(exampleText)
+        if "grave" not in baseGlyphNames:
+            baseGlyphNames.append("grave")
+        self.font = syntheticFont(glyphCount, baseGlyphNames)
+        self.glyphNames = list(self.font.keys())
+        generated = [glyphName for glyphName in syntheticGlyphNames(glyphCount, baseGlyphNames) if glyphName not in baseGlyphNames]
+        self.text = "\n".join([exampleText] + syntheticConstructions(generated))
+        self.constructions = ParseGlyphConstructionListFromString(self.text)
+        self.sampleGlyphNames = _sample(sorted(self.glyphNames), sampleSize)
+        self.kerningPairs = [(side1, side2) for side1, side2 in zip(_sample(sorted(self.glyphNames), kerningSampleSize), reversed(_sample(sorted(self.glyphNames), kerningSampleSize)))]
+        self.marginConstructions = _sample([construction for construction in self.constructions if ".margins =" in construction], sampleSize)
+        self.decomposeConstructions = _sample([construction for construction in self.constructions if construction.startswith("*")], sampleSize)
+
+
+def benchmarkParse(corpus):
+    ParseGlyphConstructionListFromString(corpus.text)
+
+
+def benchmarkPositions(corpus):
+    font = corpus.font
+    for glyphName in corpus.sampleGlyphNames:
+        parsePosition(glyphName, font, "center", "x")
+        parsePosition(glyphName, font, "top", "y")
+        parsePosition(glyphName, font, "top", "y", prefix="_", isBase=True)
+
+
+def benchmarkKerning(corpus):
+    font = corpus.font
+    for pair in corpus.kerningPairs:
+        kernValueForGlyphPair(font, pair)
+
+
+def benchmarkMargins(corpus):
+    BuildGlyphConstructions(corpus.marginConstructions, corpus.font)
+
+
+def benchmarkDecompose(corpus):
+    for glyph in BuildGlyphConstructions(corpus.decomposeConstructions, corpus.font):
+        glyph.draw(RecordingPen())
+
+
+def benchmarkBuild(corpus):
+    BuildGlyphConstructions(corpus.constructions, corpus.font)
+
+
+def benchmarkThreadedBuild(corpus):
+    ThreadedBuildGlyphConstructions(corpus.constructions, corpus.font)
+
+
+def benchmarkFilteredBuild(corpus):
+    from glyphConstructionIndex import ConstructionIndex
+    ConstructionIndex(corpus.text, corpus.font).build(text="Ça déjà vu, ŠĐČĆŽ")
+
+
+benchmarks = dict(
+    parse=benchmarkParse,
+    positions=benchmarkPositions,
+    kerning=benchmarkKerning,
+    margins=benchmarkMargins,
+    decompose=benchmarkDecompose,
+    build=benchmarkBuild,
+    threadedBuild=benchmarkThreadedBuild,
+    filteredBuild=benchmarkFilteredBuild,
+)
+
+
+def timeBenchmark(function, corpus, repeat=5):
+    """
+    Run a benchmark function `repeat` times and return a dictionary with the `min` and `median` time in seconds.
+    """
+    times = []
+    gcEnabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(corpus)
+            times.append(time.perf_counter() - start)
+    finally:
+        if gcEnabled:
+            gc.enable()
+    return dict(min=min(times), median=statistics.median(times))
+
+
+def benchmarkKey(name, size):
+    return "%s[%s]" % (name, size)
+
+
+def machineInfo():
+    return dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        system=platform.system(),
+        node=platform.node(),
+    )
+
+
+def runBenchmarks(sizes=benchmarkSizes, names=None, repeat=5, exampleText=None, log=None):
+    """
+    Run the benchmarks for every corpus size and return the results with the machine info.
+
+    >>> results = runBenchmarks(sizes=[40], names=["parse", "kerning"], repeat=1, exampleText="agrave = a + grave")
+    >>> sorted(results["results"])
+    ['kerning[40]', 'parse[40]']
+    >>> sorted(results["results"]["parse[40]"])
+    ['median', 'min']
+    """
+    if names is None:
+        names = list(benchmarks)
+    results = dict()
+    for size in sizes:
+        corpus = BenchmarkCorpus(size, exampleText=exampleText)
+        for name in names:
+            result = results[benchmarkKey(name, size)] = timeBenchmark(benchmarks[name], corpus, repeat)
+            if log is not None:
+                log("%s %.6fs" % (benchmarkKey(name, size), result["min"]))
+    return dict(machine=machineInfo(), results=results)
+
+
+def compareBenchmarks(baseline, current, threshold=.1):
+    """
+    Compare the minimum times of two benchmark runs and return a list of
+    `(key, baselineTime, currentTime, ratio, status)` tuples.
+    The status is `slower` or `faster` when the ratio differs more than `threshold`,
+    `same`, `new` when missing in the baseline or `missing` when missing in the current run.
+
+    >>> baseline = dict(results={"parse[1]": dict(min=1.0), "build[1]": dict(min=1.0), "kerning[1]": dict(min=1.0)})
+    >>> current = dict(results={"parse[1]": dict(min=1.5), "build[1]": dict(min=.5), "margins[1]": dict(min=1.0)})
+    >>> for row in compareBenchmarks(baseline, current): print(row)
+    ('build[1]', 1.0, 0.5, 0.5, 'faster')
+    ('kerning[1]', 1.0, None, None, 'missing')
+    ('margins[1]', None, 1.0, None, 'new')
+    ('parse[1]', 1.0, 1.5, 1.5, 'slower')
+    """
+    baselineResults = baseline["results"]
+    currentResults = current["results"]
+    rows = []
+    for key in sorted(set(baselineResults) | set(currentResults)):
+        if key not in baselineResults:
+            rows.append((key, None, currentResults[key]["min"], None, "new"))
+            continue
+        if key not in currentResults:
+            rows.append((key, baselineResults[key]["min"], None, None, "missing"))
+            continue
+        baselineTime = baselineResults[key]["min"]
+        currentTime = currentResults[key]["min"]
+        ratio = currentTime / baselineTime if baselineTime else 1
+        if ratio > 1 + threshold:
+            status = "slower"
+        elif ratio < 1 - threshold:
+            status = "faster"
+        else:
+            status = "same"
+        rows.append((key, baselineTime, currentTime, ratio, status))
+    return rows
+
+
+def _formatTime(value):
+    if value is None:
+        return "-"
+    return "%.6fs" % value
+
+
+def formatBenchmarkComparison(rows):
+    """
+    Format a benchmark comparison as a table.
+
+    >>> print(formatBenchmarkComparison([("parse[1]", 1.0, 1.5, 1.5, "slower"), ("build[1]", None, 1.0, None, "new")]))
+    benchmark  baseline   current    ratio  status
+    parse[1]   1.000000s  1.500000s  1.50x  slower
+    build[1]   -          1.000000s  -      new
+    """
+    table = [("benchmark", "baseline", "current", "ratio", "status")]
+    for key, baselineTime, currentTime, ratio, status in rows:
+        table.append((key, _formatTime(baselineTime), _formatTime(currentTime), "-" if ratio is None else "%.2fx" % ratio, status))
+    widths = [max(len(row[column]) for row in table) for column in range(len(table[0]))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in table)
+
+
+def main(args=None):
+    """
+    Run the benchmarks, optionally save them as baseline or compare them with a baseline.
+    """
+    parser = argparse.ArgumentParser(prog="glyphconstruction-benchmark", description="Benchmark glyph construction parsing and building.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in benchmarkSizes), help="comma separated synthetic font sizes")
+    parser.add_argument("--benchmarks", default=",".join(benchmarks), help="comma separated benchmark names: %s" % ", ".join(benchmarks))
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of every benchmark")
+    parser.add_argument("--examples", metavar="directory", default=examplesDirectory, help="directory with the glyph construction files of the corpus, by default the examples of a source checkout")
+    parser.add_argument("--save", metavar="path", help="save the results as JSON baseline")
+    parser.add_argument("--compare", metavar="path", help="compare the results with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=.1, help="relative difference reported as slower or faster")
+    parser.add_argument("--fail", action="store_true", help="exit with a non-zero status when a benchmark is slower")
+    options = parser.parse_args(args)
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    names = [name.strip() for name in options.benchmarks.split(",")]
+    for name in names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark '%s'" % name)
+    try:
+        exampleText = exampleConstructionText(options.examples)
+    except ValueError as err:
+        parser.error(str(err))
+    results = runBenchmarks(sizes, names, options.repeat, exampleText=exampleText, log=print)
+
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != results["machine"]:
+            print("warning: the baseline was made on a different machine or Python version")
+        rows = compareBenchmarks(baseline, results, options.threshold)
+        print(formatBenchmarkComparison(rows))
+        if options.fail and any(row[-1] == "slower" for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    import doctest
+    sys.exit(doctest.testmod().failed)
@@ -0,0 +1,269 @@
+"""
+A content addressed build cache for glyph constructions, stored in a directory.
+
+A constructed glyph is stored under a hash of the construction, the font info, font guidelines,
+the character map, and the digests of all glyphs the construction read while it was built.
+A construction is only built again when the construction or anything it read changed.
+Cached glyphs are restored without resolving any position.
+
+The directory can be kept between CI runs and shared between machines:
+entries are written atomically and only contain JSON.
+
+    manifests/   the glyph names a construction read, by construction hash
+    entries/     the constructed glyph or the error message, by input hash
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+
+from fontTools.pens.recordingPen import DecomposingRecordingPen
+
+from glyphConstruction import ConstructionGlyph, ConstructionOverlayFont, GlyphBuilderError, GlyphConstructionBuilder, RecordingFont, \
+    packOutline, unpackOutline, snapshotFontInfoAttributes, applyKerningSplit, __version__
+
+
+_formatVersion = "1"
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _digest(value):
+    return _hash(repr(value))
+
+
+def _points(objects, attributes):
+    return tuple(tuple(getattr(obj, attr, None) for attr in attributes) for obj in objects)
+
+
+def _fontKey(font, characterMap=None):
+    return _hash(
+        _formatVersion,
+        __version__,
+        _digest(tuple((attr, getattr(font.info, attr, None)) for attr in sorted(snapshotFontInfoAttributes))),
+        _digest(_points(getattr(font, "guidelines", ()), ("name", "x", "y", "angle"))),
+        _digest(sorted(characterMap.items())) if characterMap else ""
+    )
+
+
+def _kerningKey(font):
+    return _digest((sorted(font.kerning.items()), sorted((groupName, tuple(group)) for groupName, group in font.groups.items())))
+
+
+class _InputDigests(object):
+
+    """
+    Digests of the glyphs constructions read, a glyph digest covers the fully decomposed outline.
+    Call `changed` when a glyph changes, all digests using it are dropped.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._digests = dict()
+        self._readers = dict()
+
+    def __getitem__(self, glyphName):
+        digest = self._digests.get(glyphName)
+        if digest is None:
+            font = RecordingFont(self.font)
+            if glyphName in font:
+                glyph = font[glyphName]
+                try:
+                    pen = DecomposingRecordingPen(font, skipMissingComponents=True)
+                except TypeError:
+                    # older fontTools skip missing components
+                    pen = DecomposingRecordingPen(font)
+                glyph.draw(pen)
+                digest = _digest((
+                    glyph.width,
+                    getattr(glyph, "height", 0),
+                    tuple(glyph.unicodes),
+                    _points(glyph.anchors, ("name", "x", "y")),
+                    _points(getattr(glyph, "guidelines", ()), ("name", "x", "y", "angle")),
+                    pen.value
+                ))
+            else:
+                digest = "missing"
+            self._digests[glyphName] = digest
+            for dependency in font.recordedGlyphNames():
+                self._readers.setdefault(dependency, set()).add(glyphName)
+        return digest
+
+    def changed(self, glyphName):
+        self._digests.pop(glyphName, None)
+        for reader in self._readers.pop(glyphName, ()):
+            self._digests.pop(reader, None)
+
+
+def _encodeOutline(value):
+    if not value:
+        return None
+    operators, counts, coordinates, names = packOutline(value)
+    return [base64.b64encode(data).decode("ascii") for data in (operators, counts, coordinates)] + [list(names)]
+
+
+def _decodeOutline(data):
+    operators, counts, coordinates, names = data
+    return unpackOutline(tuple(base64.b64decode(value) for value in (operators, counts, coordinates)) + (tuple(names), ))
+
+
+def _glyphEntry(glyph):
+    return dict(
+        name=glyph.name,
+        width=glyph.width,
+        unicodes=list(glyph.unicodes),
+        note=glyph.note,
+        markColor=None if glyph.markColor is None else list(glyph.markColor),
+        components=[[baseGlyph, list(transformation)] for baseGlyph, transformation in glyph.components],
+        shouldDecompose=glyph.shouldDecompose,
+        outline=_encodeOutline(glyph.source.value)
+    )
+
+
+def _restoreGlyph(entry, font, construction):
+    glyph = ConstructionGlyph(font)
+    glyph.name = entry["name"]
+    glyph.width = entry["width"]
+    glyph.unicodes = tuple(entry["unicodes"])
+    glyph.note = entry["note"]
+    if entry["markColor"] is not None:
+        glyph.markColor = tuple(entry["markColor"])
+    glyph.components = [(baseGlyph, tuple(transformation)) for baseGlyph, transformation in entry["components"]]
+    glyph.shouldDecompose = entry["shouldDecompose"]
+    if entry["outline"] is not None:
+        glyph.source.value = _decodeOutline(entry["outline"])
+    glyph.constructionSource = getattr(construction, "constructionSource", None)
+    return glyph
+
+
+class ConstructionBuildCache(object):
+
+    """
+    Build glyph constructions with a build cache in the directory `path`.
+
+    * `hits`: the amount of constructions restored from the cache
+    * `misses`: the amount of constructions built
+
+    >>> from glyphConstruction import BuildGlyphConstructions, testDummyFont
+    >>> font = testDummyFont()
+    >>> constructions = ["agrave = a + grave@center,top", "agrave.alt = agrave & i", "f_i = f & i", "broken = a + grave@1,2,3"]
+    >>> cache = ConstructionBuildCache(tempfile.mkdtemp())
+    >>> errors = []
+    >>> glyphs = cache.build(constructions, font, errors=errors)
+    >>> cache.hits, cache.misses, errors
+    (0, 4, [('broken = a + grave@1,2,3', 'Mark positions should have 6 or 2 options')])
+
+    >>> from fontTools.pens.recordingPen import RecordingPen
+    >>> def glyphData(glyphs):
+    ...     result = []
+    ...     for glyph in glyphs:
+    ...         pen = RecordingPen()
+    ...         glyph.draw(pen)
+    ...         result.append((glyph.name, glyph.width, glyph.components, glyph.bounds, pen.value))
+    ...     return result
+    >>> errors = []
+    >>> glyphs = cache.build(constructions, font, errors=errors)
+    >>> cache.hits, cache.misses, len(errors)
+    (4, 4, 1)
+    >>> glyphData(glyphs) == glyphData(BuildGlyphConstructions(constructions, font, errors=[]))
+    True
+
+    Only constructions reading a changed glyph are built again.
+
+    >>> font["i"].move((10, 0))
+    >>> glyphs = cache.build(constructions, font, errors=[])
+    >>> cache.hits, cache.misses
+    (6, 6)
+    >>> glyphData(glyphs) == glyphData(BuildGlyphConstructions(constructions, font, errors=[]))
+    True
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def _filePath(self, kind, key):
+        return os.path.join(self.path, kind, key[:2], key[2:] + ".json")
+
+    def _read(self, kind, key):
+        try:
+            with open(self._filePath(kind, key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, kind, key, data):
+        path = self._filePath(kind, key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # concurrent builds never see a partially written entry
+        handle, temporaryPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, separators=(",", ":")))
+        os.replace(temporaryPath, path)
+
+    def _inputKey(self, constructionKey, glyphNames, digests):
+        return _hash(constructionKey, *["%s:%s" % (glyphName, digests[glyphName]) for glyphName in glyphNames])
+
+    def build(self, constructions, font, characterMap=None, errors=None):
+        """
+        Build a list of glyph constructions, see `BuildGlyphConstructions`.
+        """
+        overlayFont = ConstructionOverlayFont(font)
+        digests = _InputDigests(overlayFont)
+        fontKey = _fontKey(font, characterMap)
+        kerningKey = None
+        result = []
+        for construction in constructions:
+            if not construction:
+                continue
+            constructionKey = _hash(fontKey, str(construction))
+            if applyKerningSplit in construction:
+                if kerningKey is None:
+                    kerningKey = _kerningKey(font)
+                constructionKey = _hash(constructionKey, kerningKey)
+            entry = None
+            glyphNames = self._read("manifests", constructionKey)
+            if glyphNames is not None:
+                entry = self._read("entries", self._inputKey(constructionKey, glyphNames, digests))
+            if entry is None:
+                self.misses += 1
+                recordingFont = RecordingFont(overlayFont)
+                try:
+                    entry = _glyphEntry(GlyphConstructionBuilder(construction, recordingFont, characterMap=characterMap))
+                except GlyphBuilderError as err:
+                    entry = dict(error=str(err))
+                glyphNames = sorted(recordingFont.recordedGlyphNames())
+                self._write("manifests", constructionKey, glyphNames)
+                self._write("entries", self._inputKey(constructionKey, glyphNames, digests), entry)
+            else:
+                self.hits += 1
+            if "error" in entry:
+                if errors is None:
+                    raise GlyphBuilderError(entry["error"])
+                errors.append((construction, entry["error"]))
+                continue
+            if entry["name"] is None:
+                continue
+            glyph = _restoreGlyph(entry, overlayFont, construction)
+            # keep the overlay font alive as long as the constructed glyphs
+            glyph._glyphset = lambda: overlayFont
+            overlayFont[glyph.name] = glyph
+            digests.changed(glyph.name)
+            result.append(glyph)
+        return result
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
@@ -0,0 +1,674 @@
+"""
+Build, lint, diff, explain, watch and find the users of glyph constructions from the command line.
+
+    glyphconstruction build MyFont.ufo -r accents.glyphConstruction
+    glyphconstruction lint MyFamily.designspace -r accents.glyphConstruction --json report.json
+    glyphconstruction diff MyFont.ufo -r accents.glyphConstruction --glyphs "a*"
+    glyphconstruction explain MyFont.ufo -r accents.glyphConstruction --glyphs agrave
+    glyphconstruction watch MyFont.ufo -r accents.glyphConstruction
+    glyphconstruction uses MyFont.ufo -r accents.glyphConstruction --dependency glyph:acute.cap --dependency anchor:top
+
+Fonts are UFO paths or designspace paths, a designspace adds all its source UFOs.
+Every font is processed in a worker process, the number of workers is set with `--workers`,
+so all fonts of a family are handled by a single command importing everything once per worker.
+With `--daemon` the command is sent to a running `glyphconstruction-daemon`,
+which keeps fonts, parsed rules and builds in memory between commands.
+With `--build-cache` constructed glyphs are kept in a directory, for example between CI runs,
+and only constructions reading a changed glyph are built again.
+
+Glyph name filters (`--glyphs`) are comma separated names or wildcard patterns,
+only the constructions of the filtered glyphs and of the constructed glyphs they read are parsed and built,
+see `ConstructionIndex`, errors in other constructions are not reported.
+
+`watch` keeps running and only rebuilds the constructions affected by a changed rule file or glyph.
+
+`uses` reports the constructions consuming a glyph, anchor, guide, font metric or kerning pair,
+given as `kind:name`, like `anchor:top`, `metric:xHeight` or `kerning:A,V`.
+With `--transitive` constructions reading glyphs constructed by those are reported too.
+
+The command exits with a non-zero status when a construction or a font has an error,
+`lint` also fails on warnings with `--strict` and `diff` also fails on differences with `--exit-code`.
+"""
+
+import argparse
+from collections import Counter
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from glyphConstruction import BuildGlyphConstructions, ParseGlyphConstructionListFromString, ConstructionInstrumentation, formatConstructionInstrumentation, \
+    ConstructionTrace, formatGlyphTrace, parseConstructedGlyphName, parseReferencedGlyphNames
+from glyphConstructionDiff import DiffGlyphConstructions, formatGlyphConstructionDiff, _round
+from glyphConstructionIndex import ConstructionIndex, IndexGlyphConstructions, dependencyKinds, dependencyKerning
+
+
+def expandFontPaths(paths):
+    """
+    Return a list of UFO paths, designspace paths are expanded to the paths of their sources.
+    """
+    result = []
+    for path in paths:
+        if os.path.splitext(path)[1].lower() == ".designspace":
+            from fontTools.designspaceLib import DesignSpaceDocument
+            document = DesignSpaceDocument.fromfile(path)
+            for source in document.sources:
+                if source.path is not None and source.layerName is None:
+                    result.append(os.path.normpath(source.path))
+        else:
+            result.append(os.path.normpath(path))
+    # keep the first occurrence of every font
+    return list(dict.fromkeys(result))
+
+
+def parseGlyphNameFilter(filters):
+    """
+    Return a function testing a glyph name against comma separated names or wildcard patterns,
+    or `None` when there are no filters.
+
+    >>> test = parseGlyphNameFilter(["agrave,a*.sc", "f_i"])
+    >>> [glyphName for glyphName in ["agrave", "aacute", "aacute.sc", "f_i", "f_l"] if test(glyphName)]
+    ['agrave', 'aacute.sc', 'f_i']
+    >>> parseGlyphNameFilter([]) is None
+    True
+    """
+    patterns = []
+    for value in filters or []:
+        patterns.extend(pattern.strip() for pattern in value.split(",") if pattern.strip())
+    if not patterns:
+        return None
+    names = set(pattern for pattern in patterns if not any(char in pattern for char in "*?["))
+    patterns = [pattern for pattern in patterns if pattern not in names]
+
+    def test(glyphName):
+        if glyphName in names:
+            return True
+        return any(fnmatch.fnmatchcase(glyphName, pattern) for pattern in patterns)
+
+    return test
+
+
+def readConstructions(ruleFiles, font):
+    """
+    Parse all rule files for the given font and return a single list of constructions.
+    """
+    constructions = []
+    for ruleFile in ruleFiles:
+        constructions.extend(ParseGlyphConstructionListFromString(ruleFile, font))
+    return constructions
+
+
+def indexConstructions(ruleFiles, font, characterMap=None):
+    """
+    Return a `ConstructionIndex` for every rule file for the given font.
+    """
+    return [ConstructionIndex(ruleFile, font, characterMap=characterMap) for ruleFile in ruleFiles]
+
+
+def selectConstructions(indexes, test):
+    """
+    Return the constructions of the glyphs passing the glyph name `test`, from a list of indexes,
+    with the constructions of all glyphs they read, also from the other indexes.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> indexes = [
+    ...     ConstructionIndex(chr(10).join(["agrave = a + grave@center,top", "aacute = a + acute@center,top"]), font),
+    ...     ConstructionIndex(chr(10).join(["f_i = f & i", "agrave.alt = agrave & i", "broken = a + grave@1,2,3"]), font),
+    ... ]
+    >>> selectConstructions(indexes, parseGlyphNameFilter(["*.alt"]))
+    ['agrave = a + grave@center,top', 'agrave.alt = agrave & i']
+    """
+    glyphNames = set()
+    for index in indexes:
+        glyphNames.update(glyphName for glyphName in index.glyphNames if test(glyphName))
+    while True:
+        selections = [index.select(glyphNames=glyphNames) for index in indexes]
+        referenced = set(glyphNames)
+        for constructions in selections:
+            for construction in constructions:
+                referenced.update(parseReferencedGlyphNames(construction))
+        if referenced == glyphNames:
+            break
+        # a selected construction reads a glyph constructed in another index
+        glyphNames = referenced
+    return [construction for constructions in selections for construction in constructions]
+
+
+def _readConstructions(fontPath, options, cache=None):
+    test = parseGlyphNameFilter(options.get("glyphs"))
+    if cache is not None:
+        font = cache.font(fontPath)
+        if test is None:
+            return font, cache.constructions(fontPath, options["rules"])
+        return font, selectConstructions(cache.indexes(fontPath, options["rules"], _characterMap(options)), test)
+    import defcon
+    font = defcon.Font(fontPath)
+    if test is None:
+        return font, readConstructions(options["rules"], font)
+    return font, selectConstructions(indexConstructions(options["rules"], font, _characterMap(options)), test)
+
+
+def constructionLocation(source):
+    """
+    Return a `path:line` description of a `ConstructionSource`.
+    """
+    if source is None:
+        return "<unknown>"
+    return "%s:%s" % (source.path or "<string>", source.line + 1)
+
+
+def writeConstructionGlyph(glyph, font, markColor=None):
+    """
+    Write a constructed glyph into a font, replacing the contours and components of an existing glyph.
+    Unicodes are only changed when the construction provides unicodes,
+    anchors, guidelines and the lib of an existing glyph are kept.
+
+    >>> from glyphConstruction import BuildGlyphConstructions, testDummyFont
+    >>> font = testDummyFont()
+    >>> font["agrave"].unicodes = [0x00E0]
+    >>> font["agrave"].appendAnchor(dict(name="top", x=30, y=300))
+    >>> font["agrave"].lib["com.example.key"] = "value"
+    >>> for glyph in BuildGlyphConstructions(["agrave = a + grave@center,top", "aacute = a + grave | 00E1"], font):
+    ...     writeConstructionGlyph(glyph, font)
+    >>> agrave = font["agrave"]
+    >>> agrave.unicodes, [anchor.name for anchor in agrave.anchors], dict(agrave.lib), len(agrave), len(agrave.components)
+    ([224], ['top'], {'com.example.key': 'value'}, 0, 2)
+    >>> font["aacute"].unicodes
+    [225]
+    """
+    if glyph.name in font:
+        dest = font[glyph.name]
+        dest.clearContours()
+        dest.clearComponents()
+    else:
+        dest = font.newGlyph(glyph.name)
+    glyph.draw(dest.getPen())
+    if glyph.unicodes:
+        dest.unicodes = list(glyph.unicodes)
+    dest.note = glyph.note
+    if glyph.markColor:
+        dest.markColor = tuple(glyph.markColor)
+    elif markColor:
+        dest.markColor = markColor
+    dest.width = glyph.width
+
+
+def _characterMap(options):
+    if not options.get("autoUnicodes"):
+        return None
+    from fontTools.agl import AGL2UV
+    return AGL2UV
+
+
+def _errorDict(construction, message):
+    return dict(construction=str(construction), location=constructionLocation(getattr(construction, "constructionSource", None)), message=message)
+
+
+def _buildGlyphs(constructions, font, options, errors, reuse=True):
+    if reuse and options.get("buildCache"):
+        from glyphConstructionBuildCache import ConstructionBuildCache
+        return ConstructionBuildCache(options["buildCache"]).build(constructions, font, characterMap=_characterMap(options), errors=errors)
+    return BuildGlyphConstructions(constructions, font, characterMap=_characterMap(options), errors=errors)
+
+
+def _buildFont(fontPath, options, cache=None, reuse=True):
+    if cache is not None:
+        return cache.build(fontPath, options, reuse=reuse)
+    font, constructions = _readConstructions(fontPath, options)
+    errors = []
+    glyphs = _buildGlyphs(constructions, font, options, errors, reuse)
+    return font, constructions, glyphs, errors
+
+
+def _filterGlyphs(glyphs, options):
+    test = parseGlyphNameFilter(options.get("glyphs"))
+    result = dict()
+    for glyph in glyphs:
+        if test is None or test(glyph.name):
+            # the last construction of a glyph wins
+            result[glyph.name] = glyph
+    return list(result.values())
+
+
+def buildCommand(fontPath, options, cache=None):
+    """
+    Build the constructions and write the constructed glyphs into the font.
+    """
+    font, _, glyphs, errors = _buildFont(fontPath, options, cache)
+    if cache is not None:
+        # constructed glyphs are written into the font, also without saving it
+        cache.forget(fontPath)
+    written = []
+    skipped = []
+    for glyph in _filterGlyphs(glyphs, options):
+        if glyph.name in font and not options.get("overwrite", True):
+            skipped.append(glyph.name)
+            continue
+        writeConstructionGlyph(glyph, font, options.get("markColor"))
+        written.append(glyph.name)
+    output = fontPath
+    if options.get("output"):
+        output = os.path.join(options["output"], os.path.basename(fontPath))
+    if written and not options.get("dryRun"):
+        font.save(output)
+    return dict(font=fontPath, output=output, written=written, skipped=skipped, errors=[_errorDict(*error) for error in errors], warnings=[])
+
+
+def lintCommand(fontPath, options, cache=None):
+    """
+    Build the constructions without writing, report errors,
+    duplicate constructions and components which are not in the font.
+    """
+    font, _, glyphs, errors = _buildFont(fontPath, options, cache)
+    counts = Counter(glyph.name for glyph in glyphs)
+    warnings = []
+    for glyphName in sorted(glyphName for glyphName, count in counts.items() if count > 1):
+        warnings.append(dict(glyph=glyphName, message="Glyph '%s' is constructed more than once" % glyphName))
+    for glyph in _filterGlyphs(glyphs, options):
+        for baseGlyph, _ in glyph.components:
+            if baseGlyph not in font and baseGlyph not in counts:
+                warnings.append(dict(glyph=glyph.name, message="Glyph '%s' does not exist" % baseGlyph))
+    return dict(font=fontPath, glyphs=[glyph.name for glyph in _filterGlyphs(glyphs, options)], errors=[_errorDict(*error) for error in errors], warnings=warnings)
+
+
+def diffCommand(fontPath, options, cache=None):
+    """
+    Compare the constructions with the existing glyphs in the font.
+    """
+    font, constructions = _readConstructions(fontPath, options, cache)
+    errors = []
+    diff = DiffGlyphConstructions(constructions, font, characterMap=_characterMap(options), markColor=options.get("markColor"), overwrite=options.get("overwrite", True), errors=errors)
+    test = parseGlyphNameFilter(options.get("glyphs"))
+    if test is not None:
+        diff = dict((glyphName, changes) for glyphName, changes in diff.items() if test(glyphName))
+    return dict(font=fontPath, diff=diff, text=formatGlyphConstructionDiff(diff), errors=[_errorDict(*error) for error in errors], warnings=[])
+
+
+def explainCommand(fontPath, options, cache=None):
+    """
+    Explain how the filtered glyphs are constructed: the rule, its location and the resolved components.
+    """
+    glyphTraces = dict()
+    if options.get("trace"):
+        with ConstructionTrace(parseGlyphNameFilter(options.get("glyphs"))) as trace:
+            # a cached build has no traces
+            font, _, glyphs, errors = _buildFont(fontPath, options, cache, reuse=False)
+        for glyphTrace in trace.glyphs:
+            # the last construction of a glyph wins
+            glyphTraces[glyphTrace.name] = glyphTrace
+    else:
+        font, _, glyphs, errors = _buildFont(fontPath, options, cache)
+    explanations = []
+    for glyph in _filterGlyphs(glyphs, options):
+        construction = glyph.constructionSource.construction if glyph.constructionSource is not None else None
+        glyphTrace = glyphTraces.get(glyph.name)
+        explanations.append(dict(
+            glyph=glyph.name,
+            construction=construction,
+            location=constructionLocation(glyph.constructionSource),
+            components=[dict(baseGlyph=baseGlyph, transformation=[_round(value) for value in transformation]) for baseGlyph, transformation in glyph.components],
+            width=_round(glyph.width),
+            unicodes=list(glyph.unicodes),
+            decompose=glyph.shouldDecompose,
+            exists=glyph.name in font,
+            trace=None if glyphTrace is None else glyphTrace.asDict(),
+            traceText=None if glyphTrace is None else formatGlyphTrace(glyphTrace),
+        ))
+    return dict(font=fontPath, explanations=explanations, errors=[_errorDict(*error) for error in errors], warnings=[])
+
+
+def _parseDependency(value):
+    kind, separator, name = value.partition(":")
+    if not separator or kind not in dependencyKinds or not name:
+        raise argparse.ArgumentTypeError("A dependency is given as kind:name, the kind is one of %s" % ", ".join(dependencyKinds))
+    if kind == dependencyKerning:
+        pair = tuple(name.split(","))
+        if len(pair) != 2:
+            raise argparse.ArgumentTypeError("A kerning pair is given as kerning:left,right")
+        return kind, pair
+    return kind, name
+
+
+def usesCommand(fontPath, options, cache=None):
+    """
+    Report the constructions consuming the given dependencies, or all dependencies.
+    """
+    if cache is not None:
+        font = cache.font(fontPath)
+        constructions = cache.constructions(fontPath, options["rules"])
+    else:
+        import defcon
+        font = defcon.Font(fontPath)
+        constructions = readConstructions(options["rules"], font)
+    errors = []
+    _, reverseIndex = IndexGlyphConstructions(constructions, font, characterMap=_characterMap(options), errors=errors)
+    # dependencies sent to a daemon are JSON lists
+    dependencies = [(kind, tuple(name) if isinstance(name, list) else name) for kind, name in options.get("dependencies") or ()]
+    if not dependencies:
+        dependencies = [(kind, name) for kind in dependencyKinds for name in sorted(reverseIndex.names(kind))]
+    test = parseGlyphNameFilter(options.get("glyphs"))
+    uses = []
+    for kind, name in dependencies:
+        if options.get("transitive"):
+            consumers = reverseIndex.affected(kind, name)
+        else:
+            consumers = reverseIndex.consumers(kind, name)
+        users = []
+        for construction in consumers:
+            glyphName = parseConstructedGlyphName(construction)
+            if test is None or (glyphName is not None and test(glyphName)):
+                users.append(dict(glyph=glyphName, construction=str(construction), location=constructionLocation(getattr(construction, "constructionSource", None))))
+        uses.append(dict(kind=kind, name=name, constructions=users))
+    return dict(font=fontPath, uses=uses, errors=[_errorDict(*error) for error in errors], warnings=[])
+
+
+commands = dict(
+    build=buildCommand,
+    lint=lintCommand,
+    diff=diffCommand,
+    explain=explainCommand,
+    uses=usesCommand,
+)
+
+
+def _runCommand(command, fontPath, options, cache=None):
+    try:
+        if not options.get("timings"):
+            return commands[command](fontPath, options, cache)
+        with ConstructionInstrumentation() as instrumentation:
+            report = commands[command](fontPath, options, cache)
+        report["timings"] = instrumentation.asDict()
+        report["timingsText"] = formatConstructionInstrumentation(instrumentation)
+        return report
+    except Exception as err:
+        # a broken font or rule file should not stop the other fonts
+        return dict(font=fontPath, errors=[dict(construction=None, location=fontPath, message="%s: %s" % (err.__class__.__name__, err))], warnings=[])
+
+
+def runCommand(command, fontPaths, options, workers=1):
+    """
+    Run a command for every font and return the font reports in the order of the fonts.
+    """
+    if workers <= 1 or len(fontPaths) <= 1:
+        return [_runCommand(command, fontPath, options) for fontPath in fontPaths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_runCommand, [command] * len(fontPaths), fontPaths, [options] * len(fontPaths)))
+
+
+def watchFonts(fontPaths, options, interval=.5, stop=None, log=print):
+    """
+    Rebuild and write the constructions affected by changes of the rule files or the fonts,
+    until the `stop` event is set, or forever.
+
+    >>> import tempfile, threading
+    >>> from glyphConstruction import testDummyFont
+    >>> cwd = os.getcwd()
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> os.chdir(directory.name)
+    >>> testDummyFont().save("test.ufo")
+    >>> with open("test.glyphConstruction", "w") as f:
+    ...     _ = f.write("agrave = a + grave@center,top")
+    >>> stop = threading.Event()
+    >>> def log(line):
+    ...     print(line)
+    ...     stop.set()
+    >>> watchFonts(["test.ufo"], dict(rules=["test.glyphConstruction"]), stop=stop, log=log)
+    test.ufo: agrave
+
+    >>> os.chdir(cwd)
+    >>> directory.cleanup()
+    """
+    from glyphConstructionWatch import ConstructionWatcher
+
+    def written(watcher, glyphNames):
+        log("%s: %s" % (watcher.fontPath, " ".join(glyphNames)))
+
+    watchers = [
+        ConstructionWatcher(fontPath, options["rules"], characterMap=_characterMap(options), markColor=options.get("markColor"), overwrite=options.get("overwrite", True), callback=written)
+        for fontPath in fontPaths
+    ]
+    while stop is None or not stop.is_set():
+        for watcher in watchers:
+            watcher.poll()
+        if stop is None:
+            time.sleep(interval)
+        else:
+            stop.wait(interval)
+
+
+def _formatReport(command, report):
+    lines = [report["font"]]
+    if command == "build":
+        lines.append("    written: %s" % (" ".join(report.get("written", [])) or "-"))
+        if report.get("skipped"):
+            lines.append("    skipped: %s" % " ".join(report["skipped"]))
+    elif command == "diff":
+        lines.extend("    %s" % line for line in report.get("text", "").splitlines())
+    elif command == "explain":
+        for explanation in report.get("explanations", []):
+            lines.append("    %s: %s" % (explanation["glyph"], explanation["construction"]))
+            lines.append("        defined at %s" % explanation["location"])
+            lines.append("        width %s%s" % (explanation["width"], ", decomposed" if explanation["decompose"] else ""))
+            if explanation.get("traceText"):
+                lines.extend("    %s" % line for line in explanation["traceText"].splitlines()[1:])
+            else:
+                for component in explanation["components"]:
+                    lines.append("        %s %s" % (component["baseGlyph"], tuple(component["transformation"])))
+    elif command == "uses":
+        for use in report.get("uses", []):
+            name = ",".join(use["name"]) if isinstance(use["name"], (list, tuple)) else use["name"]
+            lines.append("    %s %s: %s" % (use["kind"], name, " ".join(user["glyph"] or "-" for user in use["constructions"]) or "-"))
+            for user in use["constructions"]:
+                lines.append("        %s: %s" % (user["location"], user["construction"]))
+    if report.get("timingsText"):
+        lines.extend(("    %s" % line).rstrip() for line in report["timingsText"].splitlines())
+    for error in report.get("errors", []):
+        lines.append("    error: %s: %s" % (error["location"], error["message"]))
+    for warning in report.get("warnings", []):
+        lines.append("    warning: %s: %s" % (warning["glyph"], warning["message"]))
+    return "\n".join(lines)
+
+
+def _jsonDefault(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _parseColor(value):
+    color = tuple(float(component) for component in value.split(","))
+    if len(color) != 4:
+        raise argparse.ArgumentTypeError("A mark color has 4 comma separated values: r,g,b,a")
+    return color
+
+
+def _argumentParser():
+    parser = argparse.ArgumentParser(prog="glyphconstruction", description="Build, lint, diff, explain, watch and find the users of glyph constructions.")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+    for command, description in [
+            ("build", "Build the constructions and save the constructed glyphs in the fonts."),
+            ("lint", "Report construction errors and warnings."),
+            ("diff", "Show the glyphs that would change by building the constructions."),
+            ("explain", "Explain how glyphs are constructed."),
+            ("uses", "Show the constructions using glyphs, anchors, guides, font metrics or kerning pairs.")]:
+        subparser = subparsers.add_parser(command, help=description, description=description)
+        subparser.add_argument("fonts", nargs="+", metavar="font", help="UFO or designspace paths")
+        subparser.add_argument("-r", "--rules", action="append", required=True, help="glyph construction file, can be given multiple times")
+        subparser.add_argument("-g", "--glyphs", action="append", help="comma separated glyph names or wildcard patterns")
+        subparser.add_argument("-j", "--workers", type=int, default=1, help="number of worker processes, 0 uses all cpus")
+        subparser.add_argument("--json", metavar="path", help="write a JSON report, '-' writes to stdout")
+        subparser.add_argument("--timings", action="store_true", help="report the time spent per stage and the slowest constructions")
+        subparser.add_argument("--auto-unicodes", dest="autoUnicodes", action="store_true", help="set unicodes from glyph names")
+        subparser.add_argument("--daemon", metavar="address", help="send the command to a running glyphconstruction-daemon")
+        subparser.add_argument("--build-cache", dest="buildCache", metavar="directory", help="keep constructed glyphs in this directory between commands")
+        if command in ("build", "diff"):
+            subparser.add_argument("--no-overwrite", dest="overwrite", action="store_false", help="do not change existing glyphs")
+            subparser.add_argument("--mark-color", dest="markColor", type=_parseColor, help="mark color of the constructed glyphs: r,g,b,a")
+        if command == "build":
+            subparser.add_argument("-o", "--output", help="save the fonts in this directory")
+            subparser.add_argument("-n", "--dry-run", dest="dryRun", action="store_true", help="do not save the fonts")
+        if command == "lint":
+            subparser.add_argument("--strict", action="store_true", help="fail on warnings")
+        if command == "explain":
+            subparser.add_argument("--trace", action="store_true", help="show how every position is resolved")
+        if command == "uses":
+            subparser.add_argument("-d", "--dependency", dest="dependencies", action="append", type=_parseDependency, help="kind:name, like glyph:acute.cap, anchor:top or kerning:A,V, can be given multiple times")
+            subparser.add_argument("--transitive", action="store_true", help="also show constructions using the glyphs constructed by the users")
+        if command == "diff":
+            subparser.add_argument("--exit-code", dest="exitCode", action="store_true", help="fail when there are differences")
+    description = "Rebuild and save the constructions affected by changes of the rule files or the fonts."
+    subparser = subparsers.add_parser("watch", help=description, description=description)
+    subparser.add_argument("fonts", nargs="+", metavar="font", help="UFO or designspace paths")
+    subparser.add_argument("-r", "--rules", action="append", required=True, help="glyph construction file, can be given multiple times")
+    subparser.add_argument("--auto-unicodes", dest="autoUnicodes", action="store_true", help="set unicodes from glyph names")
+    subparser.add_argument("--no-overwrite", dest="overwrite", action="store_false", help="do not change existing glyphs")
+    subparser.add_argument("--mark-color", dest="markColor", type=_parseColor, help="mark color of the constructed glyphs: r,g,b,a")
+    subparser.add_argument("--interval", type=float, default=.5, help="seconds between checking the files")
+    return parser
+
+
+def main(args=None):
+    """
+    Run the command line tool and return the exit status.
+
+    >>> import tempfile
+    >>> from glyphConstruction import testDummyFont
+    >>> cwd = os.getcwd()
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> os.chdir(directory.name)
+    >>> fontPath = "test.ufo"
+    >>> testDummyFont().save(fontPath)
+    >>> rulesPath = "test.glyphConstruction"
+    >>> with open(rulesPath, "w") as f:
+    ...     _ = f.write(chr(10).join(["agrave = a + grave@center,top", "aacute = a + acute@center,top", "f_i = f & i", "broken = a + grave@1,2,3"]))
+
+    >>> main(["lint", fontPath, "-r", rulesPath])
+    test.ufo
+        error: test.glyphConstruction:4: Mark positions should have 6 or 2 options
+        warning: aacute: Glyph 'acute' does not exist
+    1
+    >>> main(["lint", fontPath, "-r", rulesPath, "--build-cache", "cache"])
+    test.ufo
+        error: test.glyphConstruction:4: Mark positions should have 6 or 2 options
+        warning: aacute: Glyph 'acute' does not exist
+    1
+    >>> sorted(os.listdir("cache"))
+    ['entries', 'manifests']
+
+    >>> main(["explain", fontPath, "-r", rulesPath, "--glyphs", "agrave"])
+    test.ufo
+        agrave: agrave = a + grave@center,top
+            defined at test.glyphConstruction:1
+            width 60
+            a (1, 0, 0, 1, 0, 0)
+            grave (1, 0, 0, 1, -10, 100)
+    0
+    >>> main(["explain", fontPath, "-r", rulesPath, "--glyphs", "agrave", "--trace"])
+    test.ufo
+        agrave: agrave = a + grave@center,top
+            defined at test.glyphConstruction:1
+            width 60
+            a
+                matrix (1, 0, 0, 1, 0, 0)
+            grave@center,top
+                mark grave x 'center': center bounds (160, 160), angle 90
+                mark grave y 'top': top bounds (0, 100), angle 0
+                base a x 'center': center bounds (150, 150), angle 90
+                base a y 'top': top bounds (0, 200), angle 0
+                mark intersection (160, 100)
+                base intersection (150, 200)
+                matrix (1, 0, 0, 1, -10, 100)
+    0
+
+    Only the constructions of filtered glyphs and the glyphs they read are built.
+
+    >>> main(["lint", fontPath, "-r", rulesPath, "-g", "b*"])
+    test.ufo
+        error: test.glyphConstruction:4: Mark positions should have 6 or 2 options
+    1
+
+    >>> main(["uses", fontPath, "-r", rulesPath, "-d", "glyph:grave", "-d", "anchor:top", "--transitive"])
+    test.ufo
+        glyph grave: agrave
+            test.glyphConstruction:1: agrave = a + grave@center,top
+        anchor top: -
+        error: test.glyphConstruction:4: Mark positions should have 6 or 2 options
+    1
+
+    >>> reportPath = "report.json"
+    >>> main(["build", fontPath, "-r", rulesPath, "-g", "agrave,f_*", "--json", reportPath])
+    test.ufo
+        written: agrave f_i
+    0
+    >>> with open(reportPath) as f:
+    ...     report = json.load(f)
+    >>> report["fonts"][0]["written"], len(report["fonts"][0]["errors"])
+    (['agrave', 'f_i'], 0)
+    >>> main(["diff", fontPath, "-r", rulesPath, "-g", "agrave,f_i", "--exit-code"])
+    test.ufo
+    0
+    >>> with open(rulesPath, "w") as f:
+    ...     _ = f.write("agrave = a + grave@center,top")
+    >>> main(["diff", fontPath, "-r", rulesPath, "--json", "-"])
+    {
+      "command": "diff",
+      "fonts": [
+        {
+          "font": "test.ufo",
+          "diff": {},
+          "text": "",
+          "errors": [],
+          "warnings": []
+        }
+      ]
+    }
+    0
+
+    >>> os.chdir(cwd)
+    >>> directory.cleanup()
+    """
+    options = _argumentParser().parse_args(args)
+    fontPaths = expandFontPaths(options.fonts)
+    if options.command == "watch":
+        try:
+            watchFonts(fontPaths, vars(options), interval=options.interval)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    workers = options.workers or os.cpu_count() or 1
+    command = options.command
+    commandOptions = dict(vars(options))
+    for key in ("command", "fonts", "workers", "json", "daemon"):
+        del commandOptions[key]
+    if options.daemon:
+        from glyphConstructionDaemon import sendDaemonRequest
+        reports = sendDaemonRequest(options.daemon, command, dict(fonts=fontPaths, options=commandOptions, cwd=os.getcwd()))
+    else:
+        reports = runCommand(command, fontPaths, commandOptions, workers=workers)
+
+    if options.json:
+        data = json.dumps(dict(command=command, fonts=reports), indent=2, default=_jsonDefault)
+        if options.json == "-":
+            print(data)
+        else:
+            with open(options.json, "w", encoding="utf-8") as f:
+                f.write(data)
+    if options.json != "-":
+        for report in reports:
+            print(_formatReport(command, report))
+
+    failed = any(report["errors"] for report in reports)
+    if command == "lint" and options.strict:
+        failed = failed or any(report["warnings"] for report in reports)
+    if command == "diff" and options.exitCode:
+        failed = failed or any(report["diff"] for report in reports if "diff" in report)
+    return int(failed)
+
+
+if __name__ == "__main__":
+    import doctest
+    sys.exit(doctest.testmod().failed)
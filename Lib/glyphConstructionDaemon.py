@@ -0,0 +1,402 @@
+"""
+A local daemon keeping fonts, parsed rule files and builds in memory between commands.
+
+    glyphconstruction-daemon /tmp/glyphconstruction.sock
+    glyphconstruction build MyFont.ufo -r accents.glyphConstruction --daemon /tmp/glyphconstruction.sock
+
+The address is a unix socket path or `host:port` for a localhost TCP socket,
+other hosts are refused: requests write fonts.
+Requests and responses are JSON-RPC 2.0 messages, one per line. The methods are
+the command line commands `build`, `lint`, `diff` and `explain` with `fonts`, `options` and `cwd` params
+returning the font reports, `status` returning the cache statistics and `shutdown`.
+Relative paths are resolved against the `cwd` of the client, reports show the paths as the client gave them.
+
+Cached data is checked against the modification time and size of the files on every request:
+a changed font, or a changed rule file, is read again. Requests are handled one at a time.
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import sys
+
+from glyphConstructionCommandLine import commands, indexConstructions, readConstructions, _buildGlyphs, _readConstructions, _runCommand
+
+
+def fileStamps(path):
+    """
+    Return a dictionary with the modification time and size of a file or of all files in a directory.
+    """
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return {path: (stat.st_mtime_ns, stat.st_size)}
+    stamps = dict()
+    directories = [path]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    directories.append(entry.path)
+                else:
+                    stat = entry.stat()
+                    stamps[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+def fileStamp(path):
+    """
+    Return a stamp of a file or of all files in a directory, changing when any file changes.
+    """
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    return hash(tuple(sorted(fileStamps(path).items())))
+
+
+class ConstructionCache(object):
+
+    """
+    Fonts, parsed rule files and builds, valid as long as the stamps of the files are the same.
+    File stamps are taken once, call `refresh()` to check the files again.
+
+    * `hits`: the amount of values served from the cache
+    * `misses`: the amount of values read or built again
+    """
+
+    def __init__(self):
+        self._fonts = dict()
+        self._constructions = dict()
+        self._indexes = dict()
+        self._builds = dict()
+        self._stamps = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self):
+        """
+        Forget all file stamps, the next lookups check the files again.
+        """
+        self._stamps.clear()
+
+    def _stamp(self, path):
+        path = os.path.abspath(path)
+        stamp = self._stamps.get(path)
+        if stamp is None:
+            stamp = self._stamps[path] = fileStamp(path)
+        return stamp
+
+    def _lookup(self, cache, key, stamp, function):
+        cached = cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        value = function()
+        cache[key] = stamp, value
+        return value
+
+    def _rulesStamp(self, fontPath, ruleFiles):
+        return (self._stamp(fontPath), ) + tuple(self._stamp(ruleFile) for ruleFile in ruleFiles)
+
+    def font(self, fontPath):
+        """
+        Return the font at the given path, read again when a file in the font changed.
+        """
+        import defcon
+        return self._lookup(self._fonts, os.path.abspath(fontPath), self._stamp(fontPath), lambda: defcon.Font(fontPath))
+
+    def constructions(self, fontPath, ruleFiles):
+        """
+        Return the parsed constructions of the rule files for the given font.
+        """
+        font = self.font(fontPath)
+        key = os.path.abspath(fontPath), tuple(os.path.abspath(ruleFile) for ruleFile in ruleFiles)
+        return self._lookup(self._constructions, key, self._rulesStamp(fontPath, ruleFiles), lambda: readConstructions(ruleFiles, font))
+
+    def indexes(self, fontPath, ruleFiles, characterMap=None):
+        """
+        Return the construction indexes of the rule files for the given font, see `indexConstructions`.
+        """
+        font = self.font(fontPath)
+        key = os.path.abspath(fontPath), tuple(os.path.abspath(ruleFile) for ruleFile in ruleFiles), characterMap is not None
+        return self._lookup(self._indexes, key, self._rulesStamp(fontPath, ruleFiles), lambda: indexConstructions(ruleFiles, font, characterMap))
+
+    def build(self, fontPath, options, reuse=True):
+        """
+        Return a `(font, constructions, glyphs, errors)` tuple for a font and the command options.
+        Disable `reuse` to always build again.
+        """
+        font, constructions = _readConstructions(fontPath, options, self)
+
+        def build():
+            errors = []
+            glyphs = _buildGlyphs(constructions, font, options, errors, reuse)
+            return glyphs, errors
+
+        key = os.path.abspath(fontPath), tuple(os.path.abspath(ruleFile) for ruleFile in options["rules"]), bool(options.get("autoUnicodes")), tuple(options.get("glyphs") or ())
+        if reuse:
+            glyphs, errors = self._lookup(self._builds, key, self._rulesStamp(fontPath, options["rules"]), build)
+        else:
+            glyphs, errors = build()
+        return font, constructions, list(glyphs), list(errors)
+
+    def forget(self, fontPath):
+        """
+        Remove a font and everything built for it, for example after changing the font in memory.
+        """
+        fontPath = os.path.abspath(fontPath)
+        self._stamps.pop(fontPath, None)
+        self._fonts.pop(fontPath, None)
+        for cache in (self._constructions, self._indexes, self._builds):
+            for key in [key for key in cache if key[0] == fontPath]:
+                del cache[key]
+
+    def asDict(self):
+        return dict(fonts=len(self._fonts), constructions=len(self._constructions), builds=len(self._builds), hits=self.hits, misses=self.misses)
+
+
+def _serverAddress(address):
+    """
+    Return the socket family and the socket address, only loopback hosts are allowed for TCP sockets.
+
+    >>> _serverAddress("/tmp/glyphconstruction.sock")[1], _serverAddress(":9000")[1], _serverAddress("localhost:9000")[1]
+    ('/tmp/glyphconstruction.sock', ('127.0.0.1', 9000), ('localhost', 9000))
+    >>> _serverAddress("0.0.0.0:9000")
+    Traceback (most recent call last):
+        ...
+    ValueError: Only localhost addresses are allowed, not '0.0.0.0'
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        host = host.strip("[]") or "127.0.0.1"
+        if host != "localhost":
+            try:
+                isLoopback = ipaddress.ip_address(host).is_loopback
+            except ValueError:
+                isLoopback = False
+            if not isLoopback:
+                raise ValueError("Only localhost addresses are allowed, not '%s'" % host)
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        return family, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as err:
+                response = dict(jsonrpc="2.0", id=None, error=dict(code=-32700, message="Parse error: %s" % err))
+            else:
+                response = self.server.daemon.handle(message)
+            self.wfile.write(json.dumps(response, default=str).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class ConstructionDaemon(object):
+
+    """
+    Handle JSON-RPC requests with a `ConstructionCache`.
+
+    >>> import tempfile, threading
+    >>> from glyphConstruction import testDummyFont
+    >>> from glyphConstructionCommandLine import main
+    >>> cwd = os.getcwd()
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> os.chdir(directory.name)
+    >>> testDummyFont().save("test.ufo")
+    >>> with open("test.glyphConstruction", "w") as f:
+    ...     _ = f.write("agrave = a + grave@center,top")
+    >>> daemon = ConstructionDaemon(os.path.abspath("daemon.sock"))
+    >>> thread = threading.Thread(target=daemon.serve)
+    >>> thread.start()
+
+    >>> main(["explain", "test.ufo", "-r", "test.glyphConstruction", "--daemon", daemon.address])
+    test.ufo
+        agrave: agrave = a + grave@center,top
+            defined at test.glyphConstruction:1
+            width 60
+            a (1, 0, 0, 1, 0, 0)
+            grave (1, 0, 0, 1, -10, 100)
+    0
+    >>> reports = sendDaemonRequest(daemon.address, "lint", dict(fonts=["test.ufo"], options=dict(rules=["test.glyphConstruction"]), cwd=os.getcwd()))
+    >>> reports[0]["glyphs"], sendDaemonRequest(daemon.address, "status")
+    (['agrave'], {'fonts': 1, 'constructions': 1, 'builds': 1, 'hits': 5, 'misses': 3})
+
+    >>> with open("test.glyphConstruction", "w") as f:
+    ...     _ = f.write("agrave = a + grave@center,top" + chr(10) + "f_i = f & i")
+    >>> reports = sendDaemonRequest(daemon.address, "lint", dict(fonts=["test.ufo"], options=dict(rules=["test.glyphConstruction"]), cwd=os.getcwd()))
+    >>> reports[0]["glyphs"]
+    ['agrave', 'f_i']
+
+    Paths are relative to the working directory of the client, the daemon stays in its own.
+
+    >>> os.mkdir("sub")
+    >>> reports = sendDaemonRequest(daemon.address, "lint", dict(fonts=["../test.ufo"], options=dict(rules=["../test.glyphConstruction"]), cwd=os.path.abspath("sub")))
+    >>> reports[0]["font"], reports[0]["glyphs"], os.getcwd() == os.path.realpath(directory.name)
+    ('../test.ufo', ['agrave', 'f_i'], True)
+    >>> reports = sendDaemonRequest(daemon.address, "lint", dict(fonts=["test.ufo"], options=dict(rules=["test.glyphConstruction"], glyphs=["f_*"]), cwd=os.getcwd()))
+    >>> reports[0]["glyphs"]
+    ['f_i']
+    >>> sendDaemonRequest(daemon.address, "unknown")
+    Traceback (most recent call last):
+        ...
+    RuntimeError: Unknown method 'unknown'
+
+    Malformed requests get an error response and the connection stays open.
+
+    >>> with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+    ...     connection.connect(daemon.address)
+    ...     connection.sendall(b"{not json" + chr(10).encode() + b"[]" + chr(10).encode() + b'{"id": 2, "method": "status"}' + chr(10).encode())
+    ...     with connection.makefile("rb") as f:
+    ...         responses = [json.loads(f.readline()) for _ in range(3)]
+    >>> [response.get("error", dict()).get("code") for response in responses], responses[-1]["result"]["fonts"]
+    ([-32700, -32600, None], 1)
+
+    >>> sendDaemonRequest(daemon.address, "shutdown")
+    >>> thread.join()
+
+    >>> os.chdir(cwd)
+    >>> directory.cleanup()
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.cache = ConstructionCache()
+        self._running = False
+        # listen right away, clients can connect before `serve` is called
+        family, self._socketAddress = _serverAddress(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(self._socketAddress):
+                os.remove(self._socketAddress)
+            self._server = socketserver.UnixStreamServer(self._socketAddress, _RequestHandler)
+        else:
+            self._server = socketserver.TCPServer(self._socketAddress, _RequestHandler)
+        self._server.daemon = self
+
+    def handle(self, message):
+        """
+        Handle a single JSON-RPC request and return the response.
+        """
+        if not isinstance(message, dict):
+            return dict(jsonrpc="2.0", id=None, error=dict(code=-32600, message="Invalid request"))
+        method = message.get("method")
+        params = message.get("params") or dict()
+        response = dict(jsonrpc="2.0", id=message.get("id"))
+        try:
+            if method == "status":
+                response["result"] = self.cache.asDict()
+            elif method == "shutdown":
+                self._running = False
+                response["result"] = None
+            elif method in commands:
+                response["result"] = self.runCommand(method, params["fonts"], params.get("options") or dict(), params.get("cwd"))
+            else:
+                response["error"] = dict(code=-32601, message="Unknown method '%s'" % method)
+        except Exception as err:
+            response["error"] = dict(code=-32603, message="%s: %s" % (err.__class__.__name__, err))
+        return response
+
+    def runCommand(self, command, fontPaths, options, cwd=None):
+        """
+        Run a command for every font with the cache, relative paths are relative to `cwd`.
+        """
+        self.cache.refresh()
+        if cwd is None:
+            return [_runCommand(command, fontPath, options, self.cache) for fontPath in fontPaths]
+        options = dict(options)
+        clientPaths = dict()
+
+        def resolve(path):
+            resolved = os.path.normpath(os.path.join(cwd, path))
+            clientPaths[resolved] = path
+            return resolved
+
+        if options.get("rules"):
+            options["rules"] = [resolve(ruleFile) for ruleFile in options["rules"]]
+        for key in ("buildCache", "output"):
+            if options.get(key):
+                options[key] = resolve(options[key])
+        reports = []
+        for fontPath in fontPaths:
+            report = _runCommand(command, resolve(fontPath), options, self.cache)
+            reports.append(_clientReport(report, clientPaths))
+        return reports
+
+    def serve(self):
+        """
+        Handle requests until a `shutdown` request.
+        """
+        self._running = True
+        try:
+            while self._running:
+                self._server.handle_request()
+        finally:
+            self._server.server_close()
+            if self._server.address_family == socket.AF_UNIX and os.path.exists(self._socketAddress):
+                os.remove(self._socketAddress)
+
+
+def _clientPath(value, clientPaths):
+    # longest paths first, a rule file could be in the font directory
+    for resolved in sorted(clientPaths, key=len, reverse=True):
+        if value == resolved or (value.startswith(resolved) and value[len(resolved)] in (os.sep, ":")):
+            return clientPaths[resolved] + value[len(resolved):]
+    return value
+
+
+def _clientReport(value, clientPaths):
+    """
+    Return a report with the resolved font, output and rule file paths as the client gave them.
+
+    >>> _clientReport(dict(font="/work/test.ufo", errors=[dict(location="/work/rules/test.glyphConstruction:4")]), {"/work/test.ufo": "test.ufo", "/work/rules/test.glyphConstruction": "rules/test.glyphConstruction"})
+    {'font': 'test.ufo', 'errors': [{'location': 'rules/test.glyphConstruction:4'}]}
+    """
+    if isinstance(value, dict):
+        return dict((key, _clientPath(item, clientPaths) if key in ("font", "output", "location") and isinstance(item, str) else _clientReport(item, clientPaths)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_clientReport(item, clientPaths) for item in value]
+    return value
+
+
+def sendDaemonRequest(address, method, params=None):
+    """
+    Send a request to a running daemon and return the result, errors are raised as `RuntimeError`.
+    """
+    family, address = _serverAddress(address)
+    message = dict(jsonrpc="2.0", id=1, method=method, params=params or dict())
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.connect(address)
+        connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as f:
+            response = json.loads(f.readline())
+    if "error" in response:
+        raise RuntimeError(response["error"]["message"])
+    return response["result"]
+
+
+def main(args=None):
+    """
+    Run the daemon on a unix socket path or a `host:port` address.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="glyphconstruction-daemon", description="Keep fonts and glyph constructions in memory for glyphconstruction commands.")
+    parser.add_argument("address", help="unix socket path or host:port")
+    options = parser.parse_args(args)
+    try:
+        daemon = ConstructionDaemon(options.address)
+    except ValueError as err:
+        parser.error(str(err))
+    daemon.serve()
+    return 0
+
+
+if __name__ == "__main__":
+    import doctest
+    sys.exit(doctest.testmod().failed)
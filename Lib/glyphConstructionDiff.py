@@ -0,0 +1,186 @@
+"""
+Compare glyph constructions with the existing glyphs in a font, without writing anything.
+
+Every construction is built and compared with the existing glyph through a compact digest:
+width, unicodes, components, component transformations, contours, note and mark color.
+"""
+
+from fontTools.pens.pointPen import AbstractPointPen
+
+from glyphConstruction import BuildGlyphConstructions, ParseGlyphConstructionListFromString
+
+
+def _round(value, digits=3):
+    value = round(value, digits)
+    if value == int(value):
+        return int(value)
+    return value
+
+
+class GlyphDigestPointPen(AbstractPointPen):
+
+    """
+    A point pen collecting a compact, hashable digest of contours and components.
+    """
+
+    def __init__(self):
+        self.contours = []
+        self.components = []
+        self._currentContour = None
+
+    def beginPath(self, identifier=None, **kwargs):
+        self._currentContour = []
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None, identifier=None, **kwargs):
+        x, y = pt
+        self._currentContour.append((_round(x), _round(y), segmentType))
+
+    def endPath(self):
+        self.contours.append(tuple(self._currentContour))
+        self._currentContour = None
+
+    def addComponent(self, baseGlyphName, transformation, identifier=None, **kwargs):
+        self.components.append((baseGlyphName, tuple(_round(value) for value in transformation)))
+
+
+digestFields = ("width", "unicodes", "components", "transformations", "contours", "note", "markColor")
+
+
+def glyphDigest(glyph):
+    """
+    Return a compact, hashable digest of a glyph as a dictionary with all `digestFields`.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> digest = glyphDigest(font["a"])
+    >>> digest["width"], digest["components"], digest["contours"]
+    (60, (), (((100, 100, 'line'), (200, 100, 'line'), (200, 200, 'line')),))
+    """
+    pen = GlyphDigestPointPen()
+    glyph.drawPoints(pen)
+    markColor = glyph.markColor
+    if markColor is not None:
+        markColor = tuple(_round(value) for value in markColor)
+    return dict(
+        width=_round(glyph.width),
+        unicodes=tuple(glyph.unicodes),
+        components=tuple(baseGlyphName for baseGlyphName, _ in pen.components),
+        transformations=tuple(transformation for _, transformation in pen.components),
+        contours=tuple(pen.contours),
+        note=glyph.note or "",
+        markColor=markColor
+    )
+
+
+def DiffGlyphConstructions(constructions, font, characterMap=None, markColor=None, overwrite=True, errors=None):
+    """
+    Build all constructions and return the glyphs that would change in the font by building them.
+
+    The result is a dictionary of glyph names and a dictionary of the changed fields with
+    an `(existing, constructed)` tuple. A glyph that does not exist yet has a `glyph` field.
+
+    `characterMap` and `markColor` are the auto unicodes and default mark color used while building.
+    When `overwrite` is disabled existing glyphs are never changed.
+    Optionally provide an `errors` list to collect construction errors.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> constructions = [
+    ...     "agrave = a + grave",
+    ...     "f_i = f & i",
+    ...     "a = a + grave@center,top",
+    ...     "i = ^ 100",
+    ... ]
+    >>> glyph = font.newGlyph("agrave")
+    >>> glyph.width = 60
+    >>> pen = glyph.getPointPen()
+    >>> pen.addComponent("a", (1, 0, 0, 1, 0, 0))
+    >>> pen.addComponent("grave", (1, 0, 0, 1, 0, 0))
+    >>> diff = DiffGlyphConstructions(constructions, font)
+    >>> sorted(diff)
+    ['a', 'f_i', 'i']
+    >>> diff["f_i"]
+    {'glyph': (None, 'f_i')}
+    >>> sorted(diff["a"])
+    ['components', 'contours', 'transformations']
+    >>> diff["i"]
+    {'width': (90, 100), 'contours': ((((100, 100, 'line'), (260, 160, 'line'), (260, 260, 'line')),), ())}
+
+    >>> sorted(DiffGlyphConstructions(constructions, font, overwrite=False))
+    ['f_i']
+    """
+    if isinstance(constructions, str) or hasattr(constructions, "read"):
+        constructions = ParseGlyphConstructionListFromString(constructions, font)
+    constructed = dict()
+    for glyph in BuildGlyphConstructions(constructions, font, characterMap=characterMap, errors=errors):
+        constructed[glyph.name] = glyph
+
+    result = dict()
+    for glyphName, glyph in constructed.items():
+        if glyphName not in font:
+            result[glyphName] = dict(glyph=(None, glyphName))
+            continue
+        if not overwrite:
+            continue
+        changes = diffGlyphDigests(glyphDigest(font[glyphName]), glyphDigest(glyph), markColor)
+        if changes:
+            result[glyphName] = changes
+    return result
+
+
+def diffGlyphDigests(existingDigest, digest, markColor=None):
+    """
+    Return a dictionary of the changed fields with an `(existing, constructed)` tuple,
+    comparing the digest of a constructed glyph with the digest of the existing glyph.
+    The constructed glyph keeps the existing unicodes and mark color when it has none, like writing it does.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> digest = glyphDigest(font["a"])
+    >>> diffGlyphDigests(digest, dict(digest, width=70, unicodes=(), markColor=None), markColor=(1, 0, 0, 1))
+    {'width': (60, 70), 'markColor': (None, (1, 0, 0, 1))}
+    """
+    digest = dict(digest)
+    if digest["markColor"] is None:
+        if markColor is None:
+            digest["markColor"] = existingDigest["markColor"]
+        else:
+            digest["markColor"] = tuple(_round(value) for value in markColor)
+    if not digest["unicodes"]:
+        # unicodes are only set when they are provided
+        digest["unicodes"] = existingDigest["unicodes"]
+    changes = dict()
+    for field in digestFields:
+        if existingDigest[field] != digest[field]:
+            changes[field] = existingDigest[field], digest[field]
+    return changes
+
+
+def formatGlyphConstructionDiff(diff):
+    """
+    Format a construction diff as readable text, one line per changed field.
+
+    >>> print(formatGlyphConstructionDiff({"agrave": {"width": (60, 70)}, "aacute": {"glyph": (None, "aacute")}}))
+    aacute: new glyph
+    agrave: width 60 -> 70
+    """
+    lines = []
+    for glyphName in sorted(diff):
+        changes = diff[glyphName]
+        if "glyph" in changes:
+            lines.append("%s: new glyph" % glyphName)
+            continue
+        for field in digestFields:
+            if field in changes:
+                existing, constructed = changes[field]
+                if field == "contours":
+                    lines.append("%s: contours %s -> %s points" % (glyphName, sum(len(c) for c in existing), sum(len(c) for c in constructed)))
+                else:
+                    lines.append("%s: %s %s -> %s" % (glyphName, field, existing, constructed))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
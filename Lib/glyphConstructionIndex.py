@@ -0,0 +1,396 @@
+"""
+Index glyph constructions by the glyph names and unicodes they construct, to build only a part of them,
+and by everything they consume, to find the constructions affected by a change.
+
+    index = ConstructionIndex("accents.glyphConstruction", font)
+    glyphs = index.build(text="Ça déjà")
+
+Lines are indexed without parsing the construction, only the glyph name and the unicodes are read.
+A selection contains the constructions of the requested glyphs and, transitively,
+all constructions of glyphs they can read. Only selected lines are parsed, once per index.
+Building a selection gives the same glyphs as building all constructions, for the selected glyphs.
+
+    glyphs, reverseIndex = IndexGlyphConstructions(constructions, font)
+    reverseIndex.consumers(dependencyAnchor, "top")
+
+A `ConstructionReverseIndex` maps every consumed dependency to the constructions consuming it:
+
+* `glyph`: every glyph name read, also glyphs which do not exist
+* `anchor`, `guide`: anchor and guide names resolving a position
+* `metric`: font info attributes resolving a position, like `xHeight`
+* `kerning`: `(left, right)` glyph name pairs looked up in the kerning
+
+Dependencies are recorded while building, only names which resolved a position are recorded.
+The glyph dependencies cover all changes of a glyph, including its anchors and guides.
+"""
+
+from glyphConstruction import BuildGlyphConstructions, ConstructionOverlayFont, ConstructionTrace, GlyphBuilderError, GlyphConstructionBuilder, \
+    RecordingFont, ParseGlyphConstructionLine, ParseVariables, readGlyphConstructionSource, \
+    parseConstructedGlyphName, parseReferencedGlyphNames, parseUnicode, removeSpacesAndTabs, _expandVariables, \
+    unicodeSplit, metricsSuffixSplit, glyphMarkSuffixSplit, glyphCommentSuffixSplit, variableDeclarationStart
+
+
+def _lineUnicodes(line):
+    # the unicodes are between the unicode splitter and the next attribute
+    line = line.split(glyphCommentSuffixSplit)[0]
+    if unicodeSplit not in line:
+        return ()
+    text = line[line.index(unicodeSplit):]
+    for split in (metricsSuffixSplit, glyphMarkSuffixSplit):
+        text = text.split(split)[0]
+    unicodes, _ = parseUnicode(removeSpacesAndTabs(text))
+    return unicodes
+
+
+class _UnicodeTest(object):
+
+    def __init__(self, unicodes):
+        self.values = set()
+        self.ranges = []
+        for value in unicodes:
+            if isinstance(value, range):
+                self.ranges.append(value)
+            else:
+                self.values.add(value)
+
+    def __call__(self, value):
+        return value in self.values or any(value in unicodeRange for unicodeRange in self.ranges)
+
+
+class ConstructionIndex(object):
+
+    """
+    Index the constructions of a source, could be a file path, file object or a string,
+    by the glyph names and unicodes they construct. Unicodes set with a `characterMap` are indexed too.
+    The `font` is used to ignore constructions of existing glyphs, like `ParseGlyphConstructionListFromString`.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> txt = chr(10).join([
+    ...     "$mark = grave",
+    ...     "agrave = a + {mark}@center,top | 00E0",
+    ...     "agrave.alt = agrave & i",
+    ...     "f_i = f & i",
+    ...     "aacute = a + acute@center,top ^ 100 | 00E1",
+    ...     "broken = a + {missing}"
+    ...     ])
+    >>> index = ConstructionIndex(txt, font)
+    >>> index.select(glyphNames=["agrave.alt"])
+    ['agrave = a + grave@center,top | 00E0', 'agrave.alt = agrave & i']
+    >>> index.select(text="á")
+    ['aacute = a + acute@center,top ^ 100 | 00E1']
+    >>> index.select(unicodes=[range(0x00E0, 0x00E2)])
+    ['agrave = a + grave@center,top | 00E0', 'aacute = a + acute@center,top ^ 100 | 00E1']
+    >>> index.parsedLineCount
+    3
+    >>> [glyph.name for glyph in index.build(glyphNames=["f_i", "agrave"])]
+    ['agrave', 'f_i']
+
+    Only selected lines are parsed, errors in other lines are not reported.
+
+    >>> index.select(glyphNames=["broken"])
+    Traceback (most recent call last):
+        ...
+    glyphConstruction.GlyphBuilderError: Variable 'missing' is missing
+
+    Glyph names with other characters, like `a-cy`, are read whole.
+
+    >>> index = ConstructionIndex(chr(10).join(["a-cy = a + grave@center,top", "f.alt = f", "x-cy = a-cy & i"]), font)
+    >>> [(glyph.name, glyph.components[-1]) for glyph in index.build(glyphNames=["x-cy"])]
+    [('a-cy', ('grave', (1, 0, 0, 1, -10.0, 100.0))), ('x-cy', ('i', (1, 0, 0, 1, 60, 0)))]
+    """
+
+    def __init__(self, source, font=None, characterMap=None):
+        txt, self.path = readGlyphConstructionSource(source)
+        self.font = font
+        self.characterMap = characterMap
+        _, self.variables = ParseVariables(txt)
+        self._lines = []
+        self._parsed = dict()
+        self._glyphNames = dict()
+        self._unicodes = dict()
+        offset = 0
+        for lineNumber, line in enumerate(txt.split("\n")):
+            lineOffset = offset
+            offset += len(line) + 1
+            stripped = line.strip()
+            if not stripped or stripped[0] in (glyphCommentSuffixSplit, variableDeclarationStart):
+                continue
+            position = len(self._lines)
+            self._lines.append((lineNumber, lineOffset, line))
+            glyphName = self._expand(parseConstructedGlyphName(stripped))
+            if glyphName is None:
+                continue
+            self._glyphNames.setdefault(glyphName, []).append(position)
+            unicodes = list(_lineUnicodes(self._expand(stripped) or ""))
+            if characterMap and glyphName in characterMap:
+                unicodes.append(characterMap[glyphName])
+            for value in unicodes:
+                self._unicodes.setdefault(value, []).append(position)
+
+    def _expand(self, text):
+        # only expand variables when needed, an unknown variable is reported when the line is parsed
+        if text is None or "{" not in text:
+            return text
+        try:
+            text, _ = _expandVariables(text, self.variables)
+        except (KeyError, IndexError, ValueError):
+            return None
+        return text
+
+    def _get_glyphNames(self):
+        return set(self._glyphNames)
+
+    glyphNames = property(_get_glyphNames, doc="The names of all glyphs with a construction.")
+
+    def _get_unicodes(self):
+        return set(self._unicodes)
+
+    unicodes = property(_get_unicodes, doc="The unicodes of all glyphs with a construction.")
+
+    def _get_parsedLineCount(self):
+        return len(self._parsed)
+
+    parsedLineCount = property(_get_parsedLineCount, doc="The amount of lines parsed so far.")
+
+    def _parse(self, position):
+        if position not in self._parsed:
+            lineNumber, offset, line = self._lines[position]
+            self._parsed[position] = ParseGlyphConstructionLine(line, self.variables, self.font, lineNumber=lineNumber, offset=offset, path=self.path)
+        return self._parsed[position]
+
+    def select(self, glyphNames=None, unicodes=None, text=None):
+        """
+        Return the constructions of the requested glyphs and their dependencies in source order.
+        Glyphs are requested by name, by unicode values or `range`s, or by the characters of a text.
+        """
+        positions = set()
+        for glyphName in glyphNames or ():
+            positions.update(self._glyphNames.get(glyphName, ()))
+        test = None
+        if unicodes is not None or text is not None:
+            test = _UnicodeTest(list(unicodes or ()) + [ord(character) for character in text or ""])
+        if test is not None:
+            for value, valuePositions in self._unicodes.items():
+                if test(value):
+                    positions.update(valuePositions)
+        pending = list(positions)
+        while pending:
+            construction = self._parse(pending.pop())
+            if not construction:
+                continue
+            for glyphName in parseReferencedGlyphNames(construction):
+                for position in self._glyphNames.get(glyphName, ()):
+                    if position not in positions:
+                        positions.add(position)
+                        pending.append(position)
+        return [self._parsed[position] for position in sorted(positions) if self._parsed[position]]
+
+    def build(self, glyphNames=None, unicodes=None, text=None, errors=None):
+        """
+        Build the constructions of the requested glyphs and their dependencies in the font, see `select`.
+        """
+        return BuildGlyphConstructions(self.select(glyphNames=glyphNames, unicodes=unicodes, text=text), self.font, characterMap=self.characterMap, errors=errors)
+
+
+dependencyGlyph = "glyph"
+dependencyAnchor = "anchor"
+dependencyGuide = "guide"
+dependencyMetric = "metric"
+dependencyKerning = "kerning"
+
+dependencyKinds = (dependencyGlyph, dependencyAnchor, dependencyGuide, dependencyMetric, dependencyKerning)
+
+_positionSourceKinds = dict(
+    anchor=dependencyAnchor,
+    prefixedAnchor=dependencyAnchor,
+    glyphGuide=dependencyGuide,
+    prefixedGlyphGuide=dependencyGuide,
+    fontGuide=dependencyGuide,
+    fontMetric=dependencyMetric
+)
+
+# mark positions are first looked up with this prefix
+_markPrefix = "_"
+
+
+def traceDependencies(glyphTrace):
+    """
+    Return the anchor, guide, font metric and kerning dependencies of a `GlyphTrace` as a set of `(kind, name)` tuples.
+    """
+    dependencies = set()
+    for component in glyphTrace.components:
+        for position in component.positions:
+            for name, source, _ in position.resolutions:
+                kind = _positionSourceKinds.get(source)
+                if kind is None:
+                    continue
+                if source.startswith("prefixed"):
+                    name = _markPrefix + name
+                dependencies.add((kind, name))
+    for pair, _ in glyphTrace.kerning:
+        dependencies.add((dependencyKerning, tuple(pair)))
+    return dependencies
+
+
+def buildRecordingDependencies(construction, font, characterMap=None):
+    """
+    Build a single construction and return the glyph, or `None` when the construction has an error,
+    the error message or `None`, and a set of `(kind, name)` dependencies.
+    """
+    recordingFont = RecordingFont(font)
+    with ConstructionTrace() as trace:
+        try:
+            glyph = GlyphConstructionBuilder(construction, recordingFont, characterMap=characterMap)
+            error = None
+        except GlyphBuilderError as err:
+            glyph = None
+            error = str(err)
+    dependencies = set((dependencyGlyph, glyphName) for glyphName in recordingFont.recordedGlyphNames())
+    for glyphTrace in trace.glyphs:
+        dependencies.update(traceDependencies(glyphTrace))
+    return glyph, error, dependencies
+
+
+class ConstructionReverseIndex(object):
+
+    """
+    Map dependencies to the constructions consuming them, kept up to date with `setDependencies`
+    and `removeConstruction`. Constructions are compared by identity, any object can be a construction.
+
+    >>> agrave, aacute = "agrave = a + grave@top", "aacute = a + acute@top"
+    >>> index = ConstructionReverseIndex()
+    >>> index.setDependencies(agrave, [(dependencyGlyph, "a"), (dependencyGlyph, "grave"), (dependencyAnchor, "top")])
+    >>> index.setDependencies(aacute, [(dependencyGlyph, "a"), (dependencyAnchor, "_top")])
+    >>> index.consumers(dependencyGlyph, "a")
+    ['agrave = a + grave@top', 'aacute = a + acute@top']
+    >>> index.setDependencies(agrave, [(dependencyGlyph, "grave")])
+    >>> index.consumers(dependencyGlyph, "a"), index.consumers(dependencyAnchor, "top")
+    (['aacute = a + acute@top'], [])
+    >>> sorted(index.names(dependencyAnchor))
+    ['_top']
+    """
+
+    def __init__(self):
+        self._dependencies = dict()
+        self._consumers = dict()
+
+    def setDependencies(self, construction, dependencies):
+        """
+        Set the dependencies of a construction, replacing the previous dependencies.
+        """
+        self.removeConstruction(construction)
+        dependencies = set(dependencies)
+        self._dependencies[id(construction)] = construction, dependencies
+        for dependency in dependencies:
+            self._consumers.setdefault(dependency, dict())[id(construction)] = construction
+
+    def removeConstruction(self, construction):
+        """
+        Remove a construction and its dependencies.
+        """
+        _, dependencies = self._dependencies.pop(id(construction), (None, ()))
+        for dependency in dependencies:
+            consumers = self._consumers[dependency]
+            del consumers[id(construction)]
+            if not consumers:
+                del self._consumers[dependency]
+
+    def dependencies(self, construction):
+        """
+        Return the set of `(kind, name)` dependencies of a construction.
+        """
+        return set(self._dependencies.get(id(construction), (None, ()))[1])
+
+    def constructions(self):
+        """
+        Return all indexed constructions.
+        """
+        return [construction for construction, _ in self._dependencies.values()]
+
+    def names(self, kind):
+        """
+        Return all consumed names of a dependency kind.
+        """
+        return set(name for dependencyKind, name in self._consumers if dependencyKind == kind)
+
+    def consumers(self, kind, name):
+        """
+        Return the constructions consuming the dependency, in the order they were added.
+        """
+        return list(self._consumers.get((kind, name), dict()).values())
+
+    def affected(self, kind, name, glyphName=None):
+        """
+        Return the constructions consuming the dependency and, transitively, the constructions
+        reading the glyphs constructed by those. `glyphName` returns the constructed glyph name of a construction,
+        by default the name before the `=` of the construction.
+        """
+        from glyphConstruction import parseConstructedGlyphName
+        if glyphName is None:
+            glyphName = parseConstructedGlyphName
+        result = dict()
+        pending = self.consumers(kind, name)
+        while pending:
+            construction = pending.pop(0)
+            if id(construction) in result:
+                continue
+            result[id(construction)] = construction
+            constructed = glyphName(construction)
+            if constructed is not None:
+                pending.extend(self.consumers(dependencyGlyph, constructed))
+        order = dict((id(construction), position) for position, (construction, _) in enumerate(self._dependencies.values()))
+        return sorted(result.values(), key=lambda construction: order[id(construction)])
+
+
+def IndexGlyphConstructions(constructions, font, characterMap=None, errors=None, reverseIndex=None):
+    """
+    Build a list of glyph constructions, see `BuildGlyphConstructions`, and return the glyphs
+    and a `ConstructionReverseIndex` with the dependencies of every construction.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> font["a"].appendAnchor(dict(name="top", x=130, y=220))
+    >>> font["grave"].appendAnchor(dict(name="_top", x=160, y=0))
+    >>> font.kerning["a", "i"] = -100
+    >>> font.info.xHeight = 100
+    >>> constructions = ["agrave = a + grave@top", "agrave.alt = agrave & \\\\i", "i.sups = i@center,`xHeight+10`", "broken = a + grave@1,2,3"]
+    >>> errors = []
+    >>> glyphs, reverseIndex = IndexGlyphConstructions(constructions, font, errors=errors)
+    >>> [glyph.name for glyph in glyphs], len(errors)
+    (['agrave', 'agrave.alt', 'i.sups'], 1)
+    >>> reverseIndex.consumers(dependencyGlyph, "grave")
+    ['agrave = a + grave@top']
+    >>> reverseIndex.consumers(dependencyAnchor, "top"), reverseIndex.consumers(dependencyAnchor, "_top")
+    (['agrave = a + grave@top'], ['agrave = a + grave@top'])
+    >>> reverseIndex.consumers(dependencyKerning, ("agrave", "i")), reverseIndex.consumers(dependencyMetric, "xHeight")
+    (['agrave.alt = agrave & \\\\i'], ['i.sups = i@center,`xHeight+10`'])
+    >>> reverseIndex.affected(dependencyAnchor, "_top")
+    ['agrave = a + grave@top', 'agrave.alt = agrave & \\\\i']
+    """
+    if reverseIndex is None:
+        reverseIndex = ConstructionReverseIndex()
+    overlayFont = ConstructionOverlayFont(font)
+    result = []
+    for construction in constructions:
+        if not construction:
+            continue
+        glyph, error, dependencies = buildRecordingDependencies(construction, overlayFont, characterMap)
+        reverseIndex.setDependencies(construction, dependencies)
+        if error is not None:
+            if errors is None:
+                raise GlyphBuilderError(error)
+            errors.append((construction, error))
+            continue
+        if glyph.name is None:
+            continue
+        glyph._glyphset = lambda: overlayFont
+        overlayFont[glyph.name] = glyph
+        result.append(glyph)
+    return result, reverseIndex
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
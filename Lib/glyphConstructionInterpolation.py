@@ -0,0 +1,316 @@
+"""
+Interpolate glyph constructions for instances.
+
+Every construction is resolved once in each master, with the glyphs constructed before it available,
+the component transformations and the width are interpolated for every instance location with a fontTools variation model.
+
+Constructions where the positioning is not linear in the geometry of the masters can not be
+interpolated and are rebuilt in the instance font. These are constructions with:
+
+* different components or missing glyphs in some masters
+* errors in some masters, the error messages are reported as reasons
+* positions depending on bounds (also flips) of glyphs whose bounds do not interpolate:
+  the extremes are not on points or are not on the same points in every master
+* margins, which depend on the bounds of the constructed glyph
+* the source glyph drawing added with `>`
+* a varying italic angle across the masters
+"""
+
+from fontTools.pens.boundsPen import BoundsPen, ControlBoundsPen
+from fontTools.pens.recordingPen import DecomposingRecordingPen
+from fontTools.varLib.models import VariationModel, normalizeLocation
+
+from glyphConstruction import GlyphConstructionBuilder, ConstructionGlyph, ConstructionOverlayFont, RecordingFont, ParseGlyphConstructionListFromString, GlyphBuilderError, \
+    parseNote, parseConstructedGlyphName, metricsSuffixSplit, unicodeSplit, glyphMarkSuffixSplit, positionXYSplit, positionSplit
+
+
+boundsAttributes = set(("bounds", "leftMargin", "rightMargin"))
+
+
+def _glyphPoints(glyph, font):
+    pen = DecomposingRecordingPen(font)
+    glyph.draw(pen)
+    points = []
+    for _, args in pen.value:
+        # skip the implied on-curve point of a quadratic contour without on-curve points
+        points.extend(point for point in args if point is not None)
+    return points
+
+
+def _boundsPointIndexes(glyph, font):
+    """
+    Return for each extreme (xMin, yMin, xMax, yMax) the point indexes which define the extreme.
+    Return `None` if the bounds of the glyph are not defined by points.
+    """
+    pen = BoundsPen(font)
+    glyph.draw(pen)
+    controlPen = ControlBoundsPen(font)
+    glyph.draw(controlPen)
+    if pen.bounds is None:
+        return ()
+    if pen.bounds != controlPen.bounds:
+        # a curve extreme in between points
+        return None
+    points = _glyphPoints(glyph, font)
+    result = []
+    for i, value in enumerate(pen.bounds):
+        coordinate = i % 2
+        result.append(frozenset(index for index, point in enumerate(points) if point[coordinate] == value))
+    return tuple(result)
+
+
+def glyphBoundsInterpolate(glyphName, masters):
+    """
+    Return `True` when the bounds of the glyph interpolate linearly between all given master fonts.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> master1 = testDummyFont()
+    >>> master2 = testDummyFont()
+    >>> glyphBoundsInterpolate("grave", [master1, master2])
+    True
+    >>> pen = master2["grave"].getPen()
+    >>> pen.moveTo((0, 0))
+    >>> pen.curveTo((0, 500), (500, 500), (500, 0))
+    >>> pen.closePath()
+    >>> glyphBoundsInterpolate("grave", [master1, master2])
+    False
+
+    A quadratic contour without on-curve points.
+
+    >>> for master, size in ((master1, 100), (master2, 200)):
+    ...     pen = master.newGlyph("o").getPen()
+    ...     pen.qCurveTo((0, 0), (size, 0), (size, size), (0, size), None)
+    ...     pen.closePath()
+    >>> glyphBoundsInterpolate("o", [master1, master2])
+    True
+    """
+    indexes = None
+    for font in masters:
+        if glyphName not in font:
+            return False
+        glyphIndexes = _boundsPointIndexes(font[glyphName], font)
+        if glyphIndexes is None:
+            return False
+        if indexes is None:
+            indexes = glyphIndexes
+        elif len(indexes) != len(glyphIndexes):
+            return False
+        else:
+            indexes = tuple(a & b for a, b in zip(indexes, glyphIndexes))
+            if not all(indexes):
+                return False
+    return True
+
+
+def _hasMargins(construction):
+    """
+    >>> _hasMargins("f_i = f & i ^ 10, i | 0001")
+    True
+    >>> _hasMargins("f_i = f & i ^ 100 ! 1, 0, 0, 1")
+    False
+    """
+    _, construction = parseNote(construction)
+    if metricsSuffixSplit not in construction:
+        return False
+    metrics = construction.split(metricsSuffixSplit)[1]
+    for split in (unicodeSplit, glyphMarkSuffixSplit):
+        metrics = metrics.split(split)[0]
+    return positionXYSplit in metrics
+
+
+def _italicAngle(font):
+    return getattr(font.info, "italicAngle", 0) or 0
+
+
+def _constructionSignature(glyph):
+    return (
+        glyph.name,
+        tuple(glyphName for glyphName, _ in glyph.components),
+        tuple(glyph.unicodes),
+        glyph.markColor,
+        glyph.note,
+        glyph.shouldDecompose
+    )
+
+
+class ConstructionInterpolator(object):
+
+    """
+    Resolve glyph constructions once in every master and interpolate them for instances.
+
+    `masters` is a list of `(location, font)` tuples, a location is a dictionary of axis names and values.
+    `axes` is an optional dictionary of axis names and `(minimum, default, maximum)` tuples,
+    when not provided the axes are derived from the master locations, the first master is the default.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> light = testDummyFont()
+    >>> bold = testDummyFont()
+    >>> bold["a"].width = 160
+    >>> bold["grave"].move((100, 0))
+    >>> constructions = ["agrave = a + grave@center,top", "f_i = f & i ^ 10, 10", "agrave.alt = agrave & i", "broken = a + grave@1,2,3"]
+    >>> interpolator = ConstructionInterpolator(constructions, [(dict(weight=0), light), (dict(weight=100), bold)])
+    >>> interpolator.unsafeConstructions
+    {'f_i': ['margins depend on the bounds of the constructed glyph'], 'broken': ['Mark positions should have 6 or 2 options']}
+
+    >>> instance = testDummyFont()
+    >>> instance["a"].width = 110
+    >>> instance["grave"].move((50, 0))
+    >>> errors = []
+    >>> result = interpolator.instance(dict(weight=50), instance, errors=errors)
+    >>> errors
+    [('broken = a + grave@1,2,3', 'Mark positions should have 6 or 2 options')]
+    >>> [(glyph.name, glyph.width, glyph.components) for glyph in result]
+    [('agrave', 110.0, [('a', (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)), ('grave', (1.0, 0.0, 0.0, 1.0, -60.0, 100.0))]), ('f_i', 260.0, [('f', (1, 0, 0, 1, -90.0, 0)), ('i', (1, 0, 0, 1, -10.0, 0))]), ('agrave.alt', 200.0, [('agrave', (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)), ('i', (1.0, 0.0, 0.0, 1.0, 110.0, 0.0))])]
+    >>> from glyphConstruction import BuildGlyphConstructions
+    >>> [glyph.components for glyph in result] == [glyph.components for glyph in BuildGlyphConstructions(constructions, instance, errors=[])]
+    True
+    """
+
+    def __init__(self, constructions, masters, axes=None, characterMap=None):
+        if isinstance(constructions, str) or hasattr(constructions, "read"):
+            constructions = ParseGlyphConstructionListFromString(constructions)
+        self.constructions = [construction for construction in constructions if construction]
+        self.characterMap = characterMap
+        locations = [dict(location) for location, _ in masters]
+        self.masters = [font for _, font in masters]
+        if axes is None:
+            axes = dict()
+            default = locations[0]
+            for location in locations:
+                for axisName, value in location.items():
+                    minimum, _, maximum = axes.get(axisName, (value, None, value))
+                    axes[axisName] = min(minimum, value), default.get(axisName, value), max(maximum, value)
+        self.axes = axes
+        self.model = VariationModel([normalizeLocation(location, axes) for location in locations], axisOrder=sorted(axes))
+        self.unsafeConstructions = dict()
+        self._deltas = dict()
+        self._glyphs = dict()
+        self._resolve()
+
+    def _resolve(self):
+        italicAngles = set(_italicAngle(font) for font in self.masters)
+        boundsCache = dict()
+        # constructed glyphs are available for all following constructions, like `BuildGlyphConstructions`
+        overlays = [ConstructionOverlayFont(font) for font in self.masters]
+        for construction in self.constructions:
+            reasons = []
+            results = []
+            records = []
+            for overlayFont in overlays:
+                recordingFont = RecordingFont(overlayFont)
+                try:
+                    glyph = GlyphConstructionBuilder(construction, recordingFont, characterMap=self.characterMap)
+                except GlyphBuilderError as err:
+                    if str(err) not in reasons:
+                        reasons.append(str(err))
+                    continue
+                if glyph.name is not None:
+                    glyph._glyphset = lambda overlayFont=overlayFont: overlayFont
+                    overlayFont[glyph.name] = glyph
+                results.append(glyph)
+                records.append(recordingFont.record)
+            name = results[0].name if results else parseConstructedGlyphName(construction)
+            if name is None:
+                continue
+            if not reasons:
+                reasons = self._unsafeReasons(construction, results, records, italicAngles, boundsCache, overlays)
+            if reasons:
+                self.unsafeConstructions[name] = reasons
+                continue
+            masterValues = [
+                [value for _, transformation in glyph.components for value in transformation] + [glyph.width]
+                for glyph in results
+            ]
+            self._deltas[construction] = [self.model.getDeltas(values) for values in zip(*masterValues)]
+            self._glyphs[construction] = results[self.model.reverseMapping[0]]
+
+    def _unsafeReasons(self, construction, results, records, italicAngles, boundsCache, overlays):
+        reasons = []
+        if len(set(_constructionSignature(glyph) for glyph in results)) != 1:
+            reasons.append("components or attributes differ between masters")
+        if any(glyph.source.value for glyph in results):
+            reasons.append("adds the source glyph drawing")
+        if _hasMargins(construction):
+            reasons.append("margins depend on the bounds of the constructed glyph")
+        boundsGlyphNames = set()
+        for record in records:
+            boundsGlyphNames.update(glyphName for glyphName, attr in record if attr in boundsAttributes)
+        for glyphName in sorted(boundsGlyphNames):
+            if glyphName not in boundsCache:
+                boundsCache[glyphName] = glyphBoundsInterpolate(glyphName, overlays)
+            if not boundsCache[glyphName]:
+                reasons.append("bounds of '%s' do not interpolate" % glyphName)
+        if len(italicAngles) > 1 and positionSplit in construction:
+            reasons.append("italic angle differs between masters")
+        return reasons
+
+    def instance(self, location, font, errors=None):
+        """
+        Return a list of construction glyphs for the given instance location.
+        Interpolation-safe constructions are interpolated,
+        all others are rebuilt in the given instance font.
+
+        Optionally provide an `errors` list to collect `(construction, message)` tuples
+        of rebuilt constructions instead of raising a `GlyphBuilderError`.
+        """
+        scalars = self.model.getScalars(normalizeLocation(location, self.axes))
+        interpolate = self.model.interpolateFromDeltasAndScalars
+        overlayFont = ConstructionOverlayFont(font)
+        result = []
+        for construction in self.constructions:
+            deltas = self._deltas.get(construction)
+            if deltas is None:
+                try:
+                    glyph = GlyphConstructionBuilder(construction, overlayFont, characterMap=self.characterMap)
+                except GlyphBuilderError as err:
+                    if errors is None:
+                        raise
+                    errors.append((construction, str(err)))
+                    continue
+                if glyph.name is None:
+                    continue
+            else:
+                values = [interpolate(delta, scalars) for delta in deltas]
+                master = self._glyphs[construction]
+                glyph = ConstructionGlyph(overlayFont)
+                glyph.name = master.name
+                glyph.unicodes = list(master.unicodes)
+                glyph.note = master.note
+                glyph.markColor = master.markColor
+                glyph.shouldDecompose = master.shouldDecompose
+                for i, (glyphName, _) in enumerate(master.components):
+                    glyph.addComponent(glyphName, tuple(values[i * 6:i * 6 + 6]))
+                glyph.width = values[-1]
+            # keep the overlay font alive as long as the constructed glyphs
+            glyph._glyphset = lambda: overlayFont
+            overlayFont[glyph.name] = glyph
+            result.append(glyph)
+        return result
+
+    @classmethod
+    def fromDesignSpace(cls, designSpace, constructions, openFont=None, characterMap=None):
+        """
+        Create an interpolator from a designspace document or path.
+        Optionally provide a callback to open a source font from a path, defcon is used by default.
+        """
+        from fontTools.designspaceLib import DesignSpaceDocument
+        if not isinstance(designSpace, DesignSpaceDocument):
+            designSpace = DesignSpaceDocument.fromfile(designSpace)
+        if openFont is None:
+            from defcon import Font as openFont
+        axes = dict()
+        for axis in designSpace.axes:
+            axes[axis.name] = tuple(axis.map_forward(value) for value in (axis.minimum, axis.default, axis.maximum))
+        masters = []
+        for source in designSpace.sources:
+            font = source.font
+            if font is None:
+                font = openFont(source.path)
+            masters.append((source.location, font))
+        return cls(constructions, masters, axes=axes, characterMap=characterMap)
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
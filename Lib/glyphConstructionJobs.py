@@ -0,0 +1,227 @@
+"""
+Evaluate glyph constructions on a worker thread.
+
+A job runner has a single worker thread running one job at a time.
+Submitting a new job supersedes the pending and the running job: both are cancelled,
+a running job stops at the next construction. Jobs work on an immutable `FontSnapshot`,
+taken on the submitting thread, so the font can keep changing while a job runs.
+
+Callbacks of finished jobs are handed over with the `deliver` function of the runner,
+for example a function calling the callback on the main thread of an application.
+"""
+
+import threading
+
+from glyphConstruction import FontSnapshot, IterBuildGlyphConstructions, ParseGlyphConstructionListFromString
+
+
+class ConstructionJobCancelled(Exception):
+    pass
+
+
+class ConstructionJob(object):
+
+    """
+    A single job. The job function is called with the job and the job arguments,
+    the function should check `job.cancelled` regularly, or call `job.checkCancelled()`.
+
+    * `result`: the return value of the job function
+    * `error`: the exception raised by the job function or `None`
+    """
+
+    def __init__(self, function, args, callback=None):
+        self.function = function
+        self.args = args
+        self.callback = callback
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return "<ConstructionJob %s>" % getattr(self.function, "__name__", self.function)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _get_cancelled(self):
+        return self._cancelled.is_set()
+
+    cancelled = property(_get_cancelled)
+
+    def checkCancelled(self):
+        """
+        Raise `ConstructionJobCancelled` when the job is cancelled.
+        """
+        if self._cancelled.is_set():
+            raise ConstructionJobCancelled()
+
+    def _get_done(self):
+        return self._done.is_set()
+
+    done = property(_get_done)
+
+    def wait(self, timeout=None):
+        """
+        Wait until the job is done or cancelled, return `True` when done.
+        """
+        return self._done.wait(timeout)
+
+    def run(self):
+        try:
+            self.result = self.function(self, *self.args)
+        except ConstructionJobCancelled:
+            self.cancel()
+        except Exception as err:
+            self.error = err
+        finally:
+            self._done.set()
+
+
+def _deliverDirectly(callback, *args):
+    callback(*args)
+
+
+class ConstructionJobRunner(object):
+
+    """
+    Run jobs on a single worker thread, a newer job supersedes the pending and the running job.
+
+    The optional `deliver` function is called on the worker thread with a callback and its arguments,
+    by default the callback is called directly on the worker thread.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> runner = ConstructionJobRunner()
+    >>> results = []
+    >>> job = runner.submitConstructions("agrave = a + grave@center,top", font, callback=results.append)
+    >>> runner.wait(5)
+    True
+    >>> glyphs, errors = job.result
+    >>> [glyph.name for glyph in glyphs], errors, results == [job]
+    (['agrave'], [], True)
+
+    A newer job supersedes older jobs.
+
+    >>> started = threading.Event()
+    >>> def slowJob(job):
+    ...     started.set()
+    ...     while True:
+    ...         job.checkCancelled()
+    ...         job._cancelled.wait(.01)
+    >>> job1 = runner.submit(slowJob)
+    >>> started.wait(5)
+    True
+    >>> job2 = runner.submit(slowJob)
+    >>> job3 = runner.submitConstructions("f_i = f & i", font)
+    >>> job3.wait(5)
+    True
+    >>> job1.cancelled, job2.cancelled, job3.cancelled
+    (True, True, False)
+    >>> runner.shutdown()
+    """
+
+    def __init__(self, deliver=None):
+        if deliver is None:
+            deliver = _deliverDirectly
+        self.deliver = deliver
+        self._condition = threading.Condition()
+        self._pending = None
+        self._running = None
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Submit a job function, called with the job and the given arguments on the worker thread.
+        Optionally provide a `callback`, called with the finished job if the job is not cancelled.
+        """
+        job = ConstructionJob(function, args, kwargs.get("callback"))
+        with self._condition:
+            self._cancelJobs()
+            self._pending = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="glyphConstructionJobs")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+        return job
+
+    def submitConstructions(self, constructions, font, characterMap=None, callback=None):
+        """
+        Submit a job parsing and building the constructions against a snapshot of the font.
+        The result of the job is a tuple of the constructed glyphs and a list of `(construction, message)` errors.
+        """
+        if not isinstance(font, FontSnapshot):
+            font = FontSnapshot(font)
+        return self.submit(_buildConstructionsJob, constructions, font, characterMap, callback=callback)
+
+    def cancel(self, wait=True):
+        """
+        Cancel the pending and the running job,
+        when `wait` is set this waits until the running job stopped.
+        """
+        with self._condition:
+            running = self._running
+            self._cancelJobs()
+        if wait and running is not None and threading.current_thread() is not self._thread:
+            running.wait()
+
+    def wait(self, timeout=None):
+        """
+        Wait until there is no pending or running job, return `True` when the runner is idle.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and self._running is None, timeout)
+
+    def shutdown(self, wait=True):
+        """
+        Cancel all jobs and stop the worker thread.
+        """
+        with self._condition:
+            self._cancelJobs()
+            self._stopped = True
+            self._condition.notify_all()
+            thread = self._thread
+        if wait and thread is not None and threading.current_thread() is not thread:
+            thread.join()
+
+    def _cancelJobs(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending._done.set()
+            self._pending = None
+        if self._running is not None:
+            self._running.cancel()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None or self._stopped)
+                if self._stopped:
+                    return
+                job = self._running = self._pending
+                self._pending = None
+            job.run()
+            if not job.cancelled and job.callback is not None:
+                self.deliver(job.callback, job)
+            with self._condition:
+                self._running = None
+                self._condition.notify_all()
+
+
+def _buildConstructionsJob(job, constructions, font, characterMap):
+    if isinstance(constructions, str):
+        constructions = ParseGlyphConstructionListFromString(constructions, font)
+    errors = []
+    glyphs = []
+    for glyph in IterBuildGlyphConstructions(constructions, font, characterMap=characterMap, errors=errors):
+        job.checkCancelled()
+        glyphs.append(glyph)
+    return glyphs, errors
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
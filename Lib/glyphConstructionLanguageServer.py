@@ -0,0 +1,540 @@
+"""
+A Language Server Protocol server for glyph construction files, running over stdio.
+
+Every open document keeps a preview model and a tokenizer, edits are applied as line replacements,
+so only the edited lines and the lines depending on them are parsed, built and tokenized again.
+Diagnostics are cached per line and only checked again for the lines changed by an edit.
+
+* diagnostics: construction errors and references to glyphs that do not exist
+* go to definition: `{variables}` and glyph names constructed in the document
+* completion: glyph names, anchor names, position names and variables
+* hover: the resolved components of a construction or the resolved position of a component
+
+Glyph and anchor names are read from the UFO given with the `ufo` initialization option
+or the `glyphConstruction.ufo` setting. Start the server with `glyphconstruction-lsp [ufo]`.
+"""
+
+import json
+import sys
+
+from glyphConstruction import GlyphConstructionTokenizer, tokenWhitespace, tokenOperator, tokenGlyphName, tokenConstructionName, \
+    tokenVariable, tokenPosition, tokenAnchorName, tokenPositionNames, glyphNameSplit, baseGlyphSplit, markGlyphSplit, \
+    applyKerningSplit, positionSplit, variableDeclarationStart, explicitGlyphNameStart
+from glyphConstructionPreview import GlyphConstructionPreviewModel
+
+
+# LSP constants
+
+textDocumentSyncIncremental = 2
+diagnosticSeverityError = 1
+diagnosticSeverityWarning = 2
+completionItemKindVariable = 6
+completionItemKindValue = 12
+completionItemKindReference = 18
+completionItemKindConstant = 21
+
+_componentOperators = set((glyphNameSplit, baseGlyphSplit, markGlyphSplit, applyKerningSplit))
+
+
+def _toUTF16Column(line, column):
+    return len(line[:column].encode("utf-16-le")) // 2
+
+
+def _fromUTF16Column(line, character):
+    units = 0
+    for column, char in enumerate(line):
+        if units >= character:
+            return column
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line)
+
+
+def _stripGlyphName(text):
+    if text.startswith(explicitGlyphNameStart):
+        return text[1:-1]
+    return text
+
+
+class _FontIndex(object):
+
+    """
+    Glyph names and anchor names of a font, indexed once.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.anchorNames = set()
+        for glyph in font:
+            for anchor in glyph.anchors:
+                if anchor.name:
+                    self.anchorNames.add(anchor.name)
+
+
+class _DiagnosticsCache(object):
+
+    """
+    Diagnostics per entry of a document. Only entries changed in the preview model,
+    and entries referring to missing glyph names constructed by changed entries, are checked again.
+    """
+
+    def __init__(self):
+        # entry: (constructed glyph name, missing glyph names)
+        self.entries = dict()
+        # only entries with diagnostics
+        self.diagnostics = dict()
+        self.referrers = dict()
+        self.changed = set()
+        self.removed = set()
+
+    def modelChanged(self, model, changed, removed):
+        self.changed.update(changed)
+        self.changed.difference_update(removed)
+        self.removed.update(removed)
+
+    def _discard(self, entry):
+        glyphName, missingGlyphNames = self.entries.pop(entry, (None, ()))
+        self.diagnostics.pop(entry, None)
+        for missingGlyphName in missingGlyphNames:
+            referrers = self.referrers[missingGlyphName]
+            referrers.discard(entry)
+            if not referrers:
+                del self.referrers[missingGlyphName]
+        return glyphName
+
+    def update(self, check):
+        """
+        Check all invalidated entries, `check` returns the missing glyph names and the diagnostics of an entry.
+        """
+        changedGlyphNames = set()
+        for entry in self.removed:
+            changedGlyphNames.add(self._discard(entry))
+        todo = set(self.changed)
+        for entry in self.changed:
+            glyphName = self._discard(entry)
+            if glyphName != entry.glyphName:
+                changedGlyphNames.update((glyphName, entry.glyphName))
+        changedGlyphNames.discard(None)
+        for glyphName in changedGlyphNames:
+            todo.update(self.referrers.get(glyphName, ()))
+        self.changed = set()
+        self.removed = set()
+        for entry in todo:
+            self._discard(entry)
+            missingGlyphNames, diagnostics = check(entry)
+            self.entries[entry] = entry.glyphName, missingGlyphNames
+            if diagnostics:
+                self.diagnostics[entry] = diagnostics
+            for missingGlyphName in missingGlyphNames:
+                self.referrers.setdefault(missingGlyphName, set()).add(entry)
+        return len(todo)
+
+
+class GlyphConstructionDocument(object):
+
+    """
+    An open glyph construction document with an incremental parse index.
+    """
+
+    def __init__(self, uri, text, font):
+        self.uri = uri
+        self.diagnosticsCache = _DiagnosticsCache()
+        self.model = GlyphConstructionPreviewModel(font)
+        self.model.addObserver(self.diagnosticsCache.modelChanged)
+        self.model.setText(text)
+        self.tokenizer = GlyphConstructionTokenizer(text)
+
+    def _get_lines(self):
+        return self.tokenizer.lines
+
+    lines = property(_get_lines)
+
+    def applyChange(self, change):
+        """
+        Apply a LSP content change, a change without range replaces the whole text.
+        """
+        if "range" not in change:
+            self.model.setText(change["text"])
+            self.tokenizer.setText(change["text"])
+            return
+        lines = self.lines
+        start = change["range"]["start"]
+        end = change["range"]["end"]
+        startLine = min(start["line"], len(lines) - 1)
+        endLine = min(end["line"], len(lines) - 1)
+        startColumn = _fromUTF16Column(lines[startLine], start["character"])
+        endColumn = _fromUTF16Column(lines[endLine], end["character"])
+        text = lines[startLine][:startColumn] + change["text"] + lines[endLine][endColumn:]
+        newLines = text.split("\n")
+        self.model.replaceLines(startLine, endLine + 1, newLines)
+        self.tokenizer.replaceLines(startLine, endLine + 1, newLines)
+
+    def tokenAt(self, line, character):
+        """
+        Return the `(index, column, tokenType, text)` of the token at the LSP position or `None`.
+        """
+        if line >= len(self.lines):
+            return None
+        column = _fromUTF16Column(self.lines[line], character)
+        tokens = self.tokenizer.lineTokens(line)
+        for index, (tokenColumn, tokenType, text) in enumerate(tokens):
+            if tokenColumn <= column <= tokenColumn + len(text) and tokenType != tokenWhitespace:
+                return index, tokenColumn, tokenType, text
+        return None
+
+    def componentIndex(self, line, tokenIndex):
+        """
+        Return the index of the component a token belongs to, as built by the construction.
+        """
+        componentIndex = -1
+        previous = None
+        for index, (_, tokenType, text) in enumerate(self.tokenizer.lineTokens(line)):
+            if index > tokenIndex:
+                break
+            if tokenType == tokenWhitespace:
+                continue
+            if tokenType in (tokenGlyphName, tokenVariable) and previous is not None and previous[0] == tokenOperator and previous[1] in _componentOperators:
+                componentIndex += 1
+            previous = tokenType, text
+        return componentIndex
+
+    def range(self, line, start, end):
+        text = self.lines[line]
+        return dict(
+            start=dict(line=line, character=_toUTF16Column(text, start)),
+            end=dict(line=line, character=_toUTF16Column(text, end))
+        )
+
+
+class GlyphConstructionLanguageServer(object):
+
+    """
+    A language server handling JSON-RPC messages, responses and notifications are given to `send`.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> font["grave"].appendAnchor(dict(name="_top", x=140, y=100))
+    >>> messages = []
+    >>> server = GlyphConstructionLanguageServer(font, send=messages.append)
+    >>> server.handle(dict(id=1, method="initialize", params=dict()))["capabilities"]["textDocumentSync"]
+    2
+    >>> text = chr(10).join(["$mark = grave", "agrave = a + {mark}@center,top", "aacute = a + acute", "agrave.alt = agrave"])
+    >>> server.handle(dict(method="textDocument/didOpen", params=dict(textDocument=dict(uri="file:///test.glyphConstruction", text=text))))
+    >>> [(diagnostic["range"]["start"], diagnostic["message"]) for diagnostic in messages[-1]["params"]["diagnostics"]]
+    [({'line': 2, 'character': 13}, "Glyph 'acute' does not exist")]
+
+    Edits only update the edited lines.
+
+    >>> change = dict(range=dict(start=dict(line=2, character=13), end=dict(line=2, character=18)), text="grave")
+    >>> server.handle(dict(method="textDocument/didChange", params=dict(textDocument=dict(uri="file:///test.glyphConstruction"), contentChanges=[change])))
+    >>> messages[-1]["params"]["diagnostics"]
+    []
+    >>> position = lambda line, character: dict(textDocument=dict(uri="file:///test.glyphConstruction"), position=dict(line=line, character=character))
+    >>> server.handle(dict(id=2, method="textDocument/definition", params=position(1, 15)))["range"]["start"]
+    {'line': 0, 'character': 0}
+    >>> server.handle(dict(id=3, method="textDocument/definition", params=position(3, 15)))["range"]
+    {'start': {'line': 1, 'character': 0}, 'end': {'line': 1, 'character': 30}}
+    >>> print(server.handle(dict(id=4, method="textDocument/hover", params=position(1, 25)))["contents"]["value"])
+    grave: offset (-10, 100)
+    >>> print(server.handle(dict(id=5, method="textDocument/hover", params=position(1, 1)))["contents"]["value"])
+    agrave: width 60
+    a: offset (0, 0)
+    grave: offset (-10, 100)
+    >>> items = server.handle(dict(id=6, method="textDocument/completion", params=position(1, 20)))["items"]
+    >>> "_top" in [item["label"] for item in items], "center" in [item["label"] for item in items]
+    (True, True)
+    >>> items = server.handle(dict(id=7, method="textDocument/completion", params=position(3, 15)))["items"]
+    >>> sorted(item["label"] for item in items if item["label"].startswith("a"))
+    ['a', 'aacute', 'agrave', 'agrave.alt']
+
+    Diagnostics are cached, a line is only checked again when it changed
+    or when a missing glyph it refers to is constructed or removed in another line.
+
+    >>> document = server.documents["file:///test.glyphConstruction"]
+    >>> change = dict(range=dict(start=dict(line=2, character=13), end=dict(line=2, character=18)), text="ogonek")
+    >>> server.handle(dict(method="textDocument/didChange", params=dict(textDocument=dict(uri="file:///test.glyphConstruction"), contentChanges=[change])))
+    >>> [diagnostic["message"] for diagnostic in messages[-1]["params"]["diagnostics"]]
+    ["Glyph 'ogonek' does not exist"]
+    >>> document.applyChange(dict(range=dict(start=dict(line=3, character=0), end=dict(line=3, character=10)), text="ogonek"))
+    >>> document.diagnosticsCache.update(lambda entry: server._entryDiagnostics(document, entry))
+    2
+    >>> server.diagnostics(document)
+    []
+    >>> server.handle(dict(id=8, method="shutdown"))
+    """
+
+    def __init__(self, font=None, send=None):
+        self.documents = dict()
+        self.send = send
+        self._running = True
+        self.setFont(font)
+
+    def setFont(self, font):
+        """
+        Set the font glyph and anchor names are read from, a path to a UFO or a font object.
+        """
+        if font is None or isinstance(font, str):
+            import defcon
+            font = defcon.Font(font)
+        self.font = font
+        self.fontIndex = _FontIndex(font)
+        for document in self.documents.values():
+            document.model.setFont(font)
+            self.publishDiagnostics(document)
+
+    # messages
+
+    def handle(self, message):
+        """
+        Handle a JSON-RPC message, return the result of a request.
+        """
+        method = message.get("method")
+        params = message.get("params") or dict()
+        handler = self._handlers.get(method)
+        if handler is None:
+            if "id" in message:
+                self._sendMessage(dict(id=message["id"], error=dict(code=-32601, message="Method not found: %s" % method)))
+            return None
+        try:
+            result = handler(self, params)
+        except Exception as err:
+            # keep the server running
+            if "id" in message:
+                self._sendMessage(dict(id=message["id"], error=dict(code=-32603, message=str(err))))
+            return None
+        if "id" in message:
+            self._sendMessage(dict(id=message["id"], result=result))
+        return result
+
+    def _sendMessage(self, message):
+        message["jsonrpc"] = "2.0"
+        if self.send is not None:
+            self.send(message)
+
+    def run(self, inputStream=None, outputStream=None):
+        """
+        Read and handle messages from the input stream until the client exits.
+        """
+        if inputStream is None:
+            inputStream = sys.stdin.buffer
+        if outputStream is None:
+            outputStream = sys.stdout.buffer
+
+        def send(message):
+            body = json.dumps(message).encode("utf-8")
+            outputStream.write(b"Content-Length: %d\r\n\r\n" % len(body))
+            outputStream.write(body)
+            outputStream.flush()
+
+        self.send = send
+        while self._running:
+            length = None
+            while True:
+                header = inputStream.readline()
+                if not header:
+                    return
+                header = header.strip()
+                if not header:
+                    break
+                name, _, value = header.decode("ascii").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            if length is None:
+                continue
+            self.handle(json.loads(inputStream.read(length).decode("utf-8")))
+
+    # lifecycle
+
+    def initialize(self, params):
+        options = params.get("initializationOptions") or dict()
+        if options.get("ufo"):
+            self.setFont(options["ufo"])
+        return dict(
+            capabilities=dict(
+                textDocumentSync=textDocumentSyncIncremental,
+                definitionProvider=True,
+                hoverProvider=True,
+                completionProvider=dict(triggerCharacters=[positionSplit, "{", markGlyphSplit, baseGlyphSplit])
+            ),
+            serverInfo=dict(name="glyphConstruction")
+        )
+
+    def didChangeConfiguration(self, params):
+        settings = (params.get("settings") or dict()).get("glyphConstruction") or dict()
+        if settings.get("ufo"):
+            self.setFont(settings["ufo"])
+
+    def shutdown(self, params):
+        return None
+
+    def exit(self, params):
+        self._running = False
+
+    # documents
+
+    def didOpen(self, params):
+        textDocument = params["textDocument"]
+        document = self.documents[textDocument["uri"]] = GlyphConstructionDocument(textDocument["uri"], textDocument["text"], self.font)
+        self.publishDiagnostics(document)
+
+    def didChange(self, params):
+        document = self.documents[params["textDocument"]["uri"]]
+        for change in params["contentChanges"]:
+            document.applyChange(change)
+        self.publishDiagnostics(document)
+
+    def didClose(self, params):
+        uri = params["textDocument"]["uri"]
+        self.documents.pop(uri, None)
+        self._sendMessage(dict(method="textDocument/publishDiagnostics", params=dict(uri=uri, diagnostics=[])))
+
+    def _glyphExists(self, document, glyphName):
+        return glyphName in self.font or document.model.definingEntry(glyphName) is not None
+
+    def _entryDiagnostics(self, document, entry):
+        # diagnostics as (start, end, severity, message) tuples
+        missingGlyphNames = set()
+        diagnostics = []
+        line = entry.index
+        if entry.error:
+            text = document.lines[line]
+            start = len(text) - len(text.lstrip())
+            diagnostics.append((start, len(text.rstrip()), diagnosticSeverityError, entry.error))
+        if entry.construction:
+            for column, tokenType, text in document.tokenizer.lineTokens(line):
+                glyphName = _stripGlyphName(text)
+                if tokenType == tokenGlyphName and not self._glyphExists(document, glyphName):
+                    missingGlyphNames.add(glyphName)
+                    diagnostics.append((column, column + len(text), diagnosticSeverityWarning, "Glyph '%s' does not exist" % glyphName))
+        return missingGlyphNames, diagnostics
+
+    def diagnostics(self, document):
+        """
+        Return LSP diagnostics for all construction errors and references to missing glyphs.
+        Diagnostics are cached per line, only lines invalidated by the preview model are checked again.
+        """
+        cache = document.diagnosticsCache
+        cache.update(lambda entry: self._entryDiagnostics(document, entry))
+        result = []
+        for entry in sorted(cache.diagnostics, key=lambda entry: entry.index):
+            for start, end, severity, message in cache.diagnostics[entry]:
+                result.append(dict(range=document.range(entry.index, start, end), severity=severity, source="glyphConstruction", message=message))
+        return result
+
+    def publishDiagnostics(self, document):
+        self._sendMessage(dict(method="textDocument/publishDiagnostics", params=dict(uri=document.uri, diagnostics=self.diagnostics(document))))
+
+    # language features
+
+    def _documentPosition(self, params):
+        document = self.documents.get(params["textDocument"]["uri"])
+        position = params["position"]
+        return document, position["line"], position["character"]
+
+    def definition(self, params):
+        document, line, character = self._documentPosition(params)
+        if document is None:
+            return None
+        found = document.tokenAt(line, character)
+        if found is None:
+            return None
+        _, _, tokenType, text = found
+        if tokenType == tokenVariable:
+            variableName = text[1:-1]
+            for entry in reversed(document.model.entries):
+                if variableName in entry.declarations:
+                    start = document.lines[entry.index].index(variableDeclarationStart)
+                    return dict(uri=document.uri, range=document.range(entry.index, start, len(document.lines[entry.index])))
+        elif tokenType in (tokenGlyphName, tokenConstructionName):
+            entry = document.model.definingEntry(_stripGlyphName(text), line)
+            if entry is not None:
+                start, end = entry.construction.constructionSource.start, entry.construction.constructionSource.end
+                return dict(uri=document.uri, range=document.range(entry.index, start, end))
+        return None
+
+    def hover(self, params):
+        document, line, character = self._documentPosition(params)
+        if document is None:
+            return None
+        found = document.tokenAt(line, character)
+        if found is None:
+            return None
+        tokenIndex, column, tokenType, text = found
+        entry = document.model.entries[line]
+        value = None
+        if tokenType == tokenVariable:
+            variableName = text[1:-1]
+            if variableName in document.model.variables:
+                value = "%s = %s" % (variableName, document.model.variables[variableName])
+        elif entry.glyph is not None:
+            components = entry.glyph.components
+            if tokenType == tokenConstructionName:
+                value = ["%s: width %s" % (entry.glyph.name, _formatNumber(entry.glyph.width))]
+                value.extend(_formatComponent(component) for component in components)
+                value = "\n".join(value)
+            elif tokenType in (tokenGlyphName, tokenPosition, tokenAnchorName):
+                componentIndex = document.componentIndex(line, tokenIndex)
+                if 0 <= componentIndex < len(components):
+                    value = _formatComponent(components[componentIndex])
+        if value is None:
+            return None
+        return dict(contents=dict(kind="plaintext", value=value), range=document.range(line, column, column + len(text)))
+
+    def completion(self, params):
+        document, line, character = self._documentPosition(params)
+        if document is None:
+            return None
+        text = document.lines[line][:_fromUTF16Column(document.lines[line], character)]
+        if "{" in text and "}" not in text[text.rindex("{"):]:
+            return dict(isIncomplete=False, items=[dict(label=name, kind=completionItemKindVariable, detail=value) for name, value in sorted(document.model.variables.items())])
+        # in a position: after an @ of the current component
+        lastComponent = max(text.rfind(operator) for operator in _componentOperators)
+        if text.rfind(positionSplit) > lastComponent:
+            items = [dict(label=name, kind=completionItemKindValue) for name in sorted(self.fontIndex.anchorNames)]
+            items.extend(dict(label=name, kind=completionItemKindConstant) for name in sorted(tokenPositionNames))
+            return dict(isIncomplete=False, items=items)
+        glyphNames = set(self.font.keys())
+        glyphNames.update(entry.glyphName for entry in document.model.entries if entry.glyphName)
+        return dict(isIncomplete=False, items=[dict(label=glyphName, kind=completionItemKindReference) for glyphName in sorted(glyphNames)])
+
+    _handlers = {
+        "initialize": initialize,
+        "initialized": lambda self, params: None,
+        "shutdown": shutdown,
+        "exit": exit,
+        "workspace/didChangeConfiguration": didChangeConfiguration,
+        "textDocument/didOpen": didOpen,
+        "textDocument/didChange": didChange,
+        "textDocument/didClose": didClose,
+        "textDocument/definition": definition,
+        "textDocument/hover": hover,
+        "textDocument/completion": completion,
+    }
+
+
+def _formatNumber(value):
+    if int(value) == value:
+        return "%i" % value
+    return "%.2f" % value
+
+
+def _formatComponent(component):
+    glyphName, (xx, xy, yx, yy, x, y) = component
+    text = "%s: offset (%s, %s)" % (glyphName, _formatNumber(x), _formatNumber(y))
+    if (xx, xy, yx, yy) != (1, 0, 0, 1):
+        text += " matrix (%s)" % ", ".join(_formatNumber(value) for value in (xx, xy, yx, yy))
+    return text
+
+
+def main(args=None):
+    """
+    Run the language server over stdio, optionally with a UFO path.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    server = GlyphConstructionLanguageServer(args[0] if args else None)
+    server.run()
+
+
+if __name__ == "__main__":
+    import doctest
+    sys.exit(doctest.testmod().failed)
@@ -0,0 +1,687 @@
+"""
+A headless preview model for glyph constructions.
+
+The model keeps every line of a glyph constructions text with its parsed construction
+and constructed glyph. Text edits are applied as line diffs, only the edited lines,
+lines using changed variables and the lines depending on the changed glyphs are evaluated again.
+The dependencies of every line, glyphs, anchors, guides, font metrics and kerning pairs,
+are kept up to date in a `ConstructionReverseIndex` of entries.
+
+Every line only sees the glyphs constructed by the lines before, like a full build.
+
+With a `ConstructionJobRunner` the evaluation runs on the worker thread of the runner,
+against a snapshot of the font. The worker only reads the model, the results of a job are applied
+to the entries with the `deliver` function of the runner, for example on the main thread.
+Edits are applied directly, a newer edit cancels a running evaluation and discards the results
+of an evaluation not applied yet, all entries not applied yet are evaluated by the next job.
+"""
+
+import string
+import heapq
+
+from glyphConstruction import GlyphConstructionBuilder, GlyphBuilderError, ParseGlyphConstructionLine, ParseVariables, RecordingFont, FontSnapshot, \
+    ConstructionTrace
+from glyphConstructionIndex import ConstructionReverseIndex, traceDependencies, dependencyGlyph
+
+
+_formatter = string.Formatter()
+
+
+def _variableNames(line):
+    names = set()
+    try:
+        for _, fieldName, _, _ in _formatter.parse(line):
+            if fieldName:
+                names.add(fieldName)
+    except ValueError:
+        pass
+    return names
+
+
+class PreviewEntry(object):
+
+    """
+    A single line in the preview model.
+
+    * `line`: the raw text of the line
+    * `index`: the line index
+    * `construction`: the parsed construction, an empty string for empty lines or `None`
+    * `glyph`: the constructed glyph or `None`
+    * `error`: an error message or `None`
+    * `dependencies`: all glyph names read while constructing the glyph
+    """
+
+    def __init__(self, line, index):
+        self.line = line
+        self.index = index
+        _, self.declarations = ParseVariables(line)
+        self.variableNames = _variableNames(line)
+        self.construction = None
+        self.glyph = None
+        self.error = None
+        self.dependencies = set()
+        self.font = None
+
+    def __repr__(self):
+        return "<PreviewEntry %s: %r>" % (self.index, self.line)
+
+    def _get_glyphName(self):
+        if self.glyph is None:
+            return None
+        return self.glyph.name
+
+    glyphName = property(_get_glyphName)
+
+
+class _PreviewEntryFont(object):
+
+    """
+    A font view for a single preview entry, glyphs constructed by preceding lines shadow the model font.
+    While evaluating, the glyphs of the evaluation shadow the glyphs of the entries.
+    """
+
+    def __init__(self, model, entry, evaluation=None):
+        self._model = model
+        self._entry = entry
+        self._evaluation = evaluation
+
+    def __getattr__(self, attr):
+        return getattr(self._model.buildFont, attr)
+
+    def __contains__(self, glyphName):
+        if self._model._definitionBefore(glyphName, self._entry.index, self._evaluation) is not None:
+            return True
+        return glyphName in self._model.buildFont
+
+    def __getitem__(self, glyphName):
+        entry = self._model._definitionBefore(glyphName, self._entry.index, self._evaluation)
+        if entry is not None:
+            if self._evaluation is not None and entry in self._evaluation.results:
+                return self._evaluation.results[entry].glyph
+            return entry.glyph
+        return self._model.buildFont[glyphName]
+
+
+class _PreviewResult(object):
+
+    """
+    The result of evaluating a single entry, applied to the entry by `_PreviewEvaluation.apply`.
+    """
+
+    def __init__(self, construction, glyph, error, dependencies, glyphDependencies):
+        self.construction = construction
+        self.glyph = glyph
+        self.error = error
+        self.dependencies = dependencies
+        self.glyphDependencies = glyphDependencies
+
+    def _get_glyphName(self):
+        if self.glyph is None:
+            return None
+        return self.glyph.name
+
+    glyphName = property(_get_glyphName)
+
+
+class _PreviewEvaluation(object):
+
+    """
+    Evaluate dirty entries of a model without changing the model,
+    the results are kept per entry until they are applied.
+    """
+
+    def __init__(self, model, dirty, removed):
+        self.model = model
+        self.dirty = dirty
+        self.removed = removed
+        self.results = dict()
+        self.changed = []
+        # glyph names constructed by evaluated entries
+        self.definitions = dict()
+
+    def run(self, job=None):
+        model = self.model
+        queue = [(entry.index, id(entry), entry) for entry in self.dirty]
+        heapq.heapify(queue)
+        while queue:
+            if job is not None and job.cancelled:
+                return False
+            _, _, entry = heapq.heappop(queue)
+            if entry in self.results:
+                continue
+            result = self.results[entry] = model._evaluateEntry(entry, self)
+            if result.glyphName is not None:
+                self.definitions.setdefault(result.glyphName, set()).add(entry)
+            self.changed.append(entry)
+            for dependent in model._dependents(set([entry.glyphName, result.glyphName]) - set([None]), entry.index):
+                if dependent not in self.results:
+                    heapq.heappush(queue, (dependent.index, id(dependent), dependent))
+        return True
+
+    def apply(self):
+        """
+        Apply the results to the entries of the model and post the changes,
+        only when no other evaluation started since.
+        """
+        model = self.model
+        if model._evaluation is not self:
+            return
+        model._evaluation = None
+        for entry in self.changed:
+            result = self.results[entry]
+            model._unregister(entry)
+            entry.construction = result.construction
+            entry.glyph = result.glyph
+            entry.error = result.error
+            entry.dependencies = result.glyphDependencies
+            model._register(entry, result.dependencies)
+        # all entries not applied yet were part of this evaluation
+        model._dirty = set()
+        model._removed = []
+        if self.changed or self.removed:
+            model._postChanges(self.changed, self.removed)
+
+
+class GlyphConstructionPreviewModel(object):
+
+    """
+    A UI independent preview model for glyph constructions text.
+
+    Observers are called with the model, a list of evaluated entries and a list of removed entries
+    after every change.
+
+    >>> from glyphConstruction import testDummyFont
+    >>> font = testDummyFont()
+    >>> model = GlyphConstructionPreviewModel(font)
+    >>> changes = []
+    >>> model.addObserver(lambda model, changed, removed: changes.append([entry.index for entry in changed]))
+    >>> model.setText(chr(10).join([
+    ...     "$pos = center,top",
+    ...     "agrave = a + grave@{pos}",
+    ...     "",
+    ...     "# a comment",
+    ...     "agrave.alt = agrave & i",
+    ...     "f_i = f & i",
+    ... ]))
+    >>> [entry.construction for entry in model.previewEntries()]
+    ['agrave = a + grave@center,top', '', 'agrave.alt = agrave & i', 'f_i = f & i']
+    >>> [glyph.name for glyph in model.glyphs()]
+    ['agrave', 'agrave.alt', 'f_i']
+    >>> model.entries[4].dependencies == set(["agrave", "i"])
+    True
+    >>> model.entriesUsing("glyph", "grave"), model.entriesUsing("anchor", "top")
+    ([<PreviewEntry 1: 'agrave = a + grave@{pos}'>], [])
+
+    Only the edited line and its dependents are evaluated.
+
+    >>> model.setText(chr(10).join([
+    ...     "$pos = center,top",
+    ...     "agrave = a + grave@{pos} ^ 100",
+    ...     "",
+    ...     "# a comment",
+    ...     "agrave.alt = agrave & i",
+    ...     "f_i = f & i",
+    ... ]))
+    >>> changes[-1]
+    [1, 4]
+    >>> model.entries[4].glyph.width
+    190.0
+
+    Changing a variable evaluates all lines using it.
+
+    >>> model.replaceLines(0, 1, ["$pos = center,bottom"])
+    >>> changes[-1]
+    [0, 1, 4]
+    >>> model.entries[1].glyph.components == GlyphConstructionBuilder("agrave = a + grave@center,bottom ^ 100", font).components
+    True
+
+    Changes in the font only evaluate the lines depending on the changed glyphs.
+
+    >>> model.observeFont()
+    >>> font["i"].width = 100
+    >>> changes[-1]
+    [4, 5]
+    >>> model.entries[4].glyph.width
+    200.0
+    >>> font["grave"].move((10, 0))
+    >>> changes[-1]
+    [1, 4]
+    >>> count = len(changes)
+    >>> fontChanges = []
+    >>> model.addFontObserver(lambda model, glyphNames: fontChanges.append(glyphNames))
+    >>> glyph = font.newGlyph("unused")
+    >>> len(changes) == count, fontChanges
+    (True, [{'unused'}])
+    >>> model.stopObservingFont()
+
+    Errors are kept per line.
+
+    >>> model.replaceLines(5, 6, ["f_i = f & {missing}"])
+    >>> model.entries[5].error
+    "Variable 'missing' is missing"
+    >>> [glyph.name for glyph in model.glyphs()]
+    ['agrave', 'agrave.alt']
+
+    Evaluate on a worker thread, results are applied with the `deliver` function of the runner.
+    Results of an evaluation delivered after a newer edit are discarded, the newer evaluation
+    evaluates all entries not applied yet.
+
+    >>> from glyphConstructionJobs import ConstructionJobRunner
+    >>> delivered = []
+    >>> runner = ConstructionJobRunner(deliver=lambda callback, *args: delivered.append((callback, args)))
+    >>> model = GlyphConstructionPreviewModel(font, "agrave = a + grave@center,top", runner=runner)
+    >>> runner.wait(5), model.glyphs()
+    (True, [])
+    >>> model.replaceLines(1, 1, ["agrave.alt = agrave & i"])
+    >>> runner.wait(5), len(delivered)
+    (True, 2)
+    >>> for callback, args in delivered:
+    ...     callback(*args)
+    >>> [glyph.name for glyph in model.glyphs()]
+    ['agrave', 'agrave.alt']
+
+    Flushing evaluates and applies all pending entries on the calling thread.
+
+    >>> model.replaceLines(2, 2, ["f_i = f & i"])
+    >>> model.flush()
+    >>> [glyph.name for glyph in model.glyphs()]
+    ['agrave', 'agrave.alt', 'f_i']
+    >>> runner.shutdown()
+    """
+
+    def __init__(self, font, text="", characterMap=None, runner=None):
+        self.font = font
+        self.characterMap = characterMap
+        self.runner = runner
+        self.entries = []
+        self.variables = dict()
+        self._snapshot = None
+        self._definitions = dict()
+        self.reverseIndex = ConstructionReverseIndex()
+        self._observers = []
+        self._fontObservers = []
+        # entries and removed entries not applied yet
+        self._dirty = set()
+        self._removed = []
+        self._evaluation = None
+        self._lineOffsets = None
+        self._updateSnapshot()
+        self.setText(text)
+
+    def _get_buildFont(self):
+        if self._snapshot is not None:
+            return self._snapshot
+        return self.font
+
+    buildFont = property(_get_buildFont, doc="The font used to build, a snapshot of the font when evaluating with a runner.")
+
+    def _updateSnapshot(self, glyphNames=None):
+        if self.runner is None or isinstance(self.font, FontSnapshot):
+            self._snapshot = None
+        elif self._snapshot is None or glyphNames is None:
+            self._snapshot = FontSnapshot(self.font)
+        else:
+            self._snapshot = FontSnapshot(self.font, previous=self._snapshot, glyphNames=glyphNames)
+
+    def _stopEvaluating(self):
+        # the model is only changed while no evaluation is running
+        if self.runner is not None:
+            self.runner.cancel()
+
+    # observers
+
+    def addObserver(self, callback):
+        self._observers.append(callback)
+
+    def removeObserver(self, callback):
+        if callback in self._observers:
+            self._observers.remove(callback)
+
+    def _postChanges(self, changed, removed):
+        for callback in list(self._observers):
+            callback(self, changed, removed)
+
+    def addFontObserver(self, callback):
+        """
+        Add a callback called with the model and the changed font glyph names,
+        or `None` when the whole font changed.
+        """
+        self._fontObservers.append(callback)
+
+    def removeFontObserver(self, callback):
+        if callback in self._fontObservers:
+            self._fontObservers.remove(callback)
+
+    def _postFontChanges(self, glyphNames):
+        for callback in list(self._fontObservers):
+            callback(self, glyphNames)
+
+    # text
+
+    def getText(self):
+        return "\n".join(entry.line for entry in self.entries)
+
+    def setText(self, text):
+        """
+        Set a new text, only the changed range of lines is evaluated.
+        """
+        lines = text.split("\n")
+        oldLines = [entry.line for entry in self.entries]
+        if not self.entries:
+            self.replaceLines(0, 0, lines)
+            return
+        start = 0
+        maxStart = min(len(lines), len(oldLines))
+        while start < maxStart and lines[start] == oldLines[start]:
+            start += 1
+        end = 0
+        maxEnd = min(len(lines), len(oldLines)) - start
+        while end < maxEnd and lines[-end - 1] == oldLines[-end - 1]:
+            end += 1
+        if start == len(lines) == len(oldLines):
+            return
+        self.replaceLines(start, len(oldLines) - end, lines[start:len(lines) - end])
+
+    def replaceLines(self, start, end, lines):
+        """
+        Replace the lines from `start` up to `end` with the given lines.
+        """
+        self._stopEvaluating()
+        self._lineOffsets = None
+        removed = self.entries[start:end]
+        inserted = [PreviewEntry(line, start + i) for i, line in enumerate(lines)]
+        self.entries[start:end] = inserted
+        for index in range(start + len(inserted), len(self.entries)):
+            self.entries[index].index = index
+
+        dirty = set(inserted)
+        changedNames = set()
+        for entry in removed:
+            changedNames.add(entry.glyphName)
+            self._unregister(entry)
+            self._dirty.discard(entry)
+        for entry in inserted:
+            entry.font = _PreviewEntryFont(self, entry)
+        if any(entry.declarations for entry in removed + inserted):
+            dirty.update(self._updateVariables())
+        self._evaluate(dirty, changedNames, start, removed)
+
+    def setFont(self, font):
+        """
+        Set a new font and evaluate all lines.
+        """
+        self._stopEvaluating()
+        self.font = font
+        self._snapshot = None
+        self._postFontChanges(None)
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Evaluate all lines.
+        """
+        self._stopEvaluating()
+        # font info, kerning, groups and guidelines are copied again, glyphs are shared
+        self._updateSnapshot(())
+        self._updateVariables()
+        self._evaluate(set(self.entries), set(), 0, [])
+
+    # font changes
+
+    def fontGlyphsChanged(self, glyphNames):
+        """
+        Evaluate only the lines depending on the given changed, added or removed glyph names of the font,
+        and the lines depending on those.
+        """
+        self._stopEvaluating()
+        glyphNames = set(glyphNames)
+        componentReferences = getattr(getattr(self.font, "layers", None), "defaultLayer", None)
+        componentReferences = getattr(componentReferences, "componentReferences", None)
+        if componentReferences:
+            # glyphs using the changed glyphs as component are changed as well
+            todo = list(glyphNames)
+            while todo:
+                for reference in componentReferences.get(todo.pop(), ()):
+                    if reference not in glyphNames:
+                        glyphNames.add(reference)
+                        todo.append(reference)
+        self._updateSnapshot(glyphNames)
+        self._postFontChanges(glyphNames)
+        self._evaluate(self.entriesUsingGlyphs(glyphNames), set(), 0, [])
+
+    def entriesUsingGlyphs(self, glyphNames):
+        """
+        Return all entries reading any of the given glyph names.
+        """
+        result = set()
+        for glyphName in glyphNames:
+            result.update(self.reverseIndex.consumers(dependencyGlyph, glyphName))
+        return result
+
+    def entriesUsing(self, kind, name):
+        """
+        Return the entries consuming a dependency in line order, see `ConstructionReverseIndex`.
+        """
+        return sorted(self.reverseIndex.consumers(kind, name), key=lambda entry: entry.index)
+
+    def observeFont(self):
+        """
+        Observe glyph level changes of the defcon font of the model.
+        Only lines depending on changed glyphs are evaluated,
+        a change in font info, kerning, groups or font guidelines evaluates all lines.
+        """
+        font = self.font
+        layer = font.layers.defaultLayer
+        font.dispatcher.addObserver(self, "_glyphChangedNotification", "Glyph.Changed")
+        layer.addObserver(self, "_layerGlyphNotification", "Layer.GlyphAdded")
+        layer.addObserver(self, "_layerGlyphNotification", "Layer.GlyphDeleted")
+        layer.addObserver(self, "_layerGlyphNotification", "Layer.GlyphNameChanged")
+        font.info.addObserver(self, "_fontChangedNotification", "Info.Changed")
+        font.kerning.addObserver(self, "_fontChangedNotification", "Kerning.Changed")
+        font.groups.addObserver(self, "_fontChangedNotification", "Groups.Changed")
+        font.addObserver(self, "_fontChangedNotification", "Font.GuidelinesChanged")
+        self._observedFont = font
+
+    def stopObservingFont(self):
+        font = getattr(self, "_observedFont", None)
+        if font is None:
+            return
+        layer = font.layers.defaultLayer
+        font.dispatcher.removeObserver(self, "Glyph.Changed")
+        layer.removeObserver(self, "Layer.GlyphAdded")
+        layer.removeObserver(self, "Layer.GlyphDeleted")
+        layer.removeObserver(self, "Layer.GlyphNameChanged")
+        font.info.removeObserver(self, "Info.Changed")
+        font.kerning.removeObserver(self, "Kerning.Changed")
+        font.groups.removeObserver(self, "Groups.Changed")
+        font.removeObserver(self, "Font.GuidelinesChanged")
+        self._observedFont = None
+
+    def _glyphChangedNotification(self, notification):
+        glyph = notification.object
+        layer = self.font.layers.defaultLayer
+        # ignore glyphs outside the default layer, like preview glyphs
+        if glyph.name in layer and layer[glyph.name] is glyph:
+            self.fontGlyphsChanged([glyph.name])
+
+    def _layerGlyphNotification(self, notification):
+        data = notification.data
+        if "name" in data:
+            self.fontGlyphsChanged([data["name"]])
+        else:
+            self.fontGlyphsChanged([data["oldValue"], data["newValue"]])
+
+    def _fontChangedNotification(self, notification):
+        self._postFontChanges(None)
+        self.rebuild()
+
+    # evaluation
+
+    def _updateVariables(self):
+        variables = dict()
+        for entry in self.entries:
+            variables.update(entry.declarations)
+        changedVariables = set(variables) ^ set(self.variables)
+        changedVariables.update(name for name in set(variables) & set(self.variables) if variables[name] != self.variables[name])
+        self.variables = variables
+        return set(entry for entry in self.entries if entry.variableNames & changedVariables)
+
+    def _definitionBefore(self, glyphName, index, evaluation=None):
+        found = None
+        definitions = self._definitions.get(glyphName, ())
+        if evaluation is not None:
+            results = evaluation.results
+            definitions = [entry for entry in definitions if entry not in results]
+            definitions.extend(evaluation.definitions.get(glyphName, ()))
+        for entry in definitions:
+            if entry.index < index and (found is None or entry.index > found.index):
+                found = entry
+        return found
+
+    def _unregister(self, entry):
+        glyphName = entry.glyphName
+        if glyphName is not None:
+            definitions = self._definitions.get(glyphName)
+            if definitions is not None:
+                definitions.discard(entry)
+                if not definitions:
+                    del self._definitions[glyphName]
+        self.reverseIndex.removeConstruction(entry)
+        entry.dependencies = set()
+
+    def _register(self, entry, dependencies):
+        if entry.glyphName is not None:
+            self._definitions.setdefault(entry.glyphName, set()).add(entry)
+        self.reverseIndex.setDependencies(entry, dependencies)
+
+    def _dependents(self, glyphNames, index):
+        return set(entry for entry in self.entriesUsingGlyphs(glyphNames) if entry.index > index)
+
+    def _evaluateEntry(self, entry, evaluation):
+        # only read the model, the result is applied by the evaluation
+        construction = None
+        glyph = None
+        error = None
+        # existing glyphs are recorded as dependencies for constructions starting with '?'
+        recordingFont = RecordingFont(self.buildFont)
+        record = recordingFont.record
+        try:
+            construction = ParseGlyphConstructionLine(entry.line, self.variables, recordingFont, lineNumber=entry.index)
+        except GlyphBuilderError as err:
+            error = str(err)
+        dependencies = set()
+        if construction:
+            recordingFont = RecordingFont(_PreviewEntryFont(self, entry, evaluation), record)
+            with ConstructionTrace() as trace:
+                try:
+                    glyph = GlyphConstructionBuilder(construction, recordingFont, characterMap=self.characterMap)
+                except GlyphBuilderError as err:
+                    error = str(err)
+            for glyphTrace in trace.glyphs:
+                dependencies.update(traceDependencies(glyphTrace))
+            if glyph is not None and glyph.name is None:
+                glyph = None
+                error = "Invalid construction: '%s'" % construction
+            if glyph is not None:
+                # draw components from the font view of the entry
+                entryFont = entry.font
+                glyph._glyphset = lambda: entryFont
+        glyphDependencies = recordingFont.recordedGlyphNames()
+        dependencies.update((dependencyGlyph, glyphName) for glyphName in glyphDependencies)
+        return _PreviewResult(construction, glyph, error, dependencies, glyphDependencies)
+
+    def _evaluate(self, dirty, changedNames, start, removed):
+        changedNames.discard(None)
+        dirty.update(self._dependents(changedNames, start - 1))
+        self._dirty.update(dirty)
+        self._removed.extend(removed)
+        # the evaluation gets its own copy, the model only changes when the evaluation is applied
+        evaluation = self._evaluation = _PreviewEvaluation(self, set(self._dirty), list(self._removed))
+        if self.runner is None:
+            evaluation.run()
+            evaluation.apply()
+        else:
+            self.runner.submit(self._evaluateJob, evaluation)
+
+    def flush(self):
+        """
+        Evaluate and apply all entries not applied yet on the calling thread,
+        an evaluation running on the worker thread of the runner is cancelled.
+        """
+        self._stopEvaluating()
+        if self._evaluation is None:
+            return
+        evaluation = self._evaluation = _PreviewEvaluation(self, set(self._dirty), list(self._removed))
+        evaluation.run()
+        evaluation.apply()
+
+    def _evaluateJob(self, job, evaluation):
+        if evaluation.run(job):
+            self.runner.deliver(evaluation.apply)
+
+    # results
+
+    def previewEntries(self):
+        """
+        Return all entries with a construction or an empty line, without leading and trailing empty lines.
+        This is equal to the result of `ParseGlyphConstructionListFromString`.
+        """
+        entries = [entry for entry in self.entries if entry.construction is not None]
+        while entries and not entries[0].construction:
+            entries.pop(0)
+        while entries and not entries[-1].construction:
+            entries.pop()
+        return entries
+
+    def definingEntry(self, glyphName, index=None):
+        """
+        Return the entry constructing the glyph name as seen from the line index:
+        the last definition before the line, otherwise the last definition in the text.
+        """
+        if index is not None:
+            found = self._definitionBefore(glyphName, index)
+            if found is not None:
+                return found
+        return self._definitionBefore(glyphName, len(self.entries))
+
+    def textRange(self, entry):
+        """
+        Return the `(start, end)` character range of the construction of an entry in the text,
+        or `None` when the entry has no construction.
+
+        >>> from glyphConstruction import testDummyFont
+        >>> model = GlyphConstructionPreviewModel(testDummyFont(), "$mark = grave" + chr(10) + "  agrave = a + {mark}")
+        >>> start, end = model.textRange(model.entries[1])
+        >>> model.getText()[start:end]
+        'agrave = a + {mark}'
+        """
+        if not entry.construction:
+            return None
+        if self._lineOffsets is None:
+            offsets = []
+            offset = 0
+            for item in self.entries:
+                offsets.append(offset)
+                offset += len(item.line) + 1
+            self._lineOffsets = offsets
+        source = entry.construction.constructionSource
+        offset = self._lineOffsets[entry.index]
+        return offset + source.start, offset + source.end
+
+    def glyphs(self):
+        """
+        Return all constructed glyphs.
+        """
+        return [entry.glyph for entry in self.entries if entry.glyph is not None]
+
+    def errors(self):
+        """
+        Return a list of `(entry, error)` tuples.
+        """
+        return [(entry, entry.error) for entry in self.entries if entry.error]
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
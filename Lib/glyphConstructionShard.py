@@ -0,0 +1,337 @@
+"""
+Split glyph constructions into shards which are built independently, for example on different machines,
+and merge the results.
+
+    glyphconstruction-shard build MyFont.ufo -r accents.glyphConstruction --shard 1/4 -o shard1.json
+    glyphconstruction-shard merge MyFont.ufo -r accents.glyphConstruction shard*.json
+
+Constructions reading a glyph constructed by another construction, and constructions of the same glyph,
+are always in the same shard. Reads are found by splitting a construction like the builder does,
+see `parseReferencedGlyphNames`. Every possible read counts,
+so a shard never misses a glyph constructed in another shard.
+The split only depends on the constructions and the amount of shards:
+every machine parsing the same rules for the same font computes the same shards.
+
+A shard is built into a JSON manifest with the constructed glyphs and the errors.
+Merging checks that all manifests belong to the same constructions and the same font,
+and that every shard is present once,
+and returns the glyphs in the order of the constructions, the same result as a single build.
+"""
+
+import json
+import sys
+
+from glyphConstruction import ConstructionOverlayFont, GlyphBuilderError, GlyphConstructionBuilder, \
+    parseConstructedGlyphName, parseReferencedGlyphNames, __version__
+from glyphConstructionBuildCache import _hash, _fontKey, _kerningKey, _InputDigests, _glyphEntry, _restoreGlyph
+
+
+_formatVersion = 1
+
+
+class ShardManifestError(Exception):
+    pass
+
+
+def ShardGlyphConstructions(constructions, shardCount):
+    """
+    Split constructions into `shardCount` shards and return a list with the construction indexes of every shard.
+    Dependent constructions stay together, groups are spread over the shards largest first.
+
+    >>> constructions = ["agrave = a + grave@center,top", "agrave.alt = agrave & i", "f_i = f & i", "", "i.alt = i", "agrave = a + grave"]
+    >>> ShardGlyphConstructions(constructions, 2)
+    [[0, 1, 5], [2, 4]]
+    >>> ShardGlyphConstructions(constructions, 4)
+    [[0, 1, 5], [2], [4], []]
+    >>> ShardGlyphConstructions(["a-cy = a + grave@center,top", "i.alt = i", "f.alt = f", "x-cy = a-cy & i"], 2)
+    [[0, 3], [1, 2]]
+    """
+    if shardCount < 1:
+        raise ValueError("The amount of shards should be at least 1")
+    indexes = [index for index, construction in enumerate(constructions) if construction and isinstance(construction, str)]
+    parents = dict((index, index) for index in indexes)
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(index, other):
+        index, other = find(index), find(other)
+        if index != other:
+            parents[max(index, other)] = min(index, other)
+
+    definitions = dict()
+    for index in indexes:
+        glyphName = parseConstructedGlyphName(constructions[index])
+        if glyphName is not None:
+            definitions.setdefault(glyphName, []).append(index)
+    for sameGlyph in definitions.values():
+        for index in sameGlyph[1:]:
+            union(sameGlyph[0], index)
+    for index in indexes:
+        for glyphName in parseReferencedGlyphNames(constructions[index]):
+            if glyphName in definitions:
+                union(index, definitions[glyphName][0])
+
+    groups = dict()
+    for index in indexes:
+        groups.setdefault(find(index), []).append(index)
+    shards = [[] for _ in range(shardCount)]
+    # largest groups first, every group into the shard with the fewest constructions
+    for group in sorted(groups.values(), key=lambda group: (-len(group), group[0])):
+        shard = min(range(shardCount), key=lambda shardIndex: (len(shards[shardIndex]), shardIndex))
+        shards[shard].extend(group)
+    return [sorted(shard) for shard in shards]
+
+
+def _fontDigest(constructions, font):
+    # the font data the constructions can read: font info, guidelines, kerning and every referenced glyph
+    digests = _InputDigests(font)
+    glyphNames = set()
+    for construction in constructions:
+        if construction and isinstance(construction, str):
+            glyphNames.update(parseReferencedGlyphNames(construction))
+    return _hash(_fontKey(font), _kerningKey(font), *["%s:%s" % (glyphName, digests[glyphName]) for glyphName in sorted(glyphNames)])
+
+
+def _planKey(constructions, shardCount):
+    return _hash(str(_formatVersion), __version__, str(shardCount), *[str(construction) for construction in constructions])
+
+
+def BuildGlyphConstructionShard(constructions, font, shardIndex, shardCount, characterMap=None):
+    """
+    Build the constructions of shard `shardIndex` of `shardCount` shards, see `ShardGlyphConstructions`,
+    and return the manifest, a JSON compatible dictionary with the constructed glyphs and the errors.
+    """
+    if not 0 <= shardIndex < shardCount:
+        raise ValueError("Shard %s does not exist in %s shards" % (shardIndex, shardCount))
+    indexes = ShardGlyphConstructions(constructions, shardCount)[shardIndex]
+    overlayFont = ConstructionOverlayFont(font)
+    glyphs = []
+    errors = []
+    for index in indexes:
+        try:
+            glyph = GlyphConstructionBuilder(constructions[index], overlayFont, characterMap=characterMap)
+        except GlyphBuilderError as err:
+            errors.append([index, str(err)])
+            continue
+        if glyph.name is None:
+            continue
+        glyph._glyphset = lambda: overlayFont
+        overlayFont[glyph.name] = glyph
+        glyphs.append([index, _glyphEntry(glyph)])
+    return dict(
+        format=_formatVersion,
+        plan=_planKey(constructions, shardCount),
+        font=_fontDigest(constructions, font),
+        shard=shardIndex,
+        shards=shardCount,
+        constructions=indexes,
+        glyphs=glyphs,
+        errors=errors
+    )
+
+
+def MergeShardManifests(manifests, constructions, font, errors=None):
+    """
+    Merge the manifests of all shards of the constructions and return the constructed glyphs,
+    the same result as `BuildGlyphConstructions`.
+    A `ShardManifestError` is raised when a manifest does not belong to the constructions,
+    was built for another revision of the font, or a shard is missing.
+
+    >>> from fontTools.pens.recordingPen import RecordingPen
+    >>> from glyphConstruction import BuildGlyphConstructions, testDummyFont
+    >>> font = testDummyFont()
+    >>> constructions = ["agrave = a + grave@center,top", "agrave.alt = agrave & i", "f_i = f & i", "broken = a + grave@1,2,3", "i.alt = i"]
+    >>> manifests = [json.loads(json.dumps(BuildGlyphConstructionShard(constructions, font, shardIndex, 3))) for shardIndex in range(3)]
+    >>> [manifest["constructions"] for manifest in manifests]
+    [[0, 1], [2, 4], [3]]
+    >>> def glyphData(glyphs):
+    ...     result = []
+    ...     for glyph in glyphs:
+    ...         pen = RecordingPen()
+    ...         glyph.draw(pen)
+    ...         result.append((glyph.name, glyph.width, glyph.components, glyph.bounds, pen.value))
+    ...     return result
+    >>> errors = []
+    >>> glyphs = MergeShardManifests(reversed(manifests), constructions, font, errors=errors)
+    >>> [glyph.name for glyph in glyphs], errors
+    (['agrave', 'agrave.alt', 'f_i', 'i.alt'], [('broken = a + grave@1,2,3', 'Mark positions should have 6 or 2 options')])
+    >>> glyphData(glyphs) == glyphData(BuildGlyphConstructions(constructions, font, errors=[]))
+    True
+
+    >>> def merge(manifests, constructions):
+    ...     try:
+    ...         MergeShardManifests(manifests, constructions, font, errors=[])
+    ...     except ShardManifestError as err:
+    ...         print(err)
+    >>> merge(manifests[:2], constructions)
+    Missing shards: 3/3
+    >>> merge(manifests, constructions[:-1])
+    Manifest of shard 1/3 belongs to other constructions
+
+    A glyph read by the constructions changed after building the shards.
+
+    >>> font["grave"].move((0, 10))
+    >>> merge(manifests, constructions)
+    Manifest of shard 1/3 was built for another font
+    """
+    manifests = list(manifests)
+    if not manifests:
+        raise ShardManifestError("No manifests")
+    shardCount = manifests[0].get("shards")
+    if not isinstance(shardCount, int) or shardCount < 1:
+        raise ShardManifestError("Manifest without an amount of shards")
+    fontDigest = _fontDigest(constructions, font)
+    plan = _planKey(constructions, shardCount)
+    shards = ShardGlyphConstructions(constructions, shardCount)
+    glyphEntries = dict()
+    errorMessages = dict()
+    seen = set()
+    for manifest in manifests:
+        shardIndex = manifest.get("shard")
+        if shardIndex not in range(shardCount):
+            raise ShardManifestError("Manifest of shard %r does not exist in %s shards" % (shardIndex, shardCount))
+        shardName = "%s/%s" % (shardIndex + 1, shardCount)
+        if manifest.get("format") != _formatVersion:
+            raise ShardManifestError("Manifest of shard %s has an unsupported format" % shardName)
+        if manifest.get("shards") != shardCount or manifest.get("plan") != plan:
+            raise ShardManifestError("Manifest of shard %s belongs to other constructions" % shardName)
+        if manifest.get("font") != fontDigest:
+            raise ShardManifestError("Manifest of shard %s was built for another font" % shardName)
+        if shardIndex in seen:
+            raise ShardManifestError("Shard %s is given more than once" % shardName)
+        seen.add(shardIndex)
+        if manifest.get("constructions") != shards[shardIndex]:
+            raise ShardManifestError("Manifest of shard %s has other constructions" % shardName)
+        glyphEntries.update((index, entry) for index, entry in manifest["glyphs"])
+        errorMessages.update((index, message) for index, message in manifest["errors"])
+    missing = sorted(set(range(shardCount)) - seen)
+    if missing:
+        raise ShardManifestError("Missing shards: %s" % ", ".join("%s/%s" % (shardIndex + 1, shardCount) for shardIndex in missing))
+
+    overlayFont = ConstructionOverlayFont(font)
+    result = []
+    for index in sorted(set(glyphEntries) | set(errorMessages)):
+        construction = constructions[index]
+        if index in errorMessages:
+            if errors is None:
+                raise GlyphBuilderError(errorMessages[index])
+            errors.append((construction, errorMessages[index]))
+            continue
+        glyph = _restoreGlyph(glyphEntries[index], overlayFont, construction)
+        glyph._glyphset = lambda: overlayFont
+        overlayFont[glyph.name] = glyph
+        result.append(glyph)
+    return result
+
+
+def _parseShard(value):
+    import argparse
+    try:
+        shardNumber, shardCount = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("A shard is given as number/count, for example 1/4")
+    if not 1 <= shardNumber <= shardCount:
+        raise argparse.ArgumentTypeError("The shard number should be between 1 and the amount of shards")
+    return shardNumber - 1, shardCount
+
+
+def main(args=None):
+    """
+    Build a shard of the constructions of a font into a manifest, or merge the manifests of all shards into the font.
+    Shards are numbered from 1 on the command line.
+
+    >>> import os, tempfile
+    >>> from concurrent.futures import ProcessPoolExecutor
+    >>> from glyphConstruction import testDummyFont
+    >>> cwd = os.getcwd()
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> os.chdir(directory.name)
+    >>> testDummyFont().save("test.ufo")
+    >>> with open("test.glyphConstruction", "w") as f:
+    ...     _ = f.write(chr(10).join(["agrave = a + grave@center,top", "agrave.alt = agrave & i", "f_i = f & i", "i.alt = i"]))
+
+    Every process stands in for a machine building one shard.
+
+    >>> with ProcessPoolExecutor(2) as executor:
+    ...     list(executor.map(main, [["build", "test.ufo", "-r", "test.glyphConstruction", "--shard", "%s/2" % number, "-o", "shard%s.json" % number] for number in (1, 2)]))
+    [0, 0]
+    >>> main(["merge", "test.ufo", "-r", "test.glyphConstruction", "shard1.json"])
+    test.ufo
+        error: Missing shards: 2/2
+    1
+    >>> main(["merge", "test.ufo", "-r", "test.glyphConstruction", "shard1.json", "shard2.json"])
+    test.ufo
+        written: agrave agrave.alt f_i i.alt
+    0
+
+    The merge changed glyphs the constructions read, the manifests are outdated now.
+
+    >>> main(["merge", "test.ufo", "-r", "test.glyphConstruction", "shard1.json", "shard2.json"])
+    test.ufo
+        error: Manifest of shard 1/2 was built for another font
+    1
+
+    >>> os.chdir(cwd)
+    >>> directory.cleanup()
+    """
+    import argparse
+    import defcon
+    from glyphConstructionCommandLine import readConstructions, writeConstructionGlyph, constructionLocation, _characterMap, _parseColor
+    parser = argparse.ArgumentParser(prog="glyphconstruction-shard", description="Build glyph constructions in independent shards and merge the results.")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+    subparser = subparsers.add_parser("build", help="Build a single shard into a manifest.")
+    subparser.add_argument("font", help="UFO path")
+    subparser.add_argument("-r", "--rules", action="append", required=True, help="glyph construction file, can be given multiple times")
+    subparser.add_argument("--shard", type=_parseShard, required=True, help="shard number and amount of shards: number/count")
+    subparser.add_argument("-o", "--output", required=True, help="path of the manifest")
+    subparser.add_argument("--auto-unicodes", dest="autoUnicodes", action="store_true", help="set unicodes from glyph names")
+    subparser = subparsers.add_parser("merge", help="Merge the manifests of all shards and save the constructed glyphs in the font.")
+    subparser.add_argument("font", help="UFO path")
+    subparser.add_argument("manifests", nargs="+", metavar="manifest", help="manifest paths")
+    subparser.add_argument("-r", "--rules", action="append", required=True, help="glyph construction file, can be given multiple times")
+    subparser.add_argument("--no-overwrite", dest="overwrite", action="store_false", help="do not change existing glyphs")
+    subparser.add_argument("--mark-color", dest="markColor", type=_parseColor, help="mark color of the constructed glyphs: r,g,b,a")
+    options = parser.parse_args(args)
+
+    font = defcon.Font(options.font)
+    constructions = readConstructions(options.rules, font)
+    if options.command == "build":
+        shardIndex, shardCount = options.shard
+        manifest = BuildGlyphConstructionShard(constructions, font, shardIndex, shardCount, characterMap=_characterMap(vars(options)))
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        return 0
+
+    manifests = []
+    for path in options.manifests:
+        with open(path, "r", encoding="utf-8") as f:
+            manifests.append(json.load(f))
+    errors = []
+    print(options.font)
+    try:
+        glyphs = MergeShardManifests(manifests, constructions, font, errors=errors)
+    except ShardManifestError as err:
+        print("    error: %s" % err)
+        return 1
+    written = []
+    for glyph in glyphs:
+        if glyph.name in font and not options.overwrite:
+            continue
+        writeConstructionGlyph(glyph, font, options.markColor)
+        written.append(glyph.name)
+    if written:
+        font.save()
+        print("    written: %s" % " ".join(dict.fromkeys(written)))
+    for construction, message in errors:
+        print("    error: %s: %s" % (constructionLocation(getattr(construction, "constructionSource", None)), message))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    import doctest
+    sys.exit(doctest.testmod().failed)
@@ -0,0 +1,456 @@
+"""
+Share the font geometry glyph constructions read with worker processes.
+
+A `SharedFont` writes glyph names, widths, bounds, unicodes, anchors, guidelines, outlines,
+font info, font guidelines, kerning and groups into a single shared memory block.
+Pickling a `SharedFont` only sends the name of the block,
+a worker attaches in constant time and reads values straight from the shared buffer.
+
+Layout of the block, every section is aligned to 8 bytes:
+
+    header          magic, counts and the offset of every section
+    glyph columns   int64 per glyph: name, anchors, guidelines, outline and unicodes as (start, length) pairs
+    glyph metrics   double per glyph: width, height, xMin, yMin, xMax, yMax (nan without bounds)
+    glyph hash      int64 open addressing table from the crc32 of a glyph name to the glyph index
+    point columns   int64 per anchor or guideline: name offset and length (-1 without a name)
+    point values    double per anchor or guideline: x, y, angle (nan for anchors)
+    unicodes        int64
+    strings         utf-8 names and pickled packed outlines
+    font data       pickled font info, font guidelines, kerning and groups, decoded on first access
+
+Shared memory needs Python 3.8 or newer, creating a `SharedFont` raises a `RuntimeError` on older versions.
+"""
+
+import pickle
+import struct
+import zlib
+from math import isnan, nan
+from types import MappingProxyType, SimpleNamespace
+
+from fontTools.pens.pointPen import SegmentToPointPen
+from fontTools.pens.recordingPen import RecordingPen
+
+from glyphConstruction import shared_memory, openSharedMemory, packOutline, unpackOutline, _SnapshotObject, snapshotFontInfoAttributes
+
+
+_magic = b"GCSF0001"
+_header = struct.Struct("<8s4q9q")
+_sectionNames = ("glyphColumns", "glyphMetrics", "glyphHash", "pointColumns", "pointValues", "unicodes", "strings", "fontData", "end")
+
+_glyphColumnCount = 10
+_glyphMetricCount = 6
+_pointColumnCount = 2
+_pointValueCount = 3
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _hashSize(glyphCount):
+    size = 8
+    while size < glyphCount * 2:
+        size *= 2
+    return size
+
+
+def _nameHash(nameBytes):
+    return zlib.crc32(nameBytes)
+
+
+def _optional(value):
+    if value is None:
+        return nan
+    return value
+
+
+def _packFont(font):
+    """
+    Return the header values and the sections of a shared font as a list of bytes.
+    """
+    glyphColumns = []
+    glyphMetrics = []
+    pointColumns = []
+    pointValues = []
+    unicodes = []
+    strings = bytearray()
+
+    def addString(data):
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    def addPoint(name, x, y, angle=None):
+        if name is None:
+            pointColumns.extend((0, -1))
+        else:
+            pointColumns.extend(addString(name.encode("utf-8")))
+        pointValues.extend((_optional(x), _optional(y), _optional(angle)))
+
+    glyphNames = []
+    for glyph in font:
+        glyphNames.append(glyph.name)
+        nameOffset, nameLength = addString(glyph.name.encode("utf-8"))
+        anchorStart = len(pointValues) // _pointValueCount
+        for anchor in glyph.anchors:
+            addPoint(anchor.name, anchor.x, anchor.y)
+        guidelineStart = len(pointValues) // _pointValueCount
+        for guideline in getattr(glyph, "guidelines", ()):
+            addPoint(guideline.name, guideline.x, guideline.y, guideline.angle)
+        pointCount = len(pointValues) // _pointValueCount
+        pen = RecordingPen()
+        glyph.draw(pen)
+        outlineOffset, outlineLength = addString(pickle.dumps(packOutline(pen.value), pickle.HIGHEST_PROTOCOL))
+        unicodeStart = len(unicodes)
+        unicodes.extend(glyph.unicodes)
+        glyphColumns.extend((
+            nameOffset, nameLength,
+            anchorStart, guidelineStart - anchorStart,
+            guidelineStart, pointCount - guidelineStart,
+            outlineOffset, outlineLength,
+            unicodeStart, len(unicodes) - unicodeStart
+        ))
+        bounds = glyph.bounds or (nan, nan, nan, nan)
+        glyphMetrics.extend((glyph.width, getattr(glyph, "height", 0)) + tuple(bounds))
+
+    hashSize = _hashSize(len(glyphNames))
+    glyphHash = [-1] * hashSize
+    for index, glyphName in enumerate(glyphNames):
+        slot = _nameHash(glyphName.encode("utf-8")) & (hashSize - 1)
+        while glyphHash[slot] != -1:
+            slot = (slot + 1) & (hashSize - 1)
+        glyphHash[slot] = index
+
+    fontData = pickle.dumps(dict(
+        info=dict((attr, getattr(font.info, attr, None)) for attr in snapshotFontInfoAttributes),
+        guidelines=[dict(name=guideline.name, x=guideline.x, y=guideline.y, angle=guideline.angle) for guideline in getattr(font, "guidelines", ())],
+        kerning=dict(font.kerning.items()),
+        groups=dict((groupName, tuple(group)) for groupName, group in font.groups.items())
+    ), pickle.HIGHEST_PROTOCOL)
+
+    sections = [
+        struct.pack("<%dq" % len(glyphColumns), *glyphColumns),
+        struct.pack("<%dd" % len(glyphMetrics), *glyphMetrics),
+        struct.pack("<%dq" % len(glyphHash), *glyphHash),
+        struct.pack("<%dq" % len(pointColumns), *pointColumns),
+        struct.pack("<%dd" % len(pointValues), *pointValues),
+        struct.pack("<%dq" % len(unicodes), *unicodes),
+        bytes(strings),
+        fontData
+    ]
+    return len(glyphNames), hashSize, len(pointValues) // _pointValueCount, len(unicodes), sections
+
+
+class SharedGlyph(object):
+
+    """
+    A read only view on a glyph in a `SharedFont`, all values are read from the shared block.
+    """
+
+    __slots__ = ("_font", "_index", "name")
+
+    def __init__(self, font, index, name):
+        self._font = font
+        self._index = index
+        self.name = name
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+    def _column(self, column):
+        return self._font._glyphColumns[self._index * _glyphColumnCount + column]
+
+    def _metric(self, column):
+        return self._font._glyphMetrics[self._index * _glyphMetricCount + column]
+
+    def _getWidth(self):
+        return self._metric(0)
+
+    width = property(_getWidth)
+
+    def _getHeight(self):
+        return self._metric(1)
+
+    height = property(_getHeight)
+
+    def _getBounds(self):
+        bounds = tuple(self._metric(column) for column in range(2, 6))
+        if isnan(bounds[0]):
+            return None
+        return bounds
+
+    bounds = property(_getBounds)
+
+    def _getLeftMargin(self):
+        bounds = self.bounds
+        if bounds is None:
+            return None
+        return bounds[0]
+
+    leftMargin = property(_getLeftMargin)
+
+    def _getRightMargin(self):
+        bounds = self.bounds
+        if bounds is None:
+            return None
+        return self.width - bounds[2]
+
+    rightMargin = property(_getRightMargin)
+
+    def _getUnicodes(self):
+        start = self._column(8)
+        return tuple(self._font._unicodes[start:start + self._column(9)])
+
+    unicodes = property(_getUnicodes)
+
+    def _getUnicode(self):
+        unicodes = self.unicodes
+        if unicodes:
+            return unicodes[0]
+        return None
+
+    unicode = property(_getUnicode)
+
+    def _getAnchors(self):
+        return self._font._points(self._column(2), self._column(3), ("name", "x", "y"))
+
+    anchors = property(_getAnchors)
+
+    def _getGuidelines(self):
+        return self._font._points(self._column(4), self._column(5), ("name", "x", "y", "angle"))
+
+    guidelines = property(_getGuidelines)
+
+    def draw(self, pen):
+        packed = pickle.loads(self._font._string(self._column(6), self._column(7)))
+        for operator, operands in unpackOutline(packed):
+            getattr(pen, operator)(*operands)
+
+    def drawPoints(self, pointPen):
+        self.draw(SegmentToPointPen(pointPen))
+
+
+class SharedFont(object):
+
+    """
+    A read only view on the font geometry in a shared memory block.
+
+    Use `SharedFont.create(font)` in the owning process, the block is removed when the owner is closed.
+    Pickled shared fonts attach to the same block without copying it.
+
+    >>> from concurrent.futures import ProcessPoolExecutor
+    >>> from glyphConstruction import testDummyFont, GlyphConstructionBuilder
+    >>> font = testDummyFont()
+    >>> font["a"].appendAnchor(dict(name="top", x=150, y=200))
+    >>> font.kerning["a", "f"] = -10
+    >>> with SharedFont.create(font) as sharedFont:
+    ...     sharedGlyph = sharedFont["grave"]
+    ...     print(len(sharedFont), "agrave" in sharedFont, "b" in sharedFont)
+    ...     print(sharedGlyph.width, sharedGlyph.bounds, sharedGlyph.rightMargin)
+    ...     print([(anchor.name, anchor.x, anchor.y) for anchor in sharedFont["a"].anchors])
+    ...     print(sharedFont.info.descender == font.info.descender, dict(sharedFont.kerning))
+    ...     construction = "agrave = a + grave@center,top"
+    ...     print(GlyphConstructionBuilder(construction, sharedFont).components == GlyphConstructionBuilder(construction, font).components)
+    ...     with ProcessPoolExecutor(1) as executor:
+    ...         print(executor.submit(testBuildSharedFontGlyphs, sharedFont, [construction]).result() == testBuildSharedFontGlyphs(font, [construction]))
+    5 True False
+    70.0 (100.0, 100.0, 220.0, 220.0) -150.0
+    [('top', 150.0, 200.0)]
+    True {('a', 'f'): -10}
+    True
+    True
+    >>> sharedFont["a"]
+    Traceback (most recent call last):
+        ...
+    ValueError: The shared font is closed.
+    """
+
+    def __init__(self, name, _owner=False):
+        self._memory = openSharedMemory(name, track=_owner)
+        self._owner = _owner
+        self._glyphCache = {}
+        self._fontData = None
+        buffer = self._memory.buf
+        values = _header.unpack_from(buffer)
+        magic, self._glyphCount, self._hashSize, self._pointCount, self._unicodeCount = values[:5]
+        if magic != _magic:
+            self._memory.close()
+            raise ValueError("'%s' is not a shared font." % name)
+        self._offsets = dict(zip(_sectionNames, values[5:]))
+        self._glyphColumns = self._section("glyphColumns", "q")
+        self._glyphMetrics = self._section("glyphMetrics", "d")
+        self._glyphHash = self._section("glyphHash", "q")
+        self._pointColumns = self._section("pointColumns", "q")
+        self._pointValues = self._section("pointValues", "d")
+        self._unicodes = self._section("unicodes", "q")
+        self._strings = self._section("strings")
+
+    @classmethod
+    def create(cls, font):
+        """
+        Write the geometry of `font` into a new shared memory block and return the owning `SharedFont`.
+        """
+        glyphCount, hashSize, pointCount, unicodeCount, sections = _packFont(font)
+        offsets = []
+        offset = _header.size
+        for section in sections:
+            offset = _align(offset)
+            offsets.append(offset)
+            offset += len(section)
+        offsets.append(offset)
+        memory = openSharedMemory(size=offset)
+        _header.pack_into(memory.buf, 0, _magic, glyphCount, hashSize, pointCount, unicodeCount, *offsets)
+        for sectionOffset, section in zip(offsets, sections):
+            memory.buf[sectionOffset:sectionOffset + len(section)] = section
+        name = memory.name
+        memory.close()
+        return cls(name, _owner=True)
+
+    def __reduce__(self):
+        return (self.__class__, (self.name,))
+
+    def __repr__(self):
+        return "<%s %s glyphs: %s>" % (self.__class__.__name__, self.name, self._glyphCount)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _section(self, sectionName, format=None):
+        start = self._offsets[sectionName]
+        end = self._offsets[_sectionNames[_sectionNames.index(sectionName) + 1]]
+        view = self._memory.buf[start:end]
+        if format is not None:
+            view = view.cast(format)
+        return view
+
+    def _getName(self):
+        return self._memory.name
+
+    name = property(_getName)
+
+    def close(self):
+        """
+        Release the shared block, the owner also removes it.
+        """
+        if self._memory is None:
+            return
+        for view in (self._glyphColumns, self._glyphMetrics, self._glyphHash, self._pointColumns, self._pointValues, self._unicodes, self._strings):
+            view.release()
+        self._glyphCache.clear()
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+        self._memory = None
+
+    def _checkOpen(self):
+        if self._memory is None:
+            raise ValueError("The shared font is closed.")
+
+    def _string(self, offset, length):
+        return self._strings[offset:offset + length]
+
+    def _glyphName(self, index):
+        offset = self._glyphColumns[index * _glyphColumnCount]
+        length = self._glyphColumns[index * _glyphColumnCount + 1]
+        return bytes(self._string(offset, length)).decode("utf-8")
+
+    def _points(self, start, count, attributes):
+        points = []
+        for index in range(start, start + count):
+            nameOffset = self._pointColumns[index * _pointColumnCount]
+            nameLength = self._pointColumns[index * _pointColumnCount + 1]
+            name = None
+            if nameLength >= 0:
+                name = bytes(self._string(nameOffset, nameLength)).decode("utf-8")
+            x, y, angle = (self._pointValues[index * _pointValueCount + column] for column in range(_pointValueCount))
+            point = SimpleNamespace(name=name, x=None if isnan(x) else x, y=None if isnan(y) else y, angle=None if isnan(angle) else angle)
+            points.append(_SnapshotObject(point, attributes))
+        return tuple(points)
+
+    def _glyphIndex(self, glyphName):
+        self._checkOpen()
+        nameBytes = glyphName.encode("utf-8")
+        mask = self._hashSize - 1
+        slot = _nameHash(nameBytes) & mask
+        while True:
+            index = self._glyphHash[slot]
+            if index == -1:
+                return None
+            offset = self._glyphColumns[index * _glyphColumnCount]
+            length = self._glyphColumns[index * _glyphColumnCount + 1]
+            if length == len(nameBytes) and self._string(offset, length) == nameBytes:
+                return index
+            slot = (slot + 1) & mask
+
+    def __contains__(self, glyphName):
+        return self._glyphIndex(glyphName) is not None
+
+    def __getitem__(self, glyphName):
+        glyph = self._glyphCache.get(glyphName)
+        if glyph is None:
+            index = self._glyphIndex(glyphName)
+            if index is None:
+                raise KeyError(glyphName)
+            glyph = self._glyphCache[glyphName] = SharedGlyph(self, index, glyphName)
+        return glyph
+
+    def __len__(self):
+        return self._glyphCount
+
+    def keys(self):
+        self._checkOpen()
+        return [self._glyphName(index) for index in range(self._glyphCount)]
+
+    def __iter__(self):
+        for glyphName in self.keys():
+            yield self[glyphName]
+
+    def _getFontData(self):
+        if self._fontData is None:
+            self._checkOpen()
+            start = self._offsets["fontData"]
+            data = pickle.loads(self._memory.buf[start:self._offsets["end"]])
+            self._fontData = dict(
+                info=_SnapshotObject(SimpleNamespace(**data["info"]), snapshotFontInfoAttributes),
+                guidelines=tuple(_SnapshotObject(SimpleNamespace(**guideline), ("name", "x", "y", "angle")) for guideline in data["guidelines"]),
+                kerning=MappingProxyType(data["kerning"]),
+                groups=MappingProxyType(data["groups"])
+            )
+        return self._fontData
+
+    def _getInfo(self):
+        return self._getFontData()["info"]
+
+    info = property(_getInfo)
+
+    def _getGuidelines(self):
+        return self._getFontData()["guidelines"]
+
+    guidelines = property(_getGuidelines)
+
+    def _getKerning(self):
+        return self._getFontData()["kerning"]
+
+    kerning = property(_getKerning)
+
+    def _getGroups(self):
+        return self._getFontData()["groups"]
+
+    groups = property(_getGroups)
+
+
+def testBuildSharedFontGlyphs(font, constructions):
+    from glyphConstruction import BuildGlyphConstructions
+    return [(glyph.name, glyph.width, tuple(glyph.components)) for glyph in BuildGlyphConstructions(constructions, font)]
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    if shared_memory is None:
+        # shared memory needs py3.8
+        sys.exit(0)
+    sys.exit(doctest.testmod().failed)
@@ -0,0 +1,216 @@
+"""
+Watch glyph construction files and a UFO, and rebuild the constructions affected by a change.
+
+The watcher polls the modification time and size of the rule files and of all files in the UFO.
+The constructions are kept in a `GlyphConstructionPreviewModel`, which knows the glyphs every line reads:
+
+* a changed rule file evaluates the changed lines and the lines depending on them
+* a changed glyph file reloads the glyph and evaluates the lines reading it
+* any other change in the UFO, like font info, kerning or added glyphs, reloads the font and evaluates all lines
+
+Only the glyphs of evaluated lines are written, directly as glyph files in the UFO.
+The unicodes, anchors, guidelines and lib of a glyph file are kept, like a build.
+Files written by the watcher are not reported as changes.
+
+All rule files are evaluated as one text: variables are shared between the files.
+"""
+
+import os
+import plistlib
+import time
+
+from glyphConstructionCommandLine import writeConstructionGlyph
+from glyphConstructionDaemon import fileStamps
+from glyphConstructionPreview import GlyphConstructionPreviewModel
+
+
+_glyphsDirectory = "glyphs"
+
+
+class ConstructionWatcher(object):
+
+    """
+    Rebuild and write the constructions of a UFO affected by changes on disk.
+
+    Call `poll()` regularly, or `watch()` to poll until stopped.
+    The `callback` is called with the watcher and the written glyph names.
+
+    >>> import tempfile
+    >>> from glyphConstruction import testDummyFont
+    >>> cwd = os.getcwd()
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> os.chdir(directory.name)
+    >>> testDummyFont().save("test.ufo")
+    >>> with open("test.glyphConstruction", "w") as f:
+    ...     _ = f.write(chr(10).join(["agrave = a + grave@center,top", "f_i = f & i"]))
+    >>> watcher = ConstructionWatcher("test.ufo", ["test.glyphConstruction"])
+    >>> watcher.poll()
+    ['agrave', 'f_i']
+    >>> watcher.poll()
+    []
+
+    >>> with open("test.glyphConstruction", "w") as f:
+    ...     _ = f.write(chr(10).join(["agrave = a + grave@center,top", "f_i = f & i ^ 100"]))
+    >>> watcher.poll()
+    ['f_i']
+
+    >>> import defcon
+    >>> font = defcon.Font("test.ufo")
+    >>> font["grave"].move((0, 10))
+    >>> font["agrave"].unicodes = [0x00E0]
+    >>> font["agrave"].appendAnchor(dict(name="top", x=30, y=300))
+    >>> font.save()
+    >>> watcher.poll()
+    ['agrave']
+    >>> agrave = defcon.Font("test.ufo")["agrave"]
+    >>> agrave.components[1].transformation, agrave.unicodes, [anchor.name for anchor in agrave.anchors]
+    ((1, 0, 0, 1, -10.0, 90.0), [224], ['top'])
+
+    >>> font.info.capHeight = 700
+    >>> font.save()
+    >>> watcher.poll()
+    ['agrave', 'f_i']
+
+    A UFO keeps its format version.
+
+    >>> testDummyFont().save("test2.ufo", formatVersion=2)
+    >>> ConstructionWatcher("test2.ufo", ["test.glyphConstruction"]).poll()
+    ['agrave', 'f_i']
+    >>> from fontTools.ufoLib import UFOReader
+    >>> UFOReader("test2.ufo").formatVersionTuple[0], defcon.Font("test2.ufo")["agrave"].components[1].baseGlyph
+    (2, 'grave')
+
+    >>> os.chdir(cwd)
+    >>> directory.cleanup()
+    """
+
+    def __init__(self, fontPath, ruleFiles, characterMap=None, markColor=None, overwrite=True, callback=None):
+        import defcon
+        self.fontPath = fontPath
+        self.ruleFiles = list(ruleFiles)
+        self.markColor = markColor
+        self.overwrite = overwrite
+        self.callback = callback
+        self.font = defcon.Font(fontPath)
+        self._stamps = self._scan()
+        self._pending = set()
+        self.model = GlyphConstructionPreviewModel(self.font, characterMap=characterMap)
+        self.model.addObserver(self._modelChanged)
+        self.model.setText(self._readRules())
+
+    def _readRules(self):
+        texts = []
+        for ruleFile in self.ruleFiles:
+            with open(ruleFile) as f:
+                texts.append(f.read())
+        return "\n".join(texts)
+
+    def _scan(self):
+        stamps = fileStamps(self.fontPath)
+        for ruleFile in self.ruleFiles:
+            stamps.update(fileStamps(ruleFile))
+        return stamps
+
+    def _modelChanged(self, model, changed, removed):
+        for entry in changed:
+            if entry.glyphName is not None:
+                self._pending.add(entry.glyphName)
+
+    def _glyphNamesForFiles(self, paths):
+        """
+        Return the glyph names of glyph files in the default layer, or `None` if any other file changed.
+        """
+        glyphsPath = os.path.join(self.fontPath, _glyphsDirectory)
+        with open(os.path.join(glyphsPath, "contents.plist"), "rb") as f:
+            contents = plistlib.load(f)
+        fileNames = dict((fileName, glyphName) for glyphName, fileName in contents.items())
+        glyphNames = set()
+        for path in paths:
+            directory, fileName = os.path.split(path)
+            if directory != glyphsPath or fileName not in fileNames:
+                return None
+            glyphNames.add(fileNames[fileName])
+        return glyphNames
+
+    def poll(self):
+        """
+        Check the files once, rebuild and write the affected constructions and return the written glyph names.
+        """
+        stamps = self._scan()
+        changed = set(path for path in set(stamps) | set(self._stamps) if stamps.get(path) != self._stamps.get(path))
+        self._stamps = stamps
+        ruleFiles = set(self.ruleFiles)
+        if changed & ruleFiles:
+            self.model.setText(self._readRules())
+        fontFiles = changed - ruleFiles
+        if fontFiles:
+            glyphNames = self._glyphNamesForFiles(fontFiles)
+            if glyphNames is None:
+                import defcon
+                self.font = defcon.Font(self.fontPath)
+                self.model.setFont(self.font)
+            else:
+                self.font.reloadLayers(dict(layers={self.font.layers.defaultLayer.name: dict(glyphNames=sorted(glyphNames))}))
+                self.model.fontGlyphsChanged(glyphNames)
+        return self.writePending()
+
+    def writePending(self):
+        """
+        Write the glyphs of all evaluated constructions into the UFO and return the written glyph names.
+        """
+        import defcon
+        from fontTools.ufoLib import UFOReader, UFOWriter
+        pending = self._pending
+        self._pending = set()
+        glyphs = []
+        for glyphName in sorted(pending):
+            entry = self.model.definingEntry(glyphName)
+            if entry is None or entry.glyph is None:
+                continue
+            if not self.overwrite and glyphName in self.font:
+                continue
+            glyphs.append(entry.glyph)
+        if not glyphs:
+            return []
+        scratchFont = defcon.Font()
+        reader = UFOReader(self.fontPath, validate=False)
+        # keep the format of the UFO, the writer would upgrade the metainfo only
+        writer = UFOWriter(self.fontPath, formatVersion=getattr(reader, "formatVersionTuple", None) or reader.formatVersion)
+        glyphSet = writer.getGlyphSet()
+        for glyph in glyphs:
+            dest = scratchFont.newGlyph(glyph.name)
+            if glyph.name in glyphSet:
+                # start from the glyph on disk, only the drawing and the constructed attributes change
+                glyphSet.readGlyph(glyph.name, dest, dest.getPointPen())
+            writeConstructionGlyph(glyph, scratchFont, self.markColor)
+            glyphSet.writeGlyph(glyph.name, dest, dest.drawPoints)
+        glyphSet.writeContents()
+        writer.close()
+        # the watcher does not react on its own changes
+        glyphsPath = os.path.join(self.fontPath, _glyphsDirectory)
+        written = [os.path.join(glyphsPath, glyphSet.contents[glyph.name]) for glyph in glyphs]
+        written += [os.path.join(glyphsPath, "contents.plist"), os.path.join(self.fontPath, "metainfo.plist"), os.path.join(self.fontPath, "layercontents.plist")]
+        for path in written:
+            if os.path.exists(path):
+                self._stamps.update(fileStamps(path))
+        glyphNames = [glyph.name for glyph in glyphs]
+        if self.callback is not None:
+            self.callback(self, glyphNames)
+        return glyphNames
+
+    def watch(self, interval=.5, stop=None):
+        """
+        Poll every `interval` seconds until the `stop` event is set, or forever.
+        """
+        while stop is None or not stop.is_set():
+            self.poll()
+            if stop is None:
+                time.sleep(interval)
+            else:
+                stop.wait(interval)
+
+
+if __name__ == "__main__":
+    import sys
+    import doctest
+    sys.exit(doctest.testmod().failed)
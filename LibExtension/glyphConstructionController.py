@@ -1,6 +1,7 @@
 import AppKit
 import re
 import weakref
+from PyObjCTools.AppHelper import callAfter
 from vanilla import *
 from vanilla.dialogs import getFile
 from defconAppKit.windows.baseWindow import BaseWindowController
@@ -24,7 +25,10 @@ from lib.UI.statusBar import StatusBar
 # import importlib
 # importlib.reload(glyphConstruction)
 
-from glyphConstruction import GlyphConstructionBuilder, ParseGlyphConstructionListFromString, GlyphBuilderError, ParseVariables
+from glyphConstruction import ConstructionOverlayFont
+from glyphConstructionPreview import GlyphConstructionPreviewModel
+from glyphConstructionJobs import ConstructionJobRunner
+from glyphConstructionAnalyser import ConstructionAnalyser, formatConstructionAnalysis
 from glyphConstructionLexer import GlyphConstructionLexer
 from glyphConstructionWindow import GlyphConstructionWindow
 
@@ -220,39 +224,6 @@ dontMarkGlyphRE = re.compile(
 )
 
 
-class GlyphConstructorFont(object):
-
-    def __init__(self, font):
-        self.font = font
-        self.glyphsDone = {}
-
-    def __getattr__(self, attr):
-        return getattr(self.font, attr)
-
-    def __getitem__(self, glyphName):
-        if glyphName in self.glyphsDone:
-            return self.glyphsDone[glyphName]
-        return self.font[glyphName]
-
-    def __contains__(self, glyphName):
-        if glyphName in self.glyphsDone:
-            return True
-        return glyphName in self.font
-
-    def __len__(self):
-        return len(self.keys())
-
-    def keys(self):
-        return set(list(self.font.keys()) + list(self.glyphsDone.keys()))
-
-    def __iter__(self):
-        names = self.keys()
-        while names:
-            name = names[0]
-            yield self[name]
-            names = names[1:]
-
-
 class AnalyserTextEditor(EnterTextEditor):
 
     def __init__(self, *args, **kwargs):
@@ -271,106 +242,6 @@ class AnalyserTextEditor(EnterTextEditor):
         self.getNSTextView().setFont_(font)
 
 
-def _stringDict(d, verb):
-    out = []
-    for key in sorted(d.keys()):
-        value = d[key]
-        out.append("\tGlyph %s %s %s" % (key, verb, ", ".join(value)))
-    return "\n".join(out)
-
-
-def analyseConstructions(font, constructionGlyphs):
-    missingGlyphs = []
-    notMissingGlyphs = []
-    missingComponents = {}
-    unusedComponents = {}
-    doubleEntries = []
-
-    done = []
-
-    for construction in constructionGlyphs:
-        if construction.name in [None, "\n"]:
-            continue
-        if construction.name not in font:
-            missingGlyphs.append(construction.name)
-            continue
-
-        notMissingGlyphs.append(construction.name)
-
-        if construction.name in done:
-            doubleEntries.append(construction.name)
-
-        done.append(construction.name)
-
-        glyph = font[construction.name]
-
-        glyphComponentNames = [component.baseGlyph for component in glyph.components]
-        constructionComponentNames = [component.baseGlyph for component in construction.components]
-
-        if glyphComponentNames == constructionComponentNames:
-            # same values in the same order
-            continue
-
-        other = list(constructionComponentNames)
-        for name in glyphComponentNames:
-            if name in other:
-                other.remove(name)
-            else:
-                if glyph.name not in unusedComponents:
-                    unusedComponents[glyph.name] = []
-                unusedComponents[glyph.name].append(name)
-
-        other = list(glyphComponentNames)
-        for name in constructionComponentNames:
-            if name in other:
-                other.remove(name)
-            else:
-                if glyph.name not in missingComponents:
-                    missingComponents[glyph.name] = []
-                missingComponents[glyph.name].append(name)
-
-    text = []
-
-    if doubleEntries:
-        text += [
-            "Double entries:",
-            "---------------",
-            "\t" + "\n\t".join(doubleEntries),
-            "\n"
-        ]
-
-    if missingGlyphs:
-        text += [
-            "Missing Glyphs:",
-            "---------------",
-            "\t" + "\n\t".join(missingGlyphs),
-            "\n"
-        ]
-    if notMissingGlyphs:
-        text += [
-            "Existing Glyphs:",
-            "---------------",
-            "\t" + "\n\t".join(notMissingGlyphs),
-            "\n"
-        ]
-    if missingComponents:
-        text += [
-            "Existing Glyphs with Missing Components:",
-            "----------------------------------------",
-            _stringDict(missingComponents, "is missing"),
-            "\n"
-        ]
-    if unusedComponents:
-        text += [
-            "Existing Glyphs with different components:",
-            "------------------------------------------",
-            _stringDict(unusedComponents, "has no"),
-            "\n"
-        ]
-
-    return "\n".join(text)
-
-
 class BuildGlyphsSheet(BaseWindowController):
 
     overWriteKey = "%s.overWrite" % defaultKey
@@ -496,7 +367,14 @@ class GlyphBuilderController(BaseWindowController):
 
     def __init__(self, font):
         self.font = None
+        self.previewModel = None
+        # evaluate constructions on a worker thread, changes are handed over to the main thread
+        self.jobRunner = ConstructionJobRunner(deliver=callAfter)
         self._glyphs = []
+        self._previewGlyphs = {}
+        self._previewGlyphEntries = {}
+        self.constructionAnalyser = None
+        self._analyserGlyphs = []
         self._filePath = None
 
         statusBarHeight = 20
@@ -610,72 +488,94 @@ class GlyphBuilderController(BaseWindowController):
         self.font = font
         if font is not None:
             self.preview.setFont(font)
-            self.font.naked().addObserver(self, "fontChanged", "Font.Changed")
+            self.glyphConstructorFont = ConstructionOverlayFont(font.naked())
+            self._previewGlyphs = {}
+            self._previewGlyphEntries = {}
+            self.previewModel = GlyphConstructionPreviewModel(font.naked(), runner=self.jobRunner)
+            self.previewModel.addObserver(self.previewModelChanged)
+            self.previewModel.addFontObserver(self.previewModelFontChanged)
+            self.constructionAnalyser = ConstructionAnalyser(font.naked())
+            # only rules depending on changed glyphs are evaluated
+            self.previewModel.observeFont()
         self.constructionsCallback(self.constructions)
 
     def unsubscribeFont(self):
         if self.font is not None:
             self.preview.setFont(None)
             self.preview.set([])
-            self.font.removeObserver(self, notification="Font.Changed")
+            self.jobRunner.cancel()
+            self.previewModel.stopObservingFont()
+            self.previewModel.removeObserver(self.previewModelChanged)
+            self.previewModel.removeFontObserver(self.previewModelFontChanged)
+            self.previewModel = None
+            self.constructionAnalyser = None
+            self._analyserGlyphs = []
+            self._previewGlyphs = {}
+            self._previewGlyphEntries = {}
             self.font = None
 
     def constructionsCallback(self, sender, update=True):
         if self.font is None:
             return
+        # only the edited lines and their dependents are evaluated
+        self.previewModel.setText(sender.get())
 
+    def previewModelChanged(self, model, changedEntries, removedEntries):
+        if model is not self.previewModel:
+            # a late change of an unsubscribed font
+            return
+        for entry in removedEntries + changedEntries:
+            glyph = self._previewGlyphs.pop(entry, None)
+            self._previewGlyphEntries.pop(glyph, None)
+        for entry in changedEntries:
+            if entry.glyph is not None:
+                glyph = self._previewGlyphs[entry] = self._makePreviewGlyph(entry)
+                self._previewGlyphEntries[glyph] = entry
+        self.updatePreview(not self._isReloading or self._updateWhileReloading)
+
+    def _makePreviewGlyph(self, entry):
         font = self.font.naked()
+        constructionGlyph = entry.glyph
+        if RoboFontVersion < "2.0":
+            glyph = font._instantiateGlyphObject()
+        else:
+            glyph = font.layers.defaultLayer.instantiateGlyphObject()
+        glyph.lib[self.glyphLibConstructionKey] = entry.construction
+        glyph.name = constructionGlyph.name
+        glyph.unicodes = constructionGlyph.unicodes
+        glyph.note = constructionGlyph.note
+        glyph.markColor = constructionGlyph.markColor
+        if RoboFontVersion < "2.0":
+            glyph.setParent(self.glyphConstructorFont)
+            glyph.dispatcher = font.dispatcher
+        else:
+            glyph._font = weakref.ref(self.glyphConstructorFont)
+            # glyph._dispatcher = font._dispatcher
 
-        self.glyphConstructorFont = GlyphConstructorFont(font)
+        glyph.width = constructionGlyph.width
+        constructionGlyph.draw(glyph.getPen())
+        return glyph
 
+    def updatePreview(self, update=True):
         self._glyphs = []
-        errors = []
-
-        try:
-            constructions = ParseGlyphConstructionListFromString(sender.get(), font)
-        except GlyphBuilderError as err:
-            constructions = []
-            errors.append(str(err))
-
-        for construction in constructions:
-            if not construction:
-                glyph = self.preview.createNewLineGlyph()
-            elif construction in self.glyphConstructorFont.glyphsDone:
-                glyph = self.glyphConstructorFont.glyphsDone[construction]
+        self._analyserGlyphs = []
+        glyphsDone = {}
+        for entry in self.previewModel.previewEntries():
+            glyph = self._previewGlyphs.get(entry)
+            if not entry.construction:
+                if glyph is None:
+                    glyph = self._previewGlyphs[entry] = self.preview.createNewLineGlyph()
+            elif glyph is None:
+                continue
             else:
-                try:
-                    constructionGlyph = GlyphConstructionBuilder(construction, self.glyphConstructorFont, characterMap=None)
-                except GlyphBuilderError as err:
-                    errors.append(str(err))
-                    continue
-
-                if constructionGlyph.name is None:
-                    errors.append(construction)
-                    continue
-
-                if RoboFontVersion < "2.0":
-                    glyph = font._instantiateGlyphObject()
-                else:
-                    glyph = font.layers.defaultLayer.instantiateGlyphObject()
-                glyph.lib[self.glyphLibConstructionKey] = construction
-                glyph.name = constructionGlyph.name
-                glyph.unicodes = constructionGlyph.unicodes
-                glyph.note = constructionGlyph.note
-                glyph.markColor = constructionGlyph.markColor
-                if RoboFontVersion < "2.0":
-                    glyph.setParent(self.glyphConstructorFont)
-                    glyph.dispatcher = font.dispatcher
-                else:
-                    glyph._font = weakref.ref(self.glyphConstructorFont)
-                    # glyph._dispatcher = font._dispatcher
-
-                glyph.width = constructionGlyph.width
-                constructionGlyph.draw(glyph.getPen())
-
-                self.glyphConstructorFont.glyphsDone[glyph.name] = glyph
-
+                glyphsDone[glyph.name] = glyph
+                self._analyserGlyphs.append((entry, glyph))
             self._glyphs.append(glyph)
+        # the base font could be changed since the last update
+        self.glyphConstructorFont.invalidate()
+        self.glyphConstructorFont.glyphsDone = glyphsDone
 
+        errors = [error for _, error in self.previewModel.errors()]
         if errors:
             print("Errors:")
             print("\n".join(errors))
@@ -683,7 +583,21 @@ class GlyphBuilderController(BaseWindowController):
         if update:
             self.preview.set(self._glyphs)
 
-        self.analyser.set(analyseConstructions(font, self._glyphs))
+        self.updateAnalyser()
+
+    def previewModelFontChanged(self, model, glyphNames):
+        if model is not self.previewModel:
+            return
+        if glyphNames is None:
+            self.constructionAnalyser.fontChanged()
+        else:
+            self.constructionAnalyser.fontGlyphsChanged(glyphNames)
+        self.updateAnalyser()
+
+    def updateAnalyser(self):
+        # only changed constructions and changed font glyphs are analysed again
+        report = self.constructionAnalyser.analyse(self._analyserGlyphs)
+        self.analyser.set(formatConstructionAnalysis(report))
 
     # preview
 
@@ -720,18 +634,13 @@ class GlyphBuilderController(BaseWindowController):
             if glyph.markColor:
                 status.append("mark: %s" % ", ".join([str(c) for c in glyph.markColor]))
 
-            rawConstructions = self.constructions.get()
-
-            searchConstruction = glyph.lib.get(self.glyphLibConstructionKey)
-            if searchConstruction is not None:
-                if searchConstruction not in rawConstructions:
-                    _, variables = ParseVariables(rawConstructions)
-                    for variableName, variableValue in variables.items():
-                        searchConstruction = searchConstruction.replace(variableValue, "{%s}" % variableName)
-
-                if searchConstruction in rawConstructions:
-                    selectedRange = AppKit.NSMakeRange(rawConstructions.index(searchConstruction), len(searchConstruction))
-                    self.constructions.getNSTextView().setSelectedRange_(selectedRange)
+            # select the construction with its source location
+            entry = self._previewGlyphEntries.get(glyph.naked() if hasattr(glyph, "naked") else glyph)
+            if entry is not None and self.previewModel.entries[entry.index:entry.index + 1] == [entry]:
+                textRange = self.previewModel.textRange(entry)
+                if textRange is not None:
+                    start, end = textRange
+                    self.constructions.getNSTextView().setSelectedRange_(AppKit.NSMakeRange(start, end - start))
 
         self.w.statusBar.set(status)
 
@@ -802,12 +711,18 @@ class GlyphBuilderController(BaseWindowController):
         BuildGlyphsSheet(self._glyphs, self.font, self.w, shouldOverWrite=overWriteResult, shouldAutoUnicodes=autoUnicodesResult, shouldUseMarkColor=markGlyphResult)
 
     _isReloading = False
+    _updateWhileReloading = True
 
     def reload(self, sender=None, update=True):
         if self._isReloading:
             return
         self._isReloading = True
-        self.constructionsCallback(self.constructions, update)
+        self._updateWhileReloading = update
+        # font changes are already observed by the preview model
+        self.constructionsCallback(self.constructions)
+        if self.previewModel is not None:
+            # apply pending evaluations now, the generated glyphs are read right after reloading
+            self.previewModel.flush()
         self._isReloading = False
 
     def _saveFile(self, path):
@@ -865,9 +780,6 @@ class GlyphBuilderController(BaseWindowController):
 
     # notifications
 
-    def fontChanged(self, notification):
-        self.reload()
-
     def fontBecameCurrent(self, notification):
         font = notification["font"]
         self.subscribeFont(font)
@@ -877,6 +789,7 @@ class GlyphBuilderController(BaseWindowController):
 
     def windowCloseCallback(self, sender):
         self.unsubscribeFont()
+        self.jobRunner.shutdown(wait=False)
         removeObserver(self, "fontBecameCurrent")
         removeObserver(self, "fontResignCurrent")
         super(GlyphBuilderController, self).windowCloseCallback(sender)
@@ -1,4 +1,4 @@
-from pygments.lexer import RegexLexer, include, bygroups
+from pygments.lexer import Lexer
 from pygments import token
 
 from lib.scripting.codeEditor import CodeEditor, languagesIDEBehavior
@@ -44,42 +44,46 @@ languagesIDEBehavior["GlyphConstruction"] = {
 }
 
 
-class GlyphConstructionLexer(RegexLexer):
+glyphConstructionTokenMap = {
+    gc.tokenWhitespace: token.Text,
+    gc.tokenComment: token.Comment,
+    gc.tokenNote: token.Comment,
+    gc.tokenFlag: token.Name.Builtin,
+    gc.tokenOperator: token.Operator,
+    gc.tokenConstructionName: token.Keyword,
+    gc.tokenGlyphName: token.Name,
+    gc.tokenSuffix: token.String.Other,
+    gc.tokenPosition: token.Name.Tag,
+    gc.tokenAnchorName: token.Name.Attribute,
+    gc.tokenNumber: token.Number,
+    gc.tokenUnicode: token.Number.Hex,
+    gc.tokenVariable: token.Name.Function,
+    gc.tokenVariableDeclaration: token.Name.Builtin,
+    gc.tokenVariableName: token.Name.Variable,
+    gc.tokenVariableValue: token.String,
+    gc.tokenError: token.Error,
+}
+
+
+class GlyphConstructionLexer(Lexer):
+
+    """
+    A Pygments lexer over the glyph construction tokenizer,
+    only changed lines are tokenized again.
+    """
 
     name = "GlyphConstruction"
     aliases = ['GlyphConstruction', 'gc']
     filenames = ['*.glyphConstruction', "*.gc"]
 
-    tokens = {
-            'root': [
-                    (r'\n', token.Text),
-                    (r'#.*$', token.Comment),
-                    (r'\.([a-zA-Z_][a-zA-Z0-9_]*)?', token.String.Other),
-
-                    (r'(\|)[\s|\\\s]*([a-fA-F0-9]{4,})', bygroups(token.Operator, token.Number.Hex)),
-                    (r'%s' % ("\\"+"|\\".join(glyphConstructionOperations)), token.Operator),
-                    (r'(\?)?([a-zA-Z_\{][a-zA-Z0-9_.\{\}]*)((\s|\\\s)*=)',  bygroups(token.Name.Builtin, token.Keyword, token.Operator)),
-                    (r'(%s)' % ("|".join(glyphConstructionAlignmentWords)), token.Name.Tag),
-
-                    (r'(\%s)(\s*[a-zA-Z_][a-zA-Z0-9_]*)\s*(\=)\s*(.*)(%s)' % (gc.variableDeclarationStart, gc.variableDeclarationEnd), bygroups(token.Name.Builtin, token.Name.Variable, token.Operator, token.String, token.Name.Builtin)),
-                    (r'\{[a-zA-Z_][a-zA-Z0-9_]*\}', token.Name.Function),
-                    include('numbers'),
-                    include('whitespace'),
-                    (r'[a-zA-Z][a-zA-Z0-9]*', token.Name),
-                ],
-            'numbers': [
-                    (r'(\d+\.\d*|\d*\.\d+)([eE][+-]?[0-9]+)?j?\%?', token.Number.Float),
-                    (r'\d+[eE][+-]?[0-9]+j?\%?', token.Number.Float),
-                    (r'\d+j?\%?', token.Number.Integer),
-                ],
-            'string': [
-                    (r'(?s)(\\\\|\\[0-7]+|\\.|[^"\'\\])', token.String),
-                    (r'"|\'', token.String, '#pop')
-                ],
-            'whitespace': [
-                    (r'\s+', token.Text),
-                ],
-        }
+    def __init__(self, **options):
+        super(GlyphConstructionLexer, self).__init__(**options)
+        self.tokenizer = gc.GlyphConstructionTokenizer()
+
+    def get_tokens_unprocessed(self, text):
+        self.tokenizer.setText(text)
+        for offset, tokenType, value in self.tokenizer.tokens():
+            yield offset, glyphConstructionTokenMap[tokenType], value
 
 
 if __name__ == "__main__":
@@ -17,7 +17,12 @@ htmlPath = os.path.join(basePath, 'html')
 licensePath = os.path.join(basePath, 'LICENSE')
 readmePath = os.path.join(basePath, 'README.md')
 extensionPath = os.path.join(basePath, 'GlyphConstruction.roboFontExt')
-modulePath = os.path.join(basePath, "Lib", "glyphConstruction.py")
+modulePaths = [
+    os.path.join(basePath, "Lib", "glyphConstruction.py"),
+    os.path.join(basePath, "Lib", "glyphConstructionPreview.py"),
+    os.path.join(basePath, "Lib", "glyphConstructionJobs.py"),
+    os.path.join(basePath, "Lib", "glyphConstructionAnalyser.py"),
+]
 
 # ----------------
 # create extension
@@ -56,11 +61,12 @@ shutil.copyfile(readmePath, os.path.join(htmlPath, 'index.md'))
 print('building extension...')
 B.save(extensionPath, libPath=libPath, htmlPath=htmlPath)
 
-print('copying module...')
-destModulePath = os.path.join(B.libPath(), "glyphConstruction.py")
-if os.path.exists(destModulePath):
-    os.path.remove(destModulePath)
-shutil.copy(modulePath, destModulePath)
+print('copying modules...')
+for modulePath in modulePaths:
+    destModulePath = os.path.join(B.libPath(), os.path.basename(modulePath))
+    if os.path.exists(destModulePath):
+        os.remove(destModulePath)
+    shutil.copy(modulePath, destModulePath)
 
 print('...done!')
 print()
@@ -19,6 +19,32 @@ setup(
     description='Letter shape description language',
     long_description='Letter shape description language',
     install_requires=[],
-    py_modules=["glyphConstruction"],
-    package_dir={'': 'Lib'}
+    py_modules=[
+        "glyphConstruction",
+        "glyphConstructionInterpolation",
+        "glyphConstructionDiff",
+        "glyphConstructionPreview",
+        "glyphConstructionJobs",
+        "glyphConstructionAnalyser",
+        "glyphConstructionLanguageServer",
+        "glyphConstructionCommandLine",
+        "glyphConstructionBenchmark",
+        "glyphConstructionSharedFont",
+        "glyphConstructionAsync",
+        "glyphConstructionDaemon",
+        "glyphConstructionWatch",
+        "glyphConstructionBuildCache",
+        "glyphConstructionShard",
+        "glyphConstructionIndex",
+    ],
+    package_dir={'': 'Lib'},
+    entry_points={
+        "console_scripts": [
+            "glyphconstruction = glyphConstructionCommandLine:main",
+            "glyphconstruction-lsp = glyphConstructionLanguageServer:main",
+            "glyphconstruction-benchmark = glyphConstructionBenchmark:main",
+            "glyphconstruction-daemon = glyphConstructionDaemon:main",
+            "glyphconstruction-shard = glyphConstructionShard:main",
+        ]
+    }
 )